@@ -0,0 +1,320 @@
+from random import randrange
+from oram_tree import BlockCipher, BlockPlaintext, PositionMap, Stash, StashStatistics, common_level
+from oram_engine import create_oram
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from recursive_path_oram import RecursivePathOramClient, RecursivePathOramServer
+from oram_cipher import create_cipher
+from mmap_oram_tree import MmapOramTree
+from oram_state import ClientStateLog, load_client_state, save_client_state
+import os
+import time
+import tracemalloc
+
+
+# eviction by scanning the whole stash once per level, as done before the stash is indexed by position
+def scan_evict(blocks, positions, position, tree_level, Z):
+    buckets = [None] * (tree_level + 1)
+    for level in reversed(range(tree_level + 1)):
+        select_blocks = []
+        for block_id in blocks:
+            if len(select_blocks) == Z:
+                break
+            if common_level(positions[block_id], position, tree_level) >= level:
+                select_blocks.append(blocks[block_id])
+        for block in select_blocks:
+            del blocks[block.block_id]
+        buckets[level] = select_blocks
+    return buckets
+
+
+# per access eviction time against stash size
+def benchmark_eviction(stash_sizes=(10, 100, 1000, 10000), level=20, Z=5, rounds=200):
+    leaf_nodes = pow(2, level)
+    for stash_size in stash_sizes:
+        stash = Stash(level)
+        blocks = dict()
+        positions = dict()
+        for block_id in range(stash_size):
+            block = BlockPlaintext(block_id, b'')
+            position = randrange(leaf_nodes)
+            stash.put(block, position)
+            blocks[block_id] = block
+            positions[block_id] = position
+
+        indexed_time = 0
+        scan_time = 0
+        for i in range(rounds):
+            position = randrange(leaf_nodes)
+
+            start = time.perf_counter()
+            evict_blocks = stash.evict(position, Z)
+            indexed_time += time.perf_counter() - start
+
+            scan_blocks = dict(blocks)
+            start = time.perf_counter()
+            scan_evict(scan_blocks, positions, position, level, Z)
+            scan_time += time.perf_counter() - start
+
+            # put evicted blocks back with new position to keep stash size
+            for bucket_blocks in evict_blocks:
+                for block, _ in bucket_blocks:
+                    position = randrange(leaf_nodes)
+                    stash.put(block, position)
+                    blocks[block.block_id] = block
+                    positions[block.block_id] = position
+
+        print("stash size", stash_size,
+              "indexed eviction", indexed_time / rounds * 1000, "ms",
+              "scan eviction", scan_time / rounds * 1000, "ms")
+
+
+# size of ciphers in arguments or results of server call
+def cipher_bytes(value):
+    if isinstance(value, BlockCipher):
+        return len(value.cipher) + len(value.nonce)
+    if isinstance(value, dict):
+        return sum(cipher_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(cipher_bytes(v) for v in value)
+    return 0
+
+
+# count bytes read from and written to server
+class CountingServer:
+    def __init__(self, oram_server):
+        self.oram_server = oram_server
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.calls = []  # (method name, bytes read) of each call
+
+    def __getattr__(self, name):
+        method = getattr(self.oram_server, name)
+
+        def count(*args):
+            result = method(*args)
+            self.write_bytes += cipher_bytes(args)
+            read_bytes = cipher_bytes(result)
+            self.read_bytes += read_bytes
+            self.calls.append((name, read_bytes))
+            return result
+
+        return count
+
+
+# bytes moved per access of each engine
+# online bytes are read until the block is returned, the first read of blocks of an access,
+# the rest (eviction, reshuffle) could be done after the access returns
+def benchmark_bandwidth(engines=('path', 'ring'), level=10, block_size=4096, accesses=200):
+    block_number = pow(2, level)
+    online_methods = ('read', 'read_path', 'read_paths', 'read_blocks')
+    for engine in engines:
+        client, oram_server = create_oram(engine, level, block_size=block_size)
+        for block_id in range(block_number // 4):
+            client.write(block_id, b'a' * block_size, oram_server)
+
+        counting_server = CountingServer(oram_server)
+        online_bytes = 0
+        for i in range(accesses):
+            counting_server.calls = []
+            client.read(randrange(block_number // 4), counting_server)
+            for name, read_bytes in counting_server.calls:
+                online_bytes += read_bytes
+                if name in online_methods:
+                    break
+        total_bytes = counting_server.read_bytes + counting_server.write_bytes
+        print("engine", engine, "online bytes per access", online_bytes / accesses,
+              "total bytes per access", total_bytes / accesses)
+
+
+# time to encrypt and decrypt all blocks of a path with each cipher
+# workers: run ciphers by a pool of workers threads or processes (executor)
+def benchmark_cipher(ciphers=('eax', 'ctr', 'gcm'), level=20, Z=5, block_size=8192, rounds=20, workers=None,
+                     executor='thread'):
+    block_number = (level + 1) * Z
+    for cipher_name in ciphers:
+        cipher = create_cipher(cipher_name, b'1' * 32, workers, executor)
+        plaintexts = [os.urandom(block_size) for i in range(block_number)]
+        encrypt_time = 0
+        decrypt_time = 0
+        for i in range(rounds):
+            start = time.perf_counter()
+            blocks_cipher = cipher.encrypt_many(plaintexts)
+            encrypt_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            cipher.decrypt_many(blocks_cipher)
+            decrypt_time += time.perf_counter() - start
+        print("cipher", cipher_name, "workers", workers, "blocks per path", block_number,
+              "encrypt path", encrypt_time / rounds * 1000, "ms",
+              "decrypt path", decrypt_time / rounds * 1000, "ms")
+        if hasattr(cipher, 'close'):
+            cipher.close()
+
+
+# time to fill a tree with block_number blocks, one write per block against one bulk load
+def benchmark_bulk_load(level=10, block_size=4096, cipher='ctr', crypto_workers=None):
+    block_number = pow(2, level)
+    items = [(block_id, b'a' * block_size) for block_id in range(block_number)]
+
+    start = time.perf_counter()
+    client = PathOramClient(level, block_size=block_size, cipher=cipher, crypto_workers=crypto_workers)
+    oram_server = PathOramServer(client.generate_initialize_block(), level)
+    for block_id, block_data in items:
+        client.write(block_id, block_data, oram_server)
+    write_time = time.perf_counter() - start
+    client.close()
+
+    start = time.perf_counter()
+    client = PathOramClient(level, block_size=block_size, cipher=cipher, crypto_workers=crypto_workers)
+    oram_server = PathOramServer(None, level, shape=client.bucket_shape())
+    client.bulk_load(iter(items), oram_server)
+    bulk_load_time = time.perf_counter() - start
+    print("blocks", block_number, "write each block", write_time, "s", "bulk load", bulk_load_time, "s",
+          "stash after bulk load", len(client.stash))
+    client.close()
+
+
+# bytes moved per access and client memory with the top treetop_levels levels of the tree cached on client
+def benchmark_treetop(level=10, block_size=4096, cipher='ctr', treetop_levels=(0, 2, 4, 6), accesses=200):
+    block_number = pow(2, level)
+    for levels in treetop_levels:
+        client = PathOramClient(level, block_size=block_size, cipher=cipher, treetop_levels=levels)
+        oram_server = PathOramServer(None, level, shape=client.bucket_shape())
+        client.bulk_load(((block_id, b'a' * block_size) for block_id in range(block_number)), oram_server)
+
+        counting_server = CountingServer(oram_server)
+        start = time.perf_counter()
+        for i in range(accesses):
+            client.read(randrange(block_number), counting_server)
+        access_time = time.perf_counter() - start
+        report = client.treetop_report()
+        print("treetop levels", report['levels'],
+              "bytes per access", (counting_server.read_bytes + counting_server.write_bytes) / accesses,
+              "access time", access_time / accesses * 1000, "ms",
+              "client memory", report['memory_bytes'], "max", report['max_memory_bytes'])
+
+
+# recursive levels, server calls and time per access of recursive path oram for position blocks of
+# position_compress positions, with position_cache_size recently used position blocks cached on client
+def benchmark_position_map(first_level=12, block_size=1024, cipher='ctr', position_compress=(8, 64, 1024),
+                           position_cache_size=(0, 16), accesses=50):
+    block_number = pow(2, first_level)
+    for compress in position_compress:
+        for cache_size in position_cache_size:
+            client = RecursivePathOramClient(first_level, block_size=block_size, position_compress=compress,
+                                             cipher=cipher, position_cache_size=cache_size)
+            oram_server = RecursivePathOramServer(None, shapes=client.bucket_shapes())
+            client.bulk_load(((block_id, b'a' * block_size) for block_id in range(block_number)), oram_server)
+
+            counting_server = CountingServer(oram_server)
+            start = time.perf_counter()
+            for i in range(accesses):
+                client.read(randrange(block_number), counting_server)
+            access_time = time.perf_counter() - start
+            print("position compress", compress, "position cache", cache_size,
+                  "recursive levels", client.recursive_level,
+                  "server calls per access", len(counting_server.calls) / accesses,
+                  "access time", access_time / accesses * 1000, "ms",
+                  "cache hit rate", [position_cache.hit_rate() for position_cache in client.position_caches[1:]])
+
+
+# empirical probability that stash is larger than each of stash_sizes after an access, for each Z and tree level
+# a tree of level L is filled with 2^L blocks (bulk load), stash is recorded over accesses to random blocks
+def benchmark_stash_overflow(levels=(6, 8, 10), Zs=(2, 3, 4, 5), accesses=2000, stash_sizes=(0, 5, 10, 20, 50)):
+    for level in levels:
+        block_number = pow(2, level)
+        for Z in Zs:
+            client = PathOramClient(level, Z=Z, block_size=16, cipher='ctr')
+            oram_server = PathOramServer(None, level, shape=client.bucket_shape())
+            client.bulk_load(((block_id, b'a') for block_id in range(block_number)), oram_server)
+            # warm up from the state left by bulk load
+            for i in range(block_number):
+                client.read(randrange(block_number), oram_server)
+            client.stash_statistics = StashStatistics()
+            for i in range(accesses):
+                client.read(randrange(block_number), oram_server)
+            statistics = client.stash_statistics
+            print("level", level, "Z", Z, "max stash", statistics.max_size, "mean stash", statistics.mean(),
+                  "exceed probability", [(size, statistics.exceed_probability(size)) for size in stash_sizes])
+
+
+# time to read a path from a tree in a file through mmap, as blocks (a copy of each bucket and an object per block)
+# against one view of the mapped file per bucket (read_path_buffers)
+def benchmark_mmap_path_read(level=14, Z=5, block_size=4096, reads=5000, storage_path='oram_tree_benchmark'):
+    oram_tree = MmapOramTree(storage_path, bucket_number=pow(2, level + 1) - 1, Z=Z, cipher_size=block_size)
+    positions = [randrange(pow(2, level)) for i in range(reads)]
+    start = time.perf_counter()
+    for position in positions:
+        oram_tree.read_path(position)
+    blocks_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for position in positions:
+        oram_tree.read_path_buffers(position)
+    buffers_time = time.perf_counter() - start
+    print("level", level, "Z", Z, "block size", block_size, "read path as blocks", blocks_time / reads * 1e6, "us",
+          "as views", buffers_time / reads * 1e6, "us")
+    oram_tree.close()
+    os.remove(storage_path)
+
+
+# memory and time to build the position map of 2^level blocks, dict of int leaves against PositionMap
+def benchmark_position_map_memory(level=20):
+    tracemalloc.start()
+    start = time.perf_counter()
+    leaf_nodes = pow(2, level)
+    position_map = dict()
+    for block_id in range(leaf_nodes):
+        position_map[block_id] = randrange(leaf_nodes)
+    dict_time = time.perf_counter() - start
+    dict_memory = tracemalloc.get_traced_memory()[0]
+    del position_map
+    tracemalloc.reset_peak()
+    base_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    position_map = PositionMap(leaf_nodes, level)
+    array_time = time.perf_counter() - start
+    array_memory = tracemalloc.get_traced_memory()[0] - base_memory
+    tracemalloc.stop()
+    print("blocks", leaf_nodes, "dict", dict_memory, "bytes", dict_time, "s",
+          "position map", array_memory, "bytes", array_time, "s", "ratio", dict_memory / array_memory)
+
+
+# time to save and restore client state of a tree of 2^level blocks (position map of 2^level entries),
+# against the time to create a new client, and bytes and time of a log record of one access
+def benchmark_client_state(level=20, block_size=4096, cipher='ctr', state_path='client_state'):
+    start = time.perf_counter()
+    client = PathOramClient(level, block_size=block_size, cipher=cipher)
+    create_time = time.perf_counter() - start
+    key = os.urandom(32)
+    start = time.perf_counter()
+    save_client_state(client, state_path, key)
+    save_time = time.perf_counter() - start
+    start = time.perf_counter()
+    load_client_state(client, state_path, key)
+    load_time = time.perf_counter() - start
+
+    log = ClientStateLog(client, state_path, key)
+    log.snapshot()
+    client.position_map[randrange(pow(2, level))] = randrange(pow(2, level))
+    start = time.perf_counter()
+    log.append()
+    append_time = time.perf_counter() - start
+    print("blocks", pow(2, level), "create client", create_time, "s", "save state", save_time, "s",
+          "load state", load_time, "s", "state bytes", os.path.getsize(state_path),
+          "log record", os.path.getsize(state_path + '.log'), "bytes", append_time * 1000, "ms")
+    log.close()
+    os.remove(state_path)
+    os.remove(state_path + '.log')
+
+
+if __name__ == '__main__':
+    benchmark_eviction()
+    benchmark_bandwidth()
+    benchmark_cipher()
+    benchmark_bulk_load()
+    benchmark_treetop()
+    benchmark_position_map()
+    benchmark_stash_overflow()
+    benchmark_mmap_path_read()
+    benchmark_position_map_memory()
+    benchmark_client_state()
@@ -0,0 +1,213 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from benchmark import CountingServer
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from recursive_path_oram import RecursivePathOramClient, RecursivePathOramServer
+
+# reproducible benchmark of path oram and recursive path oram on synthetic data
+#
+#   python benchmark_suite.py --variants path recursive --levels 8 10 --Z 4 5 --block-sizes 1024 4096 \
+#       --position-compress 8 256 --accesses 500 --output results.json
+#   python benchmark_suite.py ... --compare results.json
+#
+# every configuration of the sweep (position_compress only applies to recursive) loads 2^level blocks of random data
+# (seeded, without b'\xff' padding symbol) with bulk_load, then runs accesses to random blocks, write_ratio of them
+# writes, and checks every block read. It reports throughput, latency percentiles, bytes moved per access, peak rss
+# and mismatches. A configuration runs in its own process, so peak rss is its own.
+
+
+def synthetic_data(rnd, size):
+    return rnd.randbytes(size).replace(b'\xff', b'\xfe')
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+def create_variant(variant, level, Z, block_size, position_compress, cipher):
+    if variant == 'path':
+        client = PathOramClient(level, Z=Z, block_size=block_size, cipher=cipher)
+        oram_server = PathOramServer(None, level, shape=client.bucket_shape())
+    elif variant == 'recursive':
+        client = RecursivePathOramClient(level, Z=Z, block_size=block_size, position_compress=position_compress,
+                                         cipher=cipher)
+        oram_server = RecursivePathOramServer(None, shapes=client.bucket_shapes())
+    else:
+        raise Exception("unknown variant", variant, "variants:", ['path', 'recursive'])
+    return client, oram_server
+
+
+# run one configuration, return its results
+def run_config(config):
+    rnd = random.Random(config['seed'])
+    level = config['level']
+    block_size = config['block_size']
+    block_number = pow(2, level)
+    client, oram_server = create_variant(config['variant'], level, config['Z'], block_size,
+                                         config['position_compress'], config['cipher'])
+
+    expected = dict()
+    start = time.perf_counter()
+    items = []
+    for block_id in range(block_number):
+        expected[block_id] = synthetic_data(rnd, rnd.randrange(1, block_size + 1))
+        items.append((block_id, expected[block_id]))
+    client.bulk_load(iter(items), oram_server)
+    load_time = time.perf_counter() - start
+
+    counting_server = CountingServer(oram_server)
+    latencies = []
+    mismatches = 0
+    start = time.perf_counter()
+    for i in range(config['accesses']):
+        block_id = rnd.randrange(block_number)
+        if rnd.random() < config['write_ratio']:
+            block_data = synthetic_data(rnd, rnd.randrange(1, block_size + 1))
+            access_start = time.perf_counter()
+            client.write(block_id, block_data, counting_server)
+            latencies.append(time.perf_counter() - access_start)
+            expected[block_id] = block_data
+        else:
+            access_start = time.perf_counter()
+            block_data = client.read(block_id, counting_server)
+            latencies.append(time.perf_counter() - access_start)
+            if block_data != expected[block_id]:
+                mismatches += 1
+    total_time = time.perf_counter() - start
+    client.close()
+
+    latencies.sort()
+    accesses = config['accesses']
+    result = dict(config)
+    result.update({
+        'recursive_levels': getattr(client, 'recursive_level', 0),
+        'load_seconds': load_time,
+        'throughput': accesses / total_time if total_time else 0,
+        'latency_mean_ms': sum(latencies) / accesses * 1000 if accesses else 0,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p90_ms': percentile(latencies, 90) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000,
+        'latency_max_ms': latencies[-1] * 1000 if latencies else 0,
+        'bytes_read_per_access': counting_server.read_bytes / accesses if accesses else 0,
+        'bytes_written_per_access': counting_server.write_bytes / accesses if accesses else 0,
+        'server_calls_per_access': len(counting_server.calls) / accesses if accesses else 0,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'mismatches': mismatches,
+    })
+    return result
+
+
+def sweep_configs(args):
+    configs = []
+    for variant, level, Z, block_size in itertools.product(args.variants, args.levels, args.Z, args.block_sizes):
+        compresses = args.position_compress if variant == 'recursive' else [None]
+        for position_compress in compresses:
+            configs.append({'variant': variant, 'level': level, 'Z': Z, 'block_size': block_size,
+                            'position_compress': position_compress, 'cipher': args.cipher,
+                            'accesses': args.accesses, 'write_ratio': args.write_ratio, 'seed': args.seed})
+    return configs
+
+
+# run configurations, each in a new process unless in_process
+def run_configs(configs, in_process=False):
+    if in_process:
+        return [run_config(config) for config in configs]
+    results = []
+    for config in configs:
+        with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+            results.append(pool.apply(run_config, (config,)))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def config_key(result):
+    return (result['variant'], result['level'], result['Z'], result['block_size'], result['position_compress'],
+            result['cipher'])
+
+
+# compare results with results of a previous run, return configurations whose throughput dropped by more than
+# tolerance as [(config key, previous throughput, throughput)]
+def compare_results(previous_results, results, tolerance=0.1):
+    previous = {config_key(result): result for result in previous_results}
+    regressions = []
+    for result in results:
+        key = config_key(result)
+        if key not in previous:
+            continue
+        previous_throughput = previous[key]['throughput']
+        if result['throughput'] < previous_throughput * (1 - tolerance):
+            regressions.append((key, previous_throughput, result['throughput']))
+    return regressions
+
+
+def print_results(results):
+    columns = ['variant', 'level', 'Z', 'block_size', 'position_compress', 'recursive_levels', 'throughput',
+               'latency_p50_ms', 'latency_p99_ms', 'bytes_read_per_access', 'bytes_written_per_access', 'peak_rss_kb',
+               'mismatches']
+    print('\t'.join(columns))
+    for result in results:
+        print('\t'.join('%.3f' % result[column] if isinstance(result[column], float) else str(result[column])
+                        for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark path oram and recursive path oram on synthetic data")
+    parser.add_argument('--variants', nargs='+', default=['path', 'recursive'], choices=['path', 'recursive'])
+    parser.add_argument('--levels', nargs='+', type=int, default=[8, 10])
+    parser.add_argument('--Z', nargs='+', type=int, default=[4])
+    parser.add_argument('--block-sizes', nargs='+', type=int, default=[1024])
+    parser.add_argument('--position-compress', nargs='+', type=int, default=[8, 256])
+    parser.add_argument('--cipher', default='ctr', choices=['eax', 'ctr', 'gcm'])
+    parser.add_argument('--accesses', type=int, default=200)
+    parser.add_argument('--write-ratio', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--in-process', action='store_true', help="run configurations in this process")
+    parser.add_argument('--output', help="write results as json to file")
+    parser.add_argument('--compare', help="json results of a previous run, report throughput regressions")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = run_configs(sweep_configs(args), args.in_process)
+    print_results(results)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    failed = any(result['mismatches'] for result in results)
+    if args.compare:
+        with open(args.compare) as f:
+            previous_report = json.load(f)
+        regressions = compare_results(previous_report['results'], results, args.tolerance)
+        for key, previous_throughput, throughput in regressions:
+            print("regression", key, "throughput", previous_throughput, "->", throughput)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
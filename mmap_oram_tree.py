@@ -0,0 +1,102 @@
+import mmap
+import os
+import struct
+from oram_tree import ContiguousOramTree
+
+
+class MmapOramTree(ContiguousOramTree):
+
+    # oram tree stored on disk in a single file accessed through mmap
+    #
+    # file = header + buckets, header = (magic, bucket_number, Z, nonce_size, cipher_size)
+    # buckets are laid out as ContiguousOramTree, starting at header_size
+    #
+    # all blocks should have the same size of nonce and cipher
+    # a bucket is copied out of the file with one slice, blocks of it are views of that copy,
+    # so no view of the mmap is held and the file could be closed at any time
+    # read_path_buffers returns views of the mapped file itself (one per bucket, no copy, no object per block),
+    # they should be released before close
+    header = struct.Struct('<4sIIII')
+    magic = b'ORAM'
+
+    # create file from buckets, or from (bucket_number, Z, cipher_size) with empty slots,
+    # or open existing file if only file_path is given
+    def __init__(self, file_path, buckets=None, bucket_number=None, Z=None, cipher_size=None, nonce_size=16):
+        self.file_path = file_path
+        if buckets is not None:
+            first_block = buckets[0].get()[0]
+            bucket_number = len(buckets)
+            Z = len(buckets[0].get())
+            cipher_size = len(first_block.cipher)
+            nonce_size = len(first_block.nonce)
+
+        if bucket_number is None:
+            self.file = open(file_path, 'r+b')
+            magic, bucket_number, Z, nonce_size, cipher_size = self.header.unpack(self.file.read(self.header.size))
+            if magic != self.magic:
+                raise Exception("not an oram tree file", file_path)
+            self.set_shape(bucket_number, Z, cipher_size, nonce_size)
+        else:
+            self.set_shape(bucket_number, Z, cipher_size, nonce_size)
+            self.file = open(file_path, 'w+b')
+            self.file.write(self.header.pack(self.magic, bucket_number, Z, nonce_size, cipher_size))
+            self.file.truncate(self.header.size + bucket_number * self.bucket_size)
+        self.buffer = mmap.mmap(self.file.fileno(), 0)
+        self.view = memoryview(self.buffer)
+        self.offset = self.header.size
+
+        if buckets is not None:
+            for index, bucket in enumerate(buckets):
+                self.put_bucket(index, bucket.get())
+
+    def get_bucket(self, index):
+        start = self.offset + index * self.bucket_size
+        return self.slice_bucket(memoryview(self.buffer[start:start + self.bucket_size]), 0)
+
+    def flush(self):
+        self.buffer.flush()
+
+    def close(self):
+        self.view.release()
+        try:
+            self.buffer.close()
+        except BufferError:
+            self.view = memoryview(self.buffer)
+            raise Exception("views of oram tree file are still held, release them before close", self.file_path)
+        self.file.close()
+
+
+# save any oram tree to file_path in the format of MmapOramTree, reopened by MmapOramTree(file_path) or
+# open_oram_tree of oram_tree. Empty slots (buckets cached on client, never written) are saved as zeros
+# a MmapOramTree saved to its own file is only flushed
+def save_oram_tree(oram_tree, file_path, chunk_buckets=1024):
+    if isinstance(oram_tree, MmapOramTree) and os.path.abspath(oram_tree.file_path) == os.path.abspath(file_path):
+        oram_tree.flush()
+        return
+    if isinstance(oram_tree, ContiguousOramTree):
+        Z, nonce_size, cipher_size = oram_tree.Z, oram_tree.nonce_size, oram_tree.cipher_size
+    else:
+        blocks = (block for index in range(oram_tree.bucket_number) for block in oram_tree.get_bucket(index)
+                  if block is not None)
+        first_block = next(blocks, None)
+        if first_block is None:
+            raise Exception("oram tree without block could not be saved")
+        Z = len(oram_tree.get_bucket(0))
+        nonce_size = len(first_block.nonce)
+        cipher_size = len(first_block.cipher)
+    slot_size = nonce_size + cipher_size
+    with open(file_path + '.tmp', 'wb') as f:
+        f.write(MmapOramTree.header.pack(MmapOramTree.magic, oram_tree.bucket_number, Z, nonce_size, cipher_size))
+        if isinstance(oram_tree, ContiguousOramTree):
+            for index in range(0, oram_tree.bucket_number, chunk_buckets):
+                start = oram_tree.offset + index * oram_tree.bucket_size
+                end = oram_tree.offset + min(index + chunk_buckets, oram_tree.bucket_number) * oram_tree.bucket_size
+                f.write(oram_tree.buffer[start:end])
+        else:
+            for index in range(oram_tree.bucket_number):
+                f.write(b''.join(bytes(slot_size) if block is None else bytes(block.nonce) + bytes(block.cipher)
+                                 for block in oram_tree.get_bucket(index)))
+        f.flush()
+        os.fsync(f.fileno())
+    # replace at once, a crash leaves the previous file
+    os.replace(file_path + '.tmp', file_path)
@@ -1,7 +1,11 @@
-from random import randint
-from Crypto.Cipher import AES
+from random import randrange
 from bisect import bisect_left
-from oram_tree import BlockCipher, BlockPlaintext, Bucket, OramTree
+from oram_tree import BlockPlaintext, Bucket, BucketFiller, PositionMap, Stash, StashOverflowPolicy, \
+    StashStatistics, TreetopCache, bucket_index, create_oram_tree, create_empty_oram_tree, open_oram_tree, \
+    reverse_lex_position
+from oram_cipher import DummyPool, create_cipher
+from oram_metrics import blocks_bytes, null_metrics
+from mmap_oram_tree import save_oram_tree
 
 
 class PathOramServer:
@@ -18,26 +22,98 @@ class PathOramServer:
     # block dummy symbol used to pad a file to the maximum size which is (block_size - block_id_size)
     #
 
-    def __init__(self, buckets, level):
+    # storage 'memory' keeps buckets in memory, 'mmap' stores them in file storage_path through mmap
+    # if buckets is None, storage is created with empty slots of shape (Z, cipher_size, nonce_size)
+    # (client.bucket_shape()) and filled by bulk_load of client
+    # if buckets and shape are None, the tree saved at storage_path (save, or the file of 'mmap' storage) is opened
+    # metrics: OramMetrics recording time of each call and blocks read and written (see oram_metrics)
+    def __init__(self, buckets, level, storage='memory', storage_path=None, shape=None, metrics=None):
         self.level = level
+        self.metrics = null_metrics if metrics is None else metrics
 
         # init with random blocks
         total_bucket_number = pow(2, level + 1) - 1
+        if buckets is None and shape is None and storage_path is not None:
+            self.oram_tree = open_oram_tree(storage_path, storage)
+            if self.oram_tree.bucket_number != total_bucket_number:
+                raise Exception("saved tree does not match level", "buckets:", self.oram_tree.bucket_number,
+                                "level:", level)
+            return
+        if buckets is None:
+            if shape is None:
+                raise Exception("shape of bucket is needed for empty storage")
+            Z, cipher_size, nonce_size = shape
+            self.oram_tree = create_empty_oram_tree(total_bucket_number, Z, cipher_size, nonce_size, storage,
+                                                    storage_path)
+            return
         if len(buckets) != total_bucket_number:
             raise Exception("number of blocks should equal to total_bucket_number")
-        self.oram_tree = OramTree(buckets)
+        self.oram_tree = create_oram_tree(buckets, storage, storage_path)
 
     def read(self, position):
-        self.check_position_length(position)
+        self.check_position(position)
         return self.oram_tree.read(position)
 
     def write_bucket(self, position, blocks, level):
-        self.check_position_length(position)
+        self.check_position(position)
         return self.oram_tree.write(position, blocks, level)
 
-    def check_position_length(self, position):
-        if len(position) < self.level:
-            raise Exception("level should be less or equal than length of position")
+    # read buckets on path to position, return [blocks of bucket at each level]
+    # buckets above start_level are cached by client and not read
+    def read_path(self, position, start_level=0):
+        self.check_position(position)
+        with self.metrics.phase('read_path'):
+            buckets = self.oram_tree.read_path(position, start_level)
+        if self.metrics.enabled:
+            self.metrics.count('server_blocks_read', sum(len(blocks) for blocks in buckets))
+        return buckets
+
+    # buckets on path to position as views of the buffer of storage 'contiguous' or 'mmap', one view of Z slots
+    # (nonce + cipher) per bucket and no object per block, see ContiguousOramTree.read_path_buffers
+    def read_path_buffers(self, position, start_level=0):
+        self.check_position(position)
+        if not hasattr(self.oram_tree, 'read_path_buffers'):
+            raise Exception("path buffers are read from storage 'contiguous' or 'mmap' only")
+        with self.metrics.phase('read_path'):
+            return self.oram_tree.read_path_buffers(position, start_level)
+
+    # write [blocks of bucket at each level] to path to position in one call
+    def write_path(self, position, buckets, start_level=0):
+        self.check_position(position)
+        if self.metrics.enabled:
+            self.metrics.count('server_blocks_written', sum(len(blocks) for blocks in buckets))
+        with self.metrics.phase('write_path'):
+            return self.oram_tree.write_path(position, buckets, start_level)
+
+    # read union of paths to positions in one call, return {bucket_index: blocks}
+    def read_paths(self, positions, start_level=0):
+        for position in positions:
+            self.check_position(position)
+        with self.metrics.phase('read_paths'):
+            buckets = self.oram_tree.read_paths(positions, start_level)
+        if self.metrics.enabled:
+            self.metrics.count('server_blocks_read', sum(len(blocks) for blocks in buckets.values()))
+        return buckets
+
+    # write {bucket_index: blocks} in one call
+    def write_buckets(self, buckets):
+        if self.metrics.enabled:
+            self.metrics.count('server_blocks_written', sum(len(blocks) for blocks in buckets.values()))
+        with self.metrics.phase('write_buckets'):
+            return self.oram_tree.write_buckets(buckets)
+
+    # write [(bucket_index, offset, block)] in one call
+    def write_blocks(self, blocks):
+        return self.oram_tree.write_blocks(blocks)
+
+    # save tree to path in the format of MmapOramTree, reopened by PathOramServer(None, level, storage, path)
+    # with 'mmap' storage, saving to its own file only flushes it
+    def save(self, path):
+        save_oram_tree(self.oram_tree, path)
+
+    def check_position(self, position):
+        if position < 0 or position >= pow(2, self.level):
+            raise Exception("position should be a leaf of the oram tree", "position:", position, "level:", self.level)
 
 
 class PathOramClient:
@@ -53,50 +129,75 @@ class PathOramClient:
     # A file could be stored in multiple block,  a mapping between file and block_id could be stored in client
     #
     # block dummy symbol used to pad a file to the maximum size which is (block_size - block_id_size)
-    def __init__(self, level, Z=5, block_size=8192, block_id_size=32):
+    # unpad: remove padding from data read, with False data read is the whole padded block (data containing
+    # b'\xff' could be cut by removing padding, callers keeping their own lengths such as oram_file use False)
+    #
+    # cipher is 'eax', 'ctr', 'gcm' (see oram_cipher) or a cipher object
+    # crypto_workers: decrypt and encrypt blocks of a path by a pool of crypto_workers threads or processes
+    # (crypto_executor 'thread' or 'process'), nonces are still chosen by the client, close() (or a with block)
+    # shuts the pool down
+    # dummy_pool_size: dummy blocks written back are taken from a pool of dummy_pool_size fresh dummy ciphers,
+    # refilled by a thread if dummy_pool_background (stopped by close()), otherwise by dummy_pool.refill() when client
+    # is idle
+    # treetop_levels: top levels of tree kept decrypted on client (TreetopCache), only lower levels are read from
+    # and written to server, treetop_report() gives memory used against bytes saved
+    #
+    # eviction 'path': every access writes back the path it reads
+    # eviction 'background': an access only reads the path, a path in reverse lexicographic order is evicted
+    # every eviction_period accesses, or when stash is larger than stash_threshold
+    #
+    # stash_limit: after an access leaving more than stash_limit blocks in stash, up to stash_policy_rounds extra
+    # paths are read and written back, stash_policy 'evict' or 'dummy' (see StashOverflowPolicy),
+    # stash_statistics records stash size after every access, stash_policy counts extra accesses and overflows
+    #
+    # metrics: OramMetrics recording time of each phase of an access, bytes and blocks moved and stash size
+    # (see oram_metrics), nothing is recorded by default
+    def __init__(self, level, Z=5, block_size=8192, block_id_size=32, eviction='path', eviction_period=1,
+                 stash_threshold=None, cipher='eax', crypto_workers=None, crypto_executor='thread',
+                 dummy_pool_size=0, dummy_pool_background=True, unpad=True, treetop_levels=0, stash_limit=None,
+                 stash_policy='evict', stash_policy_rounds=4, metrics=None):
+        if eviction not in ('path', 'background'):
+            raise Exception("eviction should be 'path' or 'background'", eviction)
         self.Z = Z
         self.level = level
         self.block_size = block_size
         self.block_id_size = block_id_size
         self.total_bucket_number = pow(2, level + 1) - 1
         self.block_dummy_symbol = b'\xff'
+        self.unpad = unpad
         self.dummy_block_id = int.from_bytes(self.block_dummy_symbol * self.block_id_size, byteorder='little')
+        # same size as real block, cipher = block_id + data
+        self.dummy_block = BlockPlaintext(self.dummy_block_id, self.block_dummy_symbol * self.block_size)
+
+        self.stash = Stash(level)  # {block_id: block plaintext)} indexed by position
+        self.position_map = PositionMap(pow(2, level), level)  # {block_id:  position}, random leaves
+        self.stash_statistics = StashStatistics()
+        self.metrics = null_metrics if metrics is None else metrics
+        self.stash_policy = None
+        if stash_limit is not None:
+            self.stash_policy = StashOverflowPolicy(stash_limit, stash_policy, stash_policy_rounds)
+        self.treetop = TreetopCache(treetop_levels, level, Z)
+
+        self.eviction = eviction
+        self.eviction_period = eviction_period
+        self.stash_threshold = stash_threshold
+        self.access_count = 0  # accesses since last eviction
+        self.eviction_count = 0  # number of evicted paths, decide next path to evict
+        self.drained_buckets = set()  # indexes of buckets read but not written back
 
-        self.stash = dict()  # {block_id: block plaintext)}
-        self.position_map = dict()  # {block_id:  position}
-
-        leaf_nodes = pow(2, level)
-        for i in range(leaf_nodes):
-            position = self.integer_to_position(randint(0, leaf_nodes))
-            self.position_map[i] = position
         # use AES for encryption
         self.key = str.encode('1' * (self.key_size // 8))
-
-    def find_intersection_block(self, position, level):
-        intersect_block = dict()
-        for block_id in self.stash:
-            block_position = self.position_map[block_id]
-            if block_position[:level] == position[:level]:
-                intersect_block[block_id] = self.stash[block_id]
-        return intersect_block
+        self.cipher = create_cipher(cipher, self.key, crypto_workers, crypto_executor)
+        self.dummy_pool = None
+        if dummy_pool_size:
+            self.dummy_pool = DummyPool(self.encrypt_dummy_blocks, dummy_pool_size, dummy_pool_background)
 
     def access(self, op, block_id, block_data, oram_server):
-        block_position = self.position_map[block_id]
-        total_real_block = pow(2, self.level)
-        self.position_map[block_id] = self.integer_to_position(randint(0, total_real_block))
+        with self.metrics.phase('position_lookup'):
+            block_position, _ = self.position_map.remap(block_id)
 
         # read bucket along path block_position from server
-        blocks_cipher = oram_server.read(block_position)
-        to_append_stash = dict()
-        for block_cipher in blocks_cipher:
-            block_plaintext = self.decrypt_block(block_cipher)
-            # skip dummy block
-            if block_plaintext.block_id == self.dummy_block_id:
-                continue
-            to_append_stash[block_plaintext.block_id] = block_plaintext
-
-        # update stash
-        self.stash.update(to_append_stash)
+        self.read_paths_to_stash([block_position], oram_server)
 
         if block_id not in self.stash:
             # not write before
@@ -104,49 +205,242 @@ class PathOramClient:
         else:
             block_plaintext_to_read = self.stash[block_id]  # read from stash a
             data_to_read = self.remove_dummy_in_block(block_plaintext_to_read.data)
+            # block may stay in stash from previous access, move it to new position
+            self.stash.put(block_plaintext_to_read, self.position_map[block_id])
         if op == 'write':
             # pad block data to maximum block_size
             if len(block_data) > self.block_size:
                 raise Exception("length of block data should be less than block size", "length of block data:",
                                 len(block_data), "block size:", self.block_size)
             block_data = block_data + (self.block_size - len(block_data)) * self.block_dummy_symbol
-            self.stash[block_id] = BlockPlaintext(block_id, block_data)
-
-        for l in reversed(range(self.level + 1)):
-            intersect_block = self.find_intersection_block(block_position, l)
-            # select S'= min(len(intersect_block),Z) blocks to write
-            select_block_num = min(len(intersect_block), self.Z)
-            count = 0
-            select_block_id = dict()
-            for k in intersect_block:
-                if count == select_block_num:
-                    break
-                select_block_id[k] = intersect_block[k]
-                count += 1
-
-            # remove select block from stash
-            for block_id in select_block_id:
-                del self.stash[block_id]
-
-            select_blocks = [select_block_id[k] for k in select_block_id]
-
-            select_blocks_cipher = []
-            for select_block in select_blocks:
-                block_cipher = self.encrypt_block(select_block)
-                select_blocks_cipher.append(block_cipher)
-
-            # padded S' with dummy blocks to size of Z, block id should be selected from stash
-            if len(select_blocks_cipher) < self.Z:
-                dummy_blocks_cipher = []
-                for i in range(0, self.Z - len(select_blocks_cipher)):
-                    dummy_block_cipher = self.generate_dummy_block_cipher()
-                    dummy_blocks_cipher.append(dummy_block_cipher)
-                select_blocks_cipher.extend(dummy_blocks_cipher)
-            oram_server.write_bucket(block_position, select_blocks_cipher, l)
+            self.stash.put(BlockPlaintext(block_id, block_data), self.position_map[block_id])
+
+        if self.eviction == 'path':
+            self.write_back_paths([block_position], oram_server)
+        else:
+            self.schedule_eviction(oram_server)
+        self.relieve_stash(oram_server)
+        self.stash_statistics.record(len(self.stash))
+        self.metrics.count('accesses')
+        self.metrics.gauge('stash_size', len(self.stash))
+
+        return data_to_read
+
+    # read union of paths, put real blocks to stash
+    # buckets read but not written back yet in background eviction mode are skipped, their blocks are in stash already
+    def read_paths_to_stash(self, positions, oram_server):
+        start_level = self.treetop.levels
+        metrics = self.metrics
+        with metrics.phase('path_read'):
+            if len(positions) == 1:
+                # a single path is read by level
+                buckets_cipher = dict(zip(self.path_indexes(positions[0])[start_level:],
+                                          oram_server.read_path(positions[0], start_level)))
+            else:
+                buckets_cipher = oram_server.read_paths(positions, start_level)
+        blocks_cipher = []
+        for index in buckets_cipher:
+            if index not in self.drained_buckets:
+                blocks_cipher.extend(buckets_cipher[index])
+        if metrics.enabled:
+            metrics.count('bytes_read', sum(blocks_bytes(buckets_cipher[index]) for index in buckets_cipher))
+            metrics.count('blocks_read', len(blocks_cipher))
+        with metrics.phase('decrypt'):
+            blocks_plaintext = self.decrypt_blocks(blocks_cipher)
+        with metrics.phase('stash_merge'):
+            # blocks of buckets cached on client
+            for block_plaintext, _ in self.treetop.take_paths(positions):
+                self.stash.put(block_plaintext, self.position_map[block_plaintext.block_id])
+            for block_plaintext in blocks_plaintext:
+                # skip dummy block
+                if block_plaintext.block_id == self.dummy_block_id:
+                    continue
+                # update stash
+                self.stash.put(block_plaintext, self.position_map[block_plaintext.block_id])
+        if self.eviction != 'path':
+            self.drained_buckets.update(buckets_cipher)
+
+    # select S'= min(blocks can be placed in bucket, Z) blocks to write for each bucket on the union of paths,
+    # removed from stash, write back in one call
+    def write_back_paths(self, positions, oram_server):
+        metrics = self.metrics
+        with metrics.phase('eviction'):
+            evict_buckets = self.stash.evict_paths(positions, self.Z)
+        indexes = []
+        for index in evict_buckets:
+            if self.treetop.caches(index):
+                self.treetop.put(index, evict_buckets[index])
+            else:
+                indexes.append(index)
+        blocks = []
+        for index in indexes:
+            select_blocks = [select_block for select_block, _ in evict_buckets[index]]
+            # padded S' with dummy blocks to size of Z
+            select_blocks.extend([None] * (self.Z - len(select_blocks)))
+            blocks.extend(select_blocks)
+            self.drained_buckets.discard(index)
+        # encrypt all buckets at once
+        with metrics.phase('encrypt'):
+            blocks_cipher = self.encrypt_padded_blocks(blocks)
+        if metrics.enabled:
+            metrics.count('bytes_written', blocks_bytes(blocks_cipher))
+            metrics.count('blocks_written', len(blocks_cipher))
+        buckets_cipher = dict()
+        for i, index in enumerate(indexes):
+            buckets_cipher[index] = blocks_cipher[i * self.Z:(i + 1) * self.Z]
+        with metrics.phase('write_back'):
+            if len(positions) == 1:
+                start_level = self.treetop.levels
+                oram_server.write_path(positions[0], [buckets_cipher[index] for index in
+                                                      self.path_indexes(positions[0])[start_level:]], start_level)
+            else:
+                oram_server.write_buckets(buckets_cipher)
+
+    # indexes of buckets on path to position, from root to leaf
+    def path_indexes(self, position):
+        return [bucket_index(position, level, self.level) for level in range(self.level + 1)]
+
+    # background eviction, evict a path every eviction_period accesses or when stash is larger than stash_threshold
+    def schedule_eviction(self, oram_server):
+        self.access_count += 1
+        if self.access_count >= self.eviction_period or \
+                (self.stash_threshold is not None and len(self.stash) > self.stash_threshold):
+            self.access_count = 0
+            self.evict_path(oram_server)
+
+    # evict along paths in reverse lexicographic order of leaves, which spreads evictions evenly over the tree
+    def evict_path(self, oram_server):
+        position = reverse_lex_position(self.eviction_count, self.level)
+        self.eviction_count = (self.eviction_count + 1) % pow(2, self.level)
+        self.read_paths_to_stash([position], oram_server)
+        self.write_back_paths([position], oram_server)
+
+    # extra paths of stash_policy while stash is larger than its limit
+    def relieve_stash(self, oram_server):
+        policy = self.stash_policy
+        if policy is None or not policy.exceeded(len(self.stash)):
+            return
+        for i in range(policy.max_rounds):
+            position = policy.next_position(self.level)
+            self.read_paths_to_stash([position], oram_server)
+            self.write_back_paths([position], oram_server)
+            if not policy.exceeded(len(self.stash)):
+                return
+        policy.overflows += 1
+
+    # ops is a list of (op, block_id, block_data), op is 'read' or 'write'
+    # union of paths of all blocks is read in one call and written back in one call
+    # return data read for each op, a block accessed more than once is served from stash
+    def access_batch(self, ops, oram_server):
+        for op, block_id, block_data in ops:
+            if op == 'write' and len(block_data) > self.block_size:
+                raise Exception("length of block data should be less than block size", "length of block data:",
+                                len(block_data), "block size:", self.block_size)
 
+        leaf_nodes = pow(2, self.level)
+        with self.metrics.phase('position_lookup'):
+            block_ids = list(dict.fromkeys(block_id for op, block_id, block_data in ops))
+            # {block_id: position before access}
+            block_positions = dict(zip(block_ids, self.position_map.remap_many(block_ids)))
+        # read a random path for each repeated block, so the server only sees the size of batch
+        positions = list(block_positions.values())
+        positions.extend(randrange(leaf_nodes) for i in range(len(ops) - len(block_positions)))
+
+        # read union of paths from server
+        self.read_paths_to_stash(positions, oram_server)
+        # blocks may stay in stash from previous access, move them to new position
+        for block_id in block_positions:
+            if block_id in self.stash:
+                self.stash.put(self.stash[block_id], self.position_map[block_id])
+
+        data_to_read = []
+        for op, block_id, block_data in ops:
+            if block_id not in self.stash:
+                data_to_read.append(None)
+            else:
+                data_to_read.append(self.remove_dummy_in_block(self.stash[block_id].data))
+            if op == 'write':
+                block_data = block_data + (self.block_size - len(block_data)) * self.block_dummy_symbol
+                self.stash.put(BlockPlaintext(block_id, block_data), self.position_map[block_id])
+
+        self.write_back_paths(positions, oram_server)
+        self.relieve_stash(oram_server)
+        self.stash_statistics.record(len(self.stash))
+        self.metrics.count('accesses', len(ops))
+        self.metrics.gauge('stash_size', len(self.stash))
         return data_to_read
 
+    def read_many(self, block_ids, oram_server):
+        return self.access_batch([('read', block_id, None) for block_id in block_ids], oram_server)
+
+    # items is a list of (block_id, block_data)
+    def write_many(self, items, oram_server):
+        return self.access_batch([('write', block_id, block_data) for block_id, block_data in items], oram_server)
+
+    # load blocks into a server created with empty storage, PathOramServer(None, level, shape=client.bucket_shape())
+    # items is an iterable of (block_id, block_data), read once, 0 <= block_id < 2^level
+    # a block is placed in the deepest bucket with a free slot on the path to its position (kept in stash if the path
+    # is full), blocks are kept on client until all are placed, then every bucket is written whole with fresh dummies
+    # in its other slots, in order of bucket index (see BucketFiller), chunk_size slots encrypted and written at a time
+    def bulk_load(self, items, oram_server, chunk_size=1024):
+        filler = BucketFiller(self.level, self.Z)
+        leaf_nodes = pow(2, self.level)
+        for block_id, block_data in items:
+            if block_id < 0 or block_id >= leaf_nodes:
+                raise Exception("block id out of range", "block id:", block_id, "blocks:", leaf_nodes)
+            if len(block_data) > self.block_size:
+                raise Exception("length of block data should be less than block size", "length of block data:",
+                                len(block_data), "block size:", self.block_size)
+            block_data = block_data + (self.block_size - len(block_data)) * self.block_dummy_symbol
+            block = BlockPlaintext(block_id, block_data)
+            index = filler.place(self.position_map[block_id])
+            if index is None:
+                self.stash.put(block, self.position_map[block_id])
+            elif self.treetop.caches(index):
+                self.treetop.append(index, block, self.position_map[block_id])
+            else:
+                filler.put(index, block)
+
+        buckets = []
+        for bucket in filler.full_buckets(self.treetop.bucket_number):
+            buckets.append(bucket)
+            if len(buckets) * self.Z >= chunk_size:
+                self.write_loaded_buckets(buckets, oram_server)
+                buckets = []
+        self.write_loaded_buckets(buckets, oram_server)
+
+    # [(bucket_index, Z blocks)], None in blocks is a dummy block
+    def write_loaded_buckets(self, buckets, oram_server):
+        if not buckets:
+            return
+        blocks_cipher = self.encrypt_padded_blocks([block for index, blocks in buckets for block in blocks])
+        oram_server.write_buckets({index: blocks_cipher[i * self.Z:(i + 1) * self.Z]
+                                   for i, (index, blocks) in enumerate(buckets)})
+
+    # (Z, cipher size, nonce size) of buckets on server
+    def bucket_shape(self):
+        return self.Z, self.block_id_size + self.block_size + self.cipher.overhead, self.cipher.nonce_size
+
+    # stop refill thread of dummy pool and shut down workers of cipher
+    def close(self):
+        if self.dummy_pool is not None:
+            self.dummy_pool.close()
+        if hasattr(self.cipher, 'close'):
+            self.cipher.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def treetop_report(self):
+        Z, cipher_size, nonce_size = self.bucket_shape()
+        return self.treetop.report(self.block_id_size + self.block_size, cipher_size + nonce_size)
+
     def remove_dummy_in_block(self, data):
+        if not self.unpad:
+            return data
         dummy_symbol = self.block_dummy_symbol
         dummy_symbol_value = dummy_symbol[0]
         first_dummy_index = bisect_left(data, dummy_symbol_value)
@@ -159,39 +453,47 @@ class PathOramClient:
         return self.access(op='write', block_id=block_id, block_data=block_data, oram_server=oram_server)
 
     def encrypt_block(self, block_plaintext):
-        cipher = AES.new(self.key, AES.MODE_EAX)
-        nonce = cipher.nonce
-        padded_block_id = block_plaintext.block_id.to_bytes(self.block_id_size, byteorder='little')
-        data = padded_block_id + block_plaintext.data
-        ciphertext = cipher.encrypt(data)
-        return BlockCipher(ciphertext, nonce)
+        return self.cipher.encrypt(self.pack_block(block_plaintext))
 
     def decrypt_block(self, block_cipher):
-        cipher = AES.new(self.key, AES.MODE_EAX, nonce=block_cipher.nonce)
-        plain_text = cipher.decrypt(block_cipher.cipher)
+        return self.unpack_block(self.cipher.decrypt(block_cipher))
+
+    def encrypt_blocks(self, blocks_plaintext):
+        return self.cipher.encrypt_many([self.pack_block(block_plaintext) for block_plaintext in blocks_plaintext])
+
+    def decrypt_blocks(self, blocks_cipher):
+        return [self.unpack_block(plain_text) for plain_text in self.cipher.decrypt_many(blocks_cipher)]
+
+    def encrypt_dummy_blocks(self, count):
+        return self.encrypt_blocks([self.dummy_block] * count)
+
+    # None in blocks is a dummy block, taken from dummy pool if there is one
+    def encrypt_padded_blocks(self, blocks):
+        if self.dummy_pool is None:
+            return self.encrypt_blocks([self.dummy_block if block is None else block for block in blocks])
+        real_blocks_cipher = iter(self.encrypt_blocks([block for block in blocks if block is not None]))
+        dummy_blocks_cipher = iter(self.dummy_pool.take(sum(block is None for block in blocks)))
+        return [next(dummy_blocks_cipher) if block is None else next(real_blocks_cipher) for block in blocks]
+
+    def pack_block(self, block_plaintext):
+        padded_block_id = block_plaintext.block_id.to_bytes(self.block_id_size, byteorder='little')
+        return padded_block_id + block_plaintext.data
+
+    def unpack_block(self, plain_text):
         block_id = int.from_bytes(plain_text[:self.block_id_size], byteorder='little')
         data = plain_text[self.block_id_size:]
         return BlockPlaintext(block_id, data)
 
+    # every slot is a distinct fresh dummy, so the server could not tell which slots are equal
     def generate_initialize_block(self):
-        blocks = [[self.generate_dummy_block_cipher()] * self.Z for i in range(self.total_bucket_number)]
+        blocks_cipher = self.encrypt_dummy_blocks(self.Z * self.total_bucket_number)
         buckets = []
-        for i in range(len(blocks)):
-            bucket = Bucket(blocks[i])
+        for i in range(self.total_bucket_number):
+            bucket = Bucket(blocks_cipher[i * self.Z:(i + 1) * self.Z])
             buckets.append(bucket)
         return buckets
 
     def generate_dummy_block_cipher(self):
-        dummy_block = self.block_dummy_symbol * self.block_size
-        dummy_block_id = int.from_bytes(dummy_block[:self.block_id_size], byteorder='little')
-        dummy_data = dummy_block[self.block_id_size: self.block_size]
-        block_cipher = self.encrypt_block(
-            BlockPlaintext(dummy_block_id, dummy_data))
-        return block_cipher
-
-    # change loc from 0 - 2^ level - 1 to a binary position representation in a tree (e.g. '00101')
-    def integer_to_position(self, loc):
-        binary_loc = bin(loc)[2:]  # remove '0b' in binary
-        position_length = self.level
-        position = ('0' * position_length + binary_loc)[-position_length:]
-        return position
+        if self.dummy_pool is not None:
+            return self.dummy_pool.take(1)[0]
+        return self.encrypt_block(self.dummy_block)
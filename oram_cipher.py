@@ -0,0 +1,357 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from Crypto.Cipher import AES
+from oram_tree import BlockCipher
+
+# block cipher layer used by oram clients to encrypt blocks, a block cipher is (cipher, nonce)
+# every cipher here uses 16 bytes nonce, so blocks of all ciphers fit the same fixed size slots
+#
+# encrypt_many/decrypt_many take all blocks of a path (or a batch of paths) at once
+#
+# encrypt_many = encrypt_with_nonces(plaintexts, new_nonces(plaintexts)), nonces are chosen by the cipher object
+# and encrypt_with_nonces does not change it, so a batch could be split and encrypted by other threads or processes
+
+
+class EaxCipher:
+
+    # AES EAX with a random nonce for every block, MAC is not stored
+    # a cipher context is created for every block
+    nonce_size = 16
+    overhead = 0  # bytes added to cipher
+
+    def __init__(self, key):
+        self.key = key
+
+    def encrypt(self, plaintext):
+        cipher = AES.new(self.key, AES.MODE_EAX)
+        return BlockCipher(cipher.encrypt(plaintext), cipher.nonce)
+
+    def decrypt(self, block_cipher):
+        cipher = AES.new(self.key, AES.MODE_EAX, nonce=block_cipher.nonce)
+        return cipher.decrypt(block_cipher.cipher)
+
+    def new_nonces(self, plaintexts):
+        return [os.urandom(self.nonce_size) for plaintext in plaintexts]
+
+    def encrypt_with_nonces(self, plaintexts, nonces):
+        return [BlockCipher(AES.new(self.key, AES.MODE_EAX, nonce=nonce).encrypt(plaintext), nonce)
+                for plaintext, nonce in zip(plaintexts, nonces)]
+
+    def encrypt_many(self, plaintexts):
+        return [self.encrypt(plaintext) for plaintext in plaintexts]
+
+    def decrypt_many(self, block_ciphers):
+        return [self.decrypt(block_cipher) for block_cipher in block_ciphers]
+
+
+class CounterCipher:
+
+    # nonces taken from a counter of the cipher object, under a lock so threads (e.g. a dummy pool refilled
+    # in background) could share the cipher, lock is not sent to worker processes
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class CtrCipher(CounterCipher):
+
+    # AES CTR, nonce of a block = stream nonce (8 bytes) + initial counter of block in stream (8 bytes)
+    # stream nonce is taken from a per client counter starting at a random value, never reused by the client
+    #
+    # contiguous: encrypt_many encrypts all blocks as one buffer with one cipher context,
+    # each block starting at a 16 bytes aligned counter of the stream, cipher of each block is bytes of its own
+    # not authenticated, cipher size equals plaintext size
+    nonce_size = 16
+    overhead = 0
+    counter_block_size = 16
+
+    def __init__(self, key, contiguous=True):
+        self.key = key
+        self.contiguous = contiguous
+        self.counter = int.from_bytes(os.urandom(8), byteorder='big')
+        self.lock = threading.Lock()
+
+    def next_stream_nonce(self):
+        with self.lock:
+            self.counter = (self.counter + 1) % pow(2, 64)
+            return self.counter.to_bytes(8, byteorder='big')
+
+    def encrypt(self, plaintext):
+        stream_nonce = self.next_stream_nonce()
+        cipher = AES.new(self.key, AES.MODE_CTR, nonce=stream_nonce, initial_value=0)
+        return BlockCipher(cipher.encrypt(plaintext), stream_nonce + bytes(8))
+
+    def decrypt(self, block_cipher):
+        nonce = bytes(block_cipher.nonce)
+        cipher = AES.new(self.key, AES.MODE_CTR, nonce=nonce[:8], initial_value=nonce[8:])
+        return cipher.decrypt(block_cipher.cipher)
+
+    # contiguous: blocks share a stream nonce, counter of a block follows the counters used by previous blocks
+    def new_nonces(self, plaintexts):
+        if not self.contiguous:
+            return [self.next_stream_nonce() + bytes(8) for plaintext in plaintexts]
+        stream_nonce = self.next_stream_nonce()
+        nonces = []
+        counter = 0
+        for plaintext in plaintexts:
+            nonces.append(stream_nonce + counter.to_bytes(8, byteorder='big'))
+            counter += -(-len(plaintext) // self.counter_block_size)
+        return nonces
+
+    # contiguous: nonces should be consecutive nonces from new_nonces, blocks are encrypted as one buffer
+    # starting at counter of the first block, each block padded to 16 bytes
+    def encrypt_with_nonces(self, plaintexts, nonces):
+        if not self.contiguous:
+            return [BlockCipher(AES.new(self.key, AES.MODE_CTR, nonce=nonce[:8], initial_value=nonce[8:])
+                                .encrypt(plaintext), nonce) for plaintext, nonce in zip(plaintexts, nonces)]
+        if not plaintexts:
+            return []
+        buffer = []
+        offsets = []
+        offset = 0
+        for plaintext in plaintexts:
+            offsets.append(offset)
+            buffer.append(plaintext)
+            offset += len(plaintext)
+            # next block starts at a new counter
+            padding = -offset % self.counter_block_size
+            buffer.append(bytes(padding))
+            offset += padding
+        cipher_buffer = memoryview(AES.new(self.key, AES.MODE_CTR, nonce=nonces[0][:8], initial_value=nonces[0][8:])
+                                   .encrypt(b''.join(buffer)))
+        # each block is copied out of the buffer, a block kept by a server (memory storage) does not keep alive
+        # the buffer of the whole batch
+        return [BlockCipher(bytes(cipher_buffer[start:start + len(plaintext)]), nonce)
+                for start, plaintext, nonce in zip(offsets, plaintexts, nonces)]
+
+    def encrypt_many(self, plaintexts):
+        return self.encrypt_with_nonces(plaintexts, self.new_nonces(plaintexts))
+
+    def decrypt_many(self, block_ciphers):
+        return [self.decrypt(block_cipher) for block_cipher in block_ciphers]
+
+
+class GcmCipher(CounterCipher):
+
+    # AES GCM, nonce of a block = random client prefix (8 bytes) + per client counter (8 bytes)
+    # tag (16 bytes) is appended to cipher and verified on decryption
+    nonce_size = 16
+    overhead = 16
+    tag_size = 16
+
+    def __init__(self, key):
+        self.key = key
+        self.prefix = os.urandom(8)
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def next_nonce(self):
+        with self.lock:
+            self.counter = (self.counter + 1) % pow(2, 64)
+            return self.prefix + self.counter.to_bytes(8, byteorder='big')
+
+    def encrypt(self, plaintext):
+        return self.encrypt_with_nonces([plaintext], [self.next_nonce()])[0]
+
+    def decrypt(self, block_cipher):
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=block_cipher.nonce)
+        data = block_cipher.cipher
+        try:
+            return cipher.decrypt_and_verify(data[:-self.tag_size], data[-self.tag_size:])
+        except ValueError:
+            raise Exception("block cipher fails authentication")
+
+    def new_nonces(self, plaintexts):
+        return [self.next_nonce() for plaintext in plaintexts]
+
+    def encrypt_with_nonces(self, plaintexts, nonces):
+        block_ciphers = []
+        for plaintext, nonce in zip(plaintexts, nonces):
+            ciphertext, tag = AES.new(self.key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(plaintext)
+            block_ciphers.append(BlockCipher(ciphertext + tag, nonce))
+        return block_ciphers
+
+    def encrypt_many(self, plaintexts):
+        return self.encrypt_with_nonces(plaintexts, self.new_nonces(plaintexts))
+
+    def decrypt_many(self, block_ciphers):
+        return [self.decrypt(block_cipher) for block_cipher in block_ciphers]
+
+
+# run in worker process, ciphers are sent back as bytes
+def encrypt_shard(cipher, plaintexts, nonces):
+    return [(bytes(block_cipher.cipher), block_cipher.nonce)
+            for block_cipher in cipher.encrypt_with_nonces(plaintexts, nonces)]
+
+
+def decrypt_shard(cipher, block_ciphers):
+    return cipher.decrypt_many([BlockCipher(data, nonce) for data, nonce in block_ciphers])
+
+
+class ParallelCipher:
+
+    # split encrypt_many/decrypt_many of cipher into shards run by a pool of workers
+    # executor 'thread': pycryptodome releases the GIL while encrypting a buffer, so threads run in parallel
+    # executor 'process': cipher object is sent to worker processes, blocks are copied to and from them
+    #
+    # nonces of a batch are chosen here before it is split, never by workers, so no nonce is reused
+    # batches with less than min_blocks blocks are run in the caller
+    def __init__(self, cipher, workers=4, executor='thread', min_blocks=8):
+        if executor not in ('thread', 'process'):
+            raise Exception("executor should be 'thread' or 'process'", executor)
+        self.cipher = cipher
+        self.workers = workers
+        self.executor = executor
+        self.min_blocks = min_blocks
+        self.nonce_size = cipher.nonce_size
+        self.overhead = cipher.overhead
+        self.pool = None
+        self.pool_lock = threading.Lock()  # client and refill thread of a dummy pool may both need the pool
+
+    def get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                if self.executor == 'thread':
+                    self.pool = ThreadPoolExecutor(self.workers)
+                else:
+                    self.pool = ProcessPoolExecutor(self.workers)
+            return self.pool
+
+    def shards(self, items):
+        shard_size = -(-len(items) // self.workers)
+        return [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+
+    def encrypt(self, plaintext):
+        return self.cipher.encrypt(plaintext)
+
+    def decrypt(self, block_cipher):
+        return self.cipher.decrypt(block_cipher)
+
+    def encrypt_many(self, plaintexts):
+        if len(plaintexts) < self.min_blocks:
+            return self.cipher.encrypt_many(plaintexts)
+        nonces = self.cipher.new_nonces(plaintexts)
+        pool = self.get_pool()
+        if self.executor == 'thread':
+            futures = [pool.submit(self.cipher.encrypt_with_nonces, plaintexts_shard, nonces_shard)
+                       for plaintexts_shard, nonces_shard in zip(self.shards(plaintexts), self.shards(nonces))]
+            return [block_cipher for future in futures for block_cipher in future.result()]
+        futures = [pool.submit(encrypt_shard, self.cipher, [bytes(plaintext) for plaintext in plaintexts_shard],
+                               nonces_shard)
+                   for plaintexts_shard, nonces_shard in zip(self.shards(plaintexts), self.shards(nonces))]
+        return [BlockCipher(data, nonce) for future in futures for data, nonce in future.result()]
+
+    def decrypt_many(self, block_ciphers):
+        if len(block_ciphers) < self.min_blocks:
+            return self.cipher.decrypt_many(block_ciphers)
+        pool = self.get_pool()
+        if self.executor == 'thread':
+            futures = [pool.submit(self.cipher.decrypt_many, shard) for shard in self.shards(block_ciphers)]
+        else:
+            futures = [pool.submit(decrypt_shard, self.cipher,
+                                   [(bytes(block_cipher.cipher), bytes(block_cipher.nonce)) for block_cipher in shard])
+                       for shard in self.shards(block_ciphers)]
+        return [plaintext for future in futures for plaintext in future.result()]
+
+    def close(self):
+        with self.pool_lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+class DummyPool:
+
+    # pool of dummy block ciphers encrypted ahead of time, every cipher is taken at most once,
+    # so each dummy written to server is still a fresh encryption
+    #
+    # encrypt_dummies(count) returns count fresh dummy block ciphers
+    # background: refill the pool by a thread whenever it is below size, otherwise the pool is only
+    # refilled by refill() (e.g. by the application when it is idle)
+    # a take() not served by the pool encrypts the missing dummies at once, hits and misses count dummies
+    def __init__(self, encrypt_dummies, size, background=True, refill_batch=64):
+        self.encrypt_dummies = encrypt_dummies
+        self.size = size
+        self.refill_batch = refill_batch
+        self.ciphers = deque()
+        self.hits = 0
+        self.misses = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = None
+        if background:
+            self.thread = threading.Thread(target=self.refill_forever, daemon=True)
+            self.thread.start()
+
+    def take(self, count):
+        ciphers = []
+        with self.condition:
+            while self.ciphers and len(ciphers) < count:
+                ciphers.append(self.ciphers.popleft())
+            self.hits += len(ciphers)
+            self.misses += count - len(ciphers)
+            self.condition.notify()
+        if len(ciphers) < count:
+            ciphers.extend(self.encrypt_dummies(count - len(ciphers)))
+        return ciphers
+
+    # fill pool up to size, return number of dummies encrypted
+    def refill(self):
+        count = self.size - len(self.ciphers)
+        if count <= 0:
+            return 0
+        ciphers = self.encrypt_dummies(count)
+        with self.condition:
+            self.ciphers.extend(ciphers)
+        return count
+
+    def refill_forever(self):
+        while True:
+            with self.condition:
+                while not self.closed and len(self.ciphers) >= self.size:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                count = min(self.size - len(self.ciphers), self.refill_batch)
+            # encrypt without lock, take() is not blocked
+            ciphers = self.encrypt_dummies(count)
+            with self.condition:
+                self.ciphers.extend(ciphers)
+
+    def hit_rate(self):
+        if self.hits + self.misses == 0:
+            return 0
+        return self.hits / (self.hits + self.misses)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+
+CIPHERS = {
+    'eax': EaxCipher,
+    'ctr': CtrCipher,
+    'gcm': GcmCipher,
+}
+
+
+# cipher is a name in CIPHERS or a cipher object
+# workers: run encrypt_many/decrypt_many of cipher by a pool of workers of executor 'thread' or 'process'
+def create_cipher(cipher, key, workers=None, executor='thread'):
+    if isinstance(cipher, str):
+        if cipher not in CIPHERS:
+            raise Exception("unknown cipher", cipher, "ciphers:", list(CIPHERS))
+        cipher = CIPHERS[cipher](key)
+    if workers:
+        cipher = ParallelCipher(cipher, workers, executor)
+    return cipher
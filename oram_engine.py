@@ -0,0 +1,18 @@
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from ring_oram import RingOramClient, RingOramServer
+
+# engines sharing the read/write client interface, selected by name in configuration
+ENGINES = {
+    'path': (PathOramClient, PathOramServer),
+    'ring': (RingOramClient, RingOramServer),
+}
+
+
+# create client and server of engine, with oram tree initialized with dummy blocks
+def create_oram(engine, level, **kwargs):
+    if engine not in ENGINES:
+        raise Exception("unknown oram engine", engine, "engines:", list(ENGINES))
+    client_class, server_class = ENGINES[engine]
+    client = client_class(level, **kwargs)
+    server = server_class(client.generate_initialize_block(), level)
+    return client, server
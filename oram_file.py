@@ -0,0 +1,149 @@
+import json
+import struct
+
+# lengths in blocks, 4 bytes little endian
+length_format = struct.Struct('<I')
+
+
+class OramFileStore:
+
+    # files of any size over a block client (PathOramClient or RecursivePathOramClient created with unpad=False)
+    #
+    # block = used length + records, record = length + data, so data is never found by removing padding
+    # a file smaller than a block is a record packed with other small files into the open block,
+    # a larger file is split into records filling whole blocks, the rest is packed as a small file
+    #
+    # index {file name: [(block_id, record offset)]} is kept on client, server only sees accesses to blocks
+    # (the number of blocks accessed tells the size of a file in blocks)
+    # a deleted file is removed from the index only, a block is reused when all its records are deleted
+    def __init__(self, client, oram_server, block_size, block_number, batch_size=64):
+        if client.unpad:
+            raise Exception("client of file store should be created with unpad=False")
+        self.client = client
+        self.oram_server = oram_server
+        self.block_size = block_size
+        self.block_number = block_number
+        self.batch_size = batch_size
+        # data of a record filling a whole block
+        self.record_capacity = block_size - 2 * length_format.size
+
+        self.index = dict()  # {file name: [(block_id, record offset)]}
+        self.live_records = dict()  # {block_id: records not deleted}
+        self.free_block_ids = []
+        self.next_block_id = 0
+        self.open_block_id = None  # block small files are packed into
+        self.open_block = None  # used length + records of open block
+
+    def allocate_block(self):
+        if self.free_block_ids:
+            block_id = self.free_block_ids.pop()
+        else:
+            if self.next_block_id >= self.block_number:
+                raise Exception("no block left in file store", "blocks:", self.block_number)
+            block_id = self.next_block_id
+            self.next_block_id += 1
+        self.live_records[block_id] = 0
+        return block_id
+
+    def put_file(self, file_name, data):
+        if file_name in self.index:
+            self.delete_file(file_name)
+        data = memoryview(data)
+        records = []  # (block_id, record offset)
+        blocks = dict()  # {block_id: block data} to write
+
+        start = 0
+        while len(data) - start >= self.record_capacity:
+            block_id = self.allocate_block()
+            record = data[start:start + self.record_capacity]
+            blocks[block_id] = length_format.pack(self.block_size) + length_format.pack(len(record)) + record
+            self.live_records[block_id] += 1
+            records.append((block_id, length_format.size))
+            start += self.record_capacity
+
+        rest = data[start:]
+        if len(rest) or not records:
+            if self.open_block is None or len(self.open_block) + length_format.size + len(rest) > self.block_size:
+                self.open_block_id = self.allocate_block()
+                self.open_block = bytearray(length_format.pack(length_format.size))
+            records.append((self.open_block_id, len(self.open_block)))
+            self.open_block += length_format.pack(len(rest))
+            self.open_block += rest
+            length_format.pack_into(self.open_block, 0, len(self.open_block))
+            self.live_records[self.open_block_id] += 1
+            blocks[self.open_block_id] = bytes(self.open_block)
+
+        self.write_blocks(list(blocks.items()))
+        self.index[file_name] = records
+
+    def get_file(self, file_name):
+        if file_name not in self.index:
+            raise Exception("file not found", file_name)
+        records = self.index[file_name]
+        block_ids = list(dict.fromkeys(block_id for block_id, offset in records))
+        blocks = dict(zip(block_ids, self.read_blocks(block_ids)))
+        data = []
+        for block_id, offset in records:
+            block = blocks[block_id]
+            length = length_format.unpack_from(block, offset)[0]
+            start = offset + length_format.size
+            data.append(block[start:start + length])
+        return b''.join(data)
+
+    def delete_file(self, file_name):
+        if file_name not in self.index:
+            raise Exception("file not found", file_name)
+        for block_id, offset in self.index.pop(file_name):
+            self.live_records[block_id] -= 1
+            if self.live_records[block_id]:
+                continue
+            if block_id == self.open_block_id:
+                # keep open block, start packing from its beginning
+                self.open_block = bytearray(length_format.pack(length_format.size))
+            else:
+                del self.live_records[block_id]
+                self.free_block_ids.append(block_id)
+
+    def __contains__(self, file_name):
+        return file_name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    # blocks in use, a file store needs about (total size of files) / record_capacity blocks
+    def used_blocks(self):
+        return len(self.live_records)
+
+    # items is a list of (block_id, block data)
+    def write_blocks(self, items):
+        for start in range(0, len(items), self.batch_size):
+            self.client.write_many(items[start:start + self.batch_size], self.oram_server)
+
+    def read_blocks(self, block_ids):
+        blocks = []
+        for start in range(0, len(block_ids), self.batch_size):
+            blocks.extend(self.client.read_many(block_ids[start:start + self.batch_size], self.oram_server))
+        return blocks
+
+    def save_index(self, path):
+        state = {
+            'index': self.index,
+            'live_records': list(self.live_records.items()),
+            'free_block_ids': self.free_block_ids,
+            'next_block_id': self.next_block_id,
+            'open_block_id': self.open_block_id,
+            'open_block': None if self.open_block is None else self.open_block.hex(),
+        }
+        with open(path, 'w') as f:
+            json.dump(state, f)
+
+    def load_index(self, path):
+        with open(path) as f:
+            state = json.load(f)
+        self.index = {file_name: [tuple(record) for record in records]
+                      for file_name, records in state['index'].items()}
+        self.live_records = dict(state['live_records'])
+        self.free_block_ids = state['free_block_ids']
+        self.next_block_id = state['next_block_id']
+        self.open_block_id = state['open_block_id']
+        self.open_block = None if state['open_block'] is None else bytearray.fromhex(state['open_block'])
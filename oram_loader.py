@@ -0,0 +1,108 @@
+import json
+import os
+
+# streaming ingestion of files into an oram client
+#
+# files are read lazily (a file is read one block at a time), a file larger than a block is split into
+# several blocks, and blocks are written batch_size at a time with write_many, so at most batch_size blocks
+# are held in memory whatever the size of the dataset
+#
+# manifest {file name: (block ids, file size)} is kept on client, block ids are assigned in order from 0
+# the client is created with unpad=False, blocks are read back whole and cut by the file size recorded in manifest,
+# so files of any bytes (b'\xff' included) are read back as they are
+
+
+# yield (file name, file object) of files in directory in order of name, a file is opened when it is reached
+def iter_directory(directory):
+    for file_name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, file_name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            yield file_name, f
+
+
+# yield data in blocks of block_size, data is bytes or a binary file object
+def split_file(data, block_size):
+    if hasattr(data, 'read'):
+        while True:
+            block_data = data.read(block_size)
+            if not block_data:
+                return
+            yield block_data
+    else:
+        for start in range(0, len(data), block_size):
+            yield data[start:start + block_size]
+
+
+class StreamingLoader:
+
+    # client is PathOramClient or RecursivePathOramClient created with unpad=False,
+    # block_number is the number of block ids of client
+    def __init__(self, client, oram_server, block_size, block_number, batch_size=64):
+        if client.unpad:
+            raise Exception("client of streaming loader should be created with unpad=False")
+        self.client = client
+        self.oram_server = oram_server
+        self.block_size = block_size
+        self.block_number = block_number
+        self.batch_size = batch_size
+        self.manifest = dict()  # {file name: (block ids, file size)}
+        self.next_block_id = 0
+
+    # split files into blocks, yield (block_id, block data) and record them in manifest
+    def iter_blocks(self, files):
+        for file_name, data in files:
+            if file_name in self.manifest:
+                raise Exception("file already loaded", file_name)
+            block_ids = []
+            file_size = 0
+            for block_data in split_file(data, self.block_size):
+                if self.next_block_id >= self.block_number:
+                    raise Exception("no block left for file", file_name, "blocks:", self.block_number)
+                block_ids.append(self.next_block_id)
+                file_size += len(block_data)
+                yield self.next_block_id, block_data
+                self.next_block_id += 1
+            self.manifest[file_name] = (block_ids, file_size)
+
+    # files is an iterable of (file name, data), data is bytes or a binary file object
+    def load(self, files):
+        batch = []
+        for block_id, block_data in self.iter_blocks(files):
+            batch.append((block_id, block_data))
+            if len(batch) == self.batch_size:
+                self.client.write_many(batch, self.oram_server)
+                batch = []
+        if batch:
+            self.client.write_many(batch, self.oram_server)
+
+    def load_directory(self, directory):
+        self.load(iter_directory(directory))
+
+    # load files into a server created with empty storage through bulk_load of client, which keeps the blocks on
+    # client until all are placed (unlike load, memory of the whole dataset), see README
+    def bulk_load(self, files):
+        self.client.bulk_load(self.iter_blocks(files), self.oram_server)
+
+    def read_file(self, file_name):
+        if file_name not in self.manifest:
+            raise Exception("file not loaded", file_name)
+        block_ids, file_size = self.manifest[file_name]
+        data = []
+        for start in range(0, len(block_ids), self.batch_size):
+            data.extend(self.client.read_many(block_ids[start:start + self.batch_size], self.oram_server))
+        # a block read is the whole padded block of client, keep block_size bytes of it, up to file size
+        return b''.join(block_data[:min(self.block_size, file_size - i * self.block_size)]
+                        for i, block_data in enumerate(data))
+
+    def save_manifest(self, path):
+        with open(path, 'w') as f:
+            json.dump({'next_block_id': self.next_block_id, 'manifest': self.manifest}, f)
+
+    def load_manifest(self, path):
+        with open(path) as f:
+            state = json.load(f)
+        self.next_block_id = state['next_block_id']
+        self.manifest = {file_name: (block_ids, file_size)
+                         for file_name, (block_ids, file_size) in state['manifest'].items()}
@@ -0,0 +1,131 @@
+from time import perf_counter
+
+# instrumentation of clients and servers, pass metrics=OramMetrics() to record, default is null_metrics which does
+# nothing, so an access without metrics only pays for a few empty calls
+#
+# phase: time of a part of an access, 'position_lookup', 'path_read', 'decrypt', 'stash_merge', 'eviction',
+#        'encrypt', 'write_back' on clients, name of the method ('read_path', ...) on servers
+# count: counters, 'bytes_read', 'bytes_written', 'blocks_read', 'blocks_written', 'accesses' on clients,
+#        'server_blocks_read', 'server_blocks_written' on servers
+# gauge: last value, 'stash_size', 'recursion_depth'
+# every value has a level, the recursive level of recursive path oram (0 otherwise)
+
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+null_phase = NullPhase()
+
+
+class NullMetrics:
+    enabled = False
+
+    def phase(self, name, level=0):
+        return null_phase
+
+    def count(self, name, value=1, level=0):
+        pass
+
+    def gauge(self, name, value, level=0):
+        pass
+
+
+null_metrics = NullMetrics()
+
+
+class Phase:
+    __slots__ = ('metrics', 'name', 'level', 'start')
+
+    def __init__(self, metrics, name, level):
+        self.metrics = metrics
+        self.name = name
+        self.level = level
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record_phase(self.name, perf_counter() - self.start, self.level)
+        return False
+
+
+class OramMetrics:
+    enabled = True
+
+    # callbacks are called with (kind, name, value, level) for every value recorded, kind is 'phase' (value is
+    # seconds), 'count' or 'gauge'
+    def __init__(self, callbacks=()):
+        self.callbacks = list(callbacks)
+        self.phase_seconds = dict()  # {(name, level): total seconds}
+        self.phase_calls = dict()  # {(name, level): number of calls}
+        self.counters = dict()  # {(name, level): total}
+        self.gauges = dict()  # {(name, level): last value}
+
+    def phase(self, name, level=0):
+        return Phase(self, name, level)
+
+    def record_phase(self, name, seconds, level=0):
+        key = (name, level)
+        self.phase_seconds[key] = self.phase_seconds.get(key, 0) + seconds
+        self.phase_calls[key] = self.phase_calls.get(key, 0) + 1
+        for callback in self.callbacks:
+            callback('phase', name, seconds, level)
+
+    def count(self, name, value=1, level=0):
+        key = (name, level)
+        self.counters[key] = self.counters.get(key, 0) + value
+        for callback in self.callbacks:
+            callback('count', name, value, level)
+
+    def gauge(self, name, value, level=0):
+        self.gauges[(name, level)] = value
+        for callback in self.callbacks:
+            callback('gauge', name, value, level)
+
+    def reset(self):
+        self.phase_seconds.clear()
+        self.phase_calls.clear()
+        self.counters.clear()
+        self.gauges.clear()
+
+    # {phase name: total seconds} summed over levels (or of level), sorted by time, to find the phase that dominates
+    # position_lookup of recursive path oram includes the phases of levels below, compare phases of one level
+    def phase_report(self, level=None):
+        report = dict()
+        for (name, phase_level), seconds in self.phase_seconds.items():
+            if level is None or phase_level == level:
+                report[name] = report.get(name, 0) + seconds
+        return dict(sorted(report.items(), key=lambda item: item[1], reverse=True))
+
+    # metrics in prometheus text exposition format
+    def prometheus_text(self, prefix='oram'):
+        lines = []
+        if self.phase_seconds:
+            lines.append('# TYPE %s_phase_seconds_total counter' % prefix)
+            for (name, level), seconds in sorted(self.phase_seconds.items()):
+                lines.append('%s_phase_seconds_total{phase="%s",level="%d"} %r' % (prefix, name, level, seconds))
+            lines.append('# TYPE %s_phase_calls_total counter' % prefix)
+            for (name, level), calls in sorted(self.phase_calls.items()):
+                lines.append('%s_phase_calls_total{phase="%s",level="%d"} %d' % (prefix, name, level, calls))
+        for name in sorted(set(name for name, level in self.counters)):
+            lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+            for (counter_name, level), value in sorted(self.counters.items()):
+                if counter_name == name:
+                    lines.append('%s_%s_total{level="%d"} %r' % (prefix, name, level, value))
+        for name in sorted(set(name for name, level in self.gauges)):
+            lines.append('# TYPE %s_%s gauge' % (prefix, name))
+            for (gauge_name, level), value in sorted(self.gauges.items()):
+                if gauge_name == name:
+                    lines.append('%s_%s{level="%d"} %r' % (prefix, name, level, value))
+        return '\n'.join(lines) + '\n'
+
+
+# bytes of nonces and ciphers of blocks
+def blocks_bytes(blocks_cipher):
+    return sum(len(block_cipher.cipher) + len(block_cipher.nonce) for block_cipher in blocks_cipher)
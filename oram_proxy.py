@@ -0,0 +1,278 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from random import randrange
+from oram_tree import bucket_index
+
+# trusted proxy sharing one oram client between many threads or asyncio tasks
+#
+# requests (read / write of a block) are queued, a dispatcher thread takes up to max_batch of them at once (waiting
+# at most batch_wait seconds for more after the first) and runs them as one access_batch of the client, so the paths
+# of distinct leaves are read in one call and written back in one call instead of one path round trip per request.
+# Requests for the same block in a batch are merged into one op: a write if any of them writes (with the last data),
+# a read otherwise, and each request gets the data of the block at its place in the batch.
+# Write backs go through WriteBackQueue, the paths of the next batch are read while the write back of the previous one
+# is in flight, and a batch is answered once its write backs are on server (or fails with the error of a failed one).
+#
+# the server sees one access_batch per batch, of the number of distinct blocks of the batch, with pad_batches the
+# batch is padded to max_batch with reads of random blocks (block_number blocks), so it only sees timing of batches
+
+
+class Request:
+    __slots__ = ('op', 'block_id', 'block_data', 'future')
+
+    def __init__(self, op, block_id, block_data):
+        self.op = op
+        self.block_id = block_id
+        self.block_data = block_data
+        self.future = Future()
+
+
+# wrapper of oram server, write methods are queued and sent in order by a writer thread
+# buckets of queued write_buckets / write_path are kept until written, so read_paths / read_path of the next batch
+# are sent at once, while the write back is in flight, and buckets still queued replace those read from server
+# (a bucket is dropped only once written and the buckets kept are taken before a read is sent, so a read never misses
+# a queued write)
+# other reads, and reads while a write of other methods (write_blocks ...) is queued, wait for queued writes
+# recursive: server methods take recursive level after their first two arguments (RecursivePathOramServer)
+# after_writes(callback) queues callback(error) called once the writes queued before it are done
+# the first write failing stops the queue for good: writes queued after it are dropped (not applied to a server
+# missing an earlier write back), their callbacks get the error, and every later call is refused. Blocks of the
+# failed write were evicted from stash already, so the client no longer matches the server, its state should be
+# restored (oram_state) against the tree and a new queue created
+class WriteBackQueue:
+    def __init__(self, oram_server, recursive=False):
+        self.oram_server = oram_server
+        self.recursive = recursive
+        self.queue = queue.Queue()
+        self.error = None
+        self.lock = threading.Lock()
+        self.pending = dict()  # {(recursive level, bucket_index): (write number, blocks)} of queued writes
+        self.write_number = 0
+        self.opaque_writes = 0  # queued writes whose buckets are not kept
+        self.thread = threading.Thread(target=self.write_forever, daemon=True)
+        self.thread.start()
+
+    def write_forever(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                method, args, number, keys = item
+                if method is None:
+                    args(self.error)
+                elif self.error is None:
+                    getattr(self.oram_server, method)(*args)
+            except Exception as e:
+                if method is not None:
+                    self.error = e
+            finally:
+                if item is not None and method is not None:
+                    with self.lock:
+                        if keys is None:
+                            self.opaque_writes -= 1
+                        for key in keys or ():
+                            if self.pending[key][0] == number:
+                                del self.pending[key]
+                self.queue.task_done()
+
+    def check_error(self):
+        if self.error is not None:
+            raise Exception("write back failed, client state should be restored against server", self.error)
+
+    # wait for queued writes
+    def flush(self):
+        self.queue.join()
+        self.check_error()
+
+    def after_writes(self, callback):
+        self.queue.put((None, callback, None, None))
+
+    # (recursive level, start_level) of arguments of a path method after positions (and buckets for a write)
+    def path_arguments(self, args):
+        if self.recursive:
+            return args[0], args[1] if len(args) > 1 else 0
+        return None, args[0] if args else 0
+
+    # {(recursive level, bucket_index): blocks} written by a write method, None if its buckets are not kept
+    def written_buckets(self, method, args):
+        if method == 'write_buckets':
+            recursive_level = args[1] if self.recursive else None
+            return {(recursive_level, index): blocks for index, blocks in args[0].items()}
+        if method == 'write_path':
+            recursive_level, start_level = self.path_arguments(args[2:])
+            tree_level = start_level + len(args[1]) - 1
+            return {(recursive_level, bucket_index(args[0], start_level + i, tree_level)): blocks
+                    for i, blocks in enumerate(args[1])}
+        return None
+
+    def write(self, method, args):
+        self.check_error()
+        buckets = self.written_buckets(method, args)
+        with self.lock:
+            self.write_number += 1
+            if buckets is None:
+                self.opaque_writes += 1
+            else:
+                for key, blocks in buckets.items():
+                    self.pending[key] = (self.write_number, blocks)
+            self.queue.put((method, args, self.write_number, None if buckets is None else list(buckets)))
+
+    # buckets kept are taken before the read is sent, a bucket written after that was taken already
+    def read(self, method, args):
+        self.check_error()
+        with self.lock:
+            pending = None if self.opaque_writes else dict(self.pending)
+        if pending is None:
+            self.flush()
+        result = getattr(self.oram_server, method)(*args)
+        if not pending:
+            return result
+        recursive_level, start_level = self.path_arguments(args[1:])
+        if method == 'read_paths':
+            for index in result:
+                if (recursive_level, index) in pending:
+                    result[index] = pending[recursive_level, index][1]
+            return result
+        tree_level = start_level + len(result) - 1
+        buckets = list(result)
+        for i in range(len(buckets)):
+            key = (recursive_level, bucket_index(args[0], start_level + i, tree_level))
+            if key in pending:
+                buckets[i] = pending[key][1]
+        return buckets
+
+    def __getattr__(self, method):
+        if method.startswith('write'):
+            return lambda *args: self.write(method, args)
+        if method in ('read_paths', 'read_path'):
+            return lambda *args: self.read(method, args)
+
+        def call(*args):
+            self.flush()
+            return getattr(self.oram_server, method)(*args)
+
+        return call
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class OramProxy:
+
+    # client is PathOramClient or RecursivePathOramClient (anything with access_batch), oram_server is the server
+    # object or OramServerProxy, block_number is the number of block ids (needed by pad_batches only)
+    def __init__(self, client, oram_server, max_batch=32, batch_wait=0.001, pad_batches=False, block_number=None):
+        if pad_batches and block_number is None:
+            raise Exception("block_number is needed to pad batches")
+        self.client = client
+        self.write_back_queue = WriteBackQueue(oram_server, recursive=hasattr(client, 'levels'))
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.pad_batches = pad_batches
+        self.block_number = block_number
+        self.requests = queue.Queue()
+        self.closed = False
+        self.batches = 0
+        self.request_count = 0
+        self.merged = 0  # requests merged into an op of another request for the same block
+        self.thread = threading.Thread(target=self.dispatch_forever, daemon=True)
+        self.thread.start()
+
+    # queue a request, return a concurrent.futures.Future of data read (data before the write for a write)
+    def submit(self, op, block_id, block_data=None):
+        if op not in ('read', 'write'):
+            raise Exception("op should be 'read' or 'write'", op)
+        if self.closed:
+            raise Exception("oram proxy is closed")
+        request = Request(op, block_id, block_data)
+        self.requests.put(request)
+        return request.future
+
+    def read(self, block_id):
+        return self.submit('read', block_id).result()
+
+    def write(self, block_id, block_data):
+        return self.submit('write', block_id, block_data).result()
+
+    async def read_async(self, block_id):
+        return await asyncio.wrap_future(self.submit('read', block_id))
+
+    async def write_async(self, block_id, block_data):
+        return await asyncio.wrap_future(self.submit('write', block_id, block_data))
+
+    def dispatch_forever(self):
+        while True:
+            requests = self.next_batch()
+            if requests:
+                self.execute(requests)
+            if self.closed and self.requests.empty():
+                return
+
+    # wait for a request, then take requests until max_batch or batch_wait passed, None marks close
+    def next_batch(self):
+        requests = []
+        request = self.requests.get()
+        deadline = time.perf_counter() + self.batch_wait
+        while True:
+            if request is not None:
+                requests.append(request)
+            if len(requests) >= self.max_batch:
+                return requests
+            try:
+                request = self.requests.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                return requests
+
+    def execute(self, requests):
+        groups = dict()  # {block_id: requests in order}
+        for request in requests:
+            groups.setdefault(request.block_id, []).append(request)
+        ops = []
+        for block_id, group in groups.items():
+            write_data = [request.block_data for request in group if request.op == 'write']
+            if write_data:
+                ops.append(('write', block_id, write_data[-1]))
+            else:
+                ops.append(('read', block_id, None))
+        if self.pad_batches:
+            ops.extend(('read', randrange(self.block_number), None) for i in range(self.max_batch - len(ops)))
+
+        # paths are read while the write back of previous batch is in flight, a failed one refuses the batch
+        try:
+            self.write_back_queue.check_error()
+            results = self.client.access_batch(ops, self.write_back_queue)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        self.batches += 1
+        self.request_count += len(requests)
+        self.merged += len(requests) - len(groups)
+        # answered once write backs of the batch are on server, with the error if one of them fails
+        self.write_back_queue.after_writes(lambda error: self.answer(groups, results, error))
+
+    def answer(self, groups, results, error):
+        for group, data in zip(groups.values(), results):
+            for request in group:
+                if error is not None:
+                    request.future.set_exception(error)
+                    continue
+                request.future.set_result(data)
+                if request.op == 'write':
+                    data = request.block_data
+
+    # answer queued requests, wait for write backs and stop dispatcher, requests submitted after close are refused
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.requests.put(None)
+            self.thread.join()
+        try:
+            self.write_back_queue.flush()
+        finally:
+            self.write_back_queue.close()
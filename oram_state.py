@@ -0,0 +1,398 @@
+import os
+import struct
+import sys
+from array import array
+from Crypto.Cipher import AES
+from oram_tree import BlockPlaintext
+from oram_cipher import CtrCipher, GcmCipher, ParallelCipher
+
+# client state (position map, stash, treetop cache, position block caches, eviction counters and nonce counter of
+# cipher) of PathOramClient and RecursivePathOramClient saved to a compact binary file, so a client restarted
+# against a saved server tree (server.save, or 'mmap' storage) goes on without a new initialization
+#
+#   save_client_state(client, path, key)    load_client_state(client, path, key)
+#
+# the client is restored into a client created with the same parameters (levels, Z, block size, cipher)
+# state must be saved after the accesses it covers are written back to server, a state older than the server tree
+# loses the blocks moved since
+#
+# file = header (magic, version, flags) + body, with flag encrypted body = nonce + tag + AES GCM of body under key
+# (the file holds decrypted blocks, it should be encrypted unless stored by the client only)
+# body = sequence, levels, cipher state, position map, state of each recursive level, eviction counters
+#   position map = count + positions of block ids 0 .. count - 1 as array of 4 bytes little endian integers
+#   blocks (stash, bucket of treetop) = count + (block_id, position, length) + data for each block
+#   stash = blocks + removed block ids, position cache = count + (block_id, length) + data + removed block ids
+#   removed block ids = count + block ids as 8 bytes little endian integers, always empty in a snapshot
+#
+# ClientStateLog keeps a snapshot and a log appended with the changes of each access (position map entries, stash
+# blocks put or removed, treetop buckets, position cache blocks), so the whole state is only written again when the
+# log is compacted
+header_format = struct.Struct('<4sBB')
+count_format = struct.Struct('<I')
+sequence_format = struct.Struct('<Q')
+block_format = struct.Struct('<QII')  # block_id, position, length of data
+cache_block_format = struct.Struct('<QI')  # block_id, length of data
+cipher_format = struct.Struct('<8sQ')  # nonce prefix, nonce counter
+counters_format = struct.Struct('<QQQ')  # access_count, eviction_count, number of drained buckets
+version = 2
+flag_encrypted = 1
+state_magic = b'ORCS'
+log_magic = b'ORCL'
+# nonce counters restored are moved forward by nonce_gap, nonces used after the state was saved are never reused
+nonce_gap = pow(2, 32)
+
+
+# positions of block ids 0 .. n - 1 as little endian 4 bytes integers
+def encode_positions(positions):
+    positions = array('I', positions)
+    if sys.byteorder == 'big':
+        positions.byteswap()
+    return positions.tobytes()
+
+
+def decode_positions(data):
+    positions = array('I')
+    positions.frombytes(data)
+    if sys.byteorder == 'big':
+        positions.byteswap()
+    return positions
+
+
+class StateReader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, struct_format):
+        values = struct_format.unpack_from(self.data, self.offset)
+        self.offset += struct_format.size
+        return values
+
+    def count(self):
+        return self.unpack(count_format)[0]
+
+    def take(self, size):
+        if self.offset + size > len(self.data):
+            raise Exception("client state is truncated")
+        data = bytes(self.data[self.offset:self.offset + size])
+        self.offset += size
+        return data
+
+    def block_ids(self):
+        count = self.count()
+        block_ids = struct.unpack_from('<%dQ' % count, self.data, self.offset)
+        self.offset += 8 * count
+        return block_ids
+
+    def blocks(self):
+        blocks = []
+        for i in range(self.count()):
+            block_id, position, length = self.unpack(block_format)
+            blocks.append((BlockPlaintext(block_id, self.take(length)), position))
+        return blocks
+
+
+def pack_blocks(parts, blocks):
+    parts.append(count_format.pack(len(blocks)))
+    for block, position in blocks:
+        parts.append(block_format.pack(block.block_id, position, len(block.data)))
+        parts.append(bytes(block.data))
+
+
+def pack_block_ids(parts, block_ids):
+    parts.append(count_format.pack(len(block_ids)))
+    parts.append(struct.pack('<%dQ' % len(block_ids), *block_ids))
+
+
+# (present, removed) of block ids changed since last record, blocks in their order, all blocks present in a snapshot
+def split_changed(blocks, changed, full):
+    if full:
+        return list(blocks), []
+    present = [block_id for block_id in blocks if block_id in changed]
+    removed = sorted(block_id for block_id in changed if block_id not in blocks)
+    return present, removed
+
+
+# (stash, treetop, position cache or None, stash policy or None) of each recursive level of client
+def client_levels(client):
+    if isinstance(client.stash, list):
+        policies = client.stash_policies or [None] * len(client.stash)
+        return list(zip(client.stash, client.treetop, client.position_caches, policies))
+    return [(client.stash, client.treetop, None, client.stash_policy)]
+
+
+def client_tree_levels(client):
+    return getattr(client, 'levels', None) or [client.level]
+
+
+def base_cipher(client):
+    cipher = client.cipher
+    return cipher.cipher if isinstance(cipher, ParallelCipher) else cipher
+
+
+def pack_cipher(cipher):
+    if isinstance(cipher, GcmCipher):
+        return cipher_format.pack(cipher.prefix, cipher.counter)
+    if isinstance(cipher, CtrCipher):
+        return cipher_format.pack(bytes(8), cipher.counter)
+    return cipher_format.pack(bytes(8), 0)
+
+
+def unpack_cipher(cipher, prefix, counter):
+    if isinstance(cipher, (CtrCipher, GcmCipher)):
+        with cipher.lock:
+            if isinstance(cipher, GcmCipher):
+                cipher.prefix = prefix
+            cipher.counter = (counter + nonce_gap) % pow(2, 64)
+
+
+# full: whole state, otherwise position map entries, stash blocks, treetop buckets and position cache blocks changed
+# since last record (changed of position map, stashes, treetops and position caches), as a record of the log
+def pack_state(client, sequence, full):
+    levels = client_tree_levels(client)
+    parts = [sequence_format.pack(sequence), count_format.pack(len(levels))]
+    parts.extend(count_format.pack(level) for level in levels)
+    parts.append(pack_cipher(base_cipher(client)))
+
+    position_map = client.position_map
+    if full:
+        parts.append(count_format.pack(len(position_map)))
+        parts.append(encode_positions(position_map.positions))
+    else:
+        block_ids = sorted(position_map.changed)
+        parts.append(count_format.pack(len(block_ids)))
+        parts.append(encode_positions(block_ids))
+        parts.append(encode_positions(map(position_map.__getitem__, block_ids)))
+
+    for stash, treetop, position_cache, stash_policy in client_levels(client):
+        present, removed = split_changed(stash, stash.changed, full)
+        pack_blocks(parts, [(stash[block_id], stash.get_position(block_id)) for block_id in present])
+        pack_block_ids(parts, removed)
+        indexes = sorted(treetop.buckets if full else treetop.changed)
+        parts.append(count_format.pack(len(indexes)))
+        for index in indexes:
+            parts.append(count_format.pack(index))
+            pack_blocks(parts, treetop.buckets.get(index, []))
+        # blocks used since last record are the most recently used ones, in order of use
+        present, removed = [], []
+        if position_cache is not None:
+            present, removed = split_changed(position_cache.blocks, position_cache.changed, full)
+        parts.append(count_format.pack(len(present)))
+        for block_id in present:
+            data = position_cache.blocks[block_id]
+            parts.append(cache_block_format.pack(block_id, len(data)))
+            parts.append(bytes(data))
+        pack_block_ids(parts, removed)
+        parts.append(sequence_format.pack(0 if stash_policy is None else stash_policy.eviction_count))
+
+    drained_buckets = sorted(getattr(client, 'drained_buckets', ()))
+    parts.append(counters_format.pack(getattr(client, 'access_count', 0), getattr(client, 'eviction_count', 0),
+                                      len(drained_buckets)))
+    parts.append(encode_positions(drained_buckets))
+    return b''.join(parts)
+
+
+# apply state (pack_state) to client, return sequence of state
+def unpack_state(client, data, full):
+    reader = StateReader(data)
+    sequence = reader.unpack(sequence_format)[0]
+    levels = [reader.count() for i in range(reader.count())]
+    if levels != client_tree_levels(client):
+        raise Exception("client state does not match client", "levels of state:", levels,
+                        "levels of client:", client_tree_levels(client))
+    unpack_cipher(base_cipher(client), *reader.unpack(cipher_format))
+
+    count = reader.count()
+    if full:
+        client.position_map.fill(decode_positions(reader.take(4 * count)))
+    else:
+        block_ids = decode_positions(reader.take(4 * count))
+        positions = decode_positions(reader.take(4 * count))
+        for block_id, position in zip(block_ids, positions):
+            client.position_map[block_id] = position
+
+    for stash, treetop, position_cache, stash_policy in client_levels(client):
+        if full:
+            for block_id in list(stash):
+                stash.remove(block_id)
+        blocks = reader.blocks()
+        for block_id in reader.block_ids():
+            if block_id in stash:
+                stash.remove(block_id)
+        for block, position in blocks:
+            stash.put(block, position)
+        if full:
+            treetop.buckets.clear()
+        for i in range(reader.count()):
+            index = reader.count()
+            blocks = reader.blocks()
+            if blocks:
+                treetop.buckets[index] = blocks
+            else:
+                treetop.buckets.pop(index, None)
+        cached_blocks = []
+        for i in range(reader.count()):
+            block_id, length = reader.unpack(cache_block_format)
+            cached_blocks.append((block_id, reader.take(length)))
+        removed = reader.block_ids()
+        if position_cache is not None:
+            if full:
+                position_cache.blocks.clear()
+            for block_id in removed:
+                position_cache.blocks.pop(block_id, None)
+            for block_id, data in cached_blocks:
+                position_cache.blocks[block_id] = data
+                position_cache.blocks.move_to_end(block_id)
+        policy_eviction_count = reader.unpack(sequence_format)[0]
+        if stash_policy is not None:
+            stash_policy.eviction_count = policy_eviction_count
+
+    access_count, eviction_count, drained_number = reader.unpack(counters_format)
+    drained_buckets = decode_positions(reader.take(4 * drained_number))
+    if hasattr(client, 'drained_buckets'):
+        client.access_count = access_count
+        client.eviction_count = eviction_count
+        client.drained_buckets = set(drained_buckets)
+    return sequence
+
+
+# body encrypted with AES GCM under key, nonce + tag + cipher
+def seal(data, key):
+    if key is None:
+        return data
+    nonce = os.urandom(12)
+    cipher, tag = AES.new(key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(data)
+    return nonce + tag + cipher
+
+
+def unseal(data, key):
+    if key is None:
+        return data
+    data = memoryview(data)
+    try:
+        return AES.new(key, AES.MODE_GCM, nonce=data[:12]).decrypt_and_verify(data[28:], data[12:28])
+    except ValueError:
+        raise Exception("client state fails authentication")
+
+
+def read_header(data, magic, key, path):
+    if len(data) < header_format.size:
+        raise Exception("not a client state file", path)
+    file_magic, file_version, flags = header_format.unpack_from(data)
+    if file_magic != magic:
+        raise Exception("not a client state file", path)
+    if file_version != version:
+        raise Exception("unsupported version of client state", file_version)
+    if bool(flags & flag_encrypted) != (key is not None):
+        raise Exception("client state is encrypted" if key is None else "client state is not encrypted", path)
+
+
+# key: AES key (16, 24 or 32 bytes) encrypting the file, None saves it in plain
+# sequence: last record of the log covered by this state (see ClientStateLog)
+# written to path.tmp then moved to path, a crash leaves the previous state
+def save_client_state(client, path, key=None, sequence=0):
+    data = seal(pack_state(client, sequence, True), key)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header_format.pack(state_magic, version, 0 if key is None else flag_encrypted))
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+# restore state saved at path into client, return sequence of state
+def load_client_state(client, path, key=None):
+    with open(path, 'rb') as f:
+        data = f.read()
+    read_header(data, state_magic, key, path)
+    return unpack_state(client, unseal(memoryview(data)[header_format.size:], key), True)
+
+
+class ClientStateLog:
+
+    # snapshot of client state at path (save_client_state) and log of changes at path.log
+    # append() after accesses writes a record of what they changed: position map entries, stash blocks put or removed,
+    # treetop buckets, position cache blocks and counters, a few blocks instead of the whole state
+    # when the log is larger than compact_size, a new snapshot is written and the log starts again
+    # restore() loads the snapshot and replays records of the log newer than it, a record cut by a crash is dropped
+    # sync: fsync the log after every record, otherwise records of the last moments may be lost with the machine
+    #
+    #   log = ClientStateLog(client, path, key)
+    #   log.restore() if os.path.exists(path) else log.snapshot()
+    #   ... accesses ... log.append()
+    def __init__(self, client, path, key=None, compact_size=64 * 1024 * 1024, sync=False):
+        self.client = client
+        self.path = path
+        self.log_path = path + '.log'
+        self.key = key
+        self.compact_size = compact_size
+        self.sync = sync
+        self.sequence = 0  # sequence of last record
+        self.log_file = None
+        self.records = 0  # records in log
+
+    # record changes from now on
+    def track_changes(self):
+        self.client.position_map.changed = set()
+        for stash, treetop, position_cache, stash_policy in client_levels(self.client):
+            stash.changed = set()
+            treetop.changed.clear()
+            if position_cache is not None:
+                position_cache.changed = set()
+
+    def open_log(self):
+        if self.log_file is not None:
+            self.log_file.close()
+        self.log_file = open(self.log_path, 'wb')
+        self.log_file.write(header_format.pack(log_magic, version, 0 if self.key is None else flag_encrypted))
+        self.log_file.flush()
+        self.records = 0
+
+    # write full state and start an empty log
+    def snapshot(self):
+        save_client_state(self.client, self.path, self.key, self.sequence)
+        self.open_log()
+        self.track_changes()
+
+    def append(self):
+        self.sequence += 1
+        data = seal(pack_state(self.client, self.sequence, False), self.key)
+        self.log_file.write(count_format.pack(len(data)))
+        self.log_file.write(data)
+        self.log_file.flush()
+        if self.sync:
+            os.fsync(self.log_file.fileno())
+        self.records += 1
+        self.track_changes()
+        if self.log_file.tell() > self.compact_size:
+            self.snapshot()
+
+    # load snapshot and replay log, return number of records replayed
+    def restore(self):
+        self.sequence = load_client_state(self.client, self.path, self.key)
+        replayed = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                data = f.read()
+            read_header(data, log_magic, self.key, self.log_path)
+            offset = header_format.size
+            while offset + count_format.size <= len(data):
+                size = count_format.unpack_from(data, offset)[0]
+                if offset + count_format.size + size > len(data):
+                    break  # cut by a crash
+                record = unseal(memoryview(data)[offset + count_format.size:offset + count_format.size + size],
+                                self.key)
+                offset += count_format.size + size
+                # records older than snapshot are skipped (a crash between snapshot and new log)
+                if sequence_format.unpack_from(record)[0] <= self.sequence:
+                    continue
+                self.sequence = unpack_state(self.client, record, False)
+                replayed += 1
+        # state replayed becomes the new snapshot
+        self.snapshot()
+        return replayed
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
@@ -0,0 +1,292 @@
+import asyncio
+import struct
+import threading
+from oram_tree import BlockCipher
+
+# asyncio transport between oram client and server over tcp or unix socket
+#
+# frame = header + payload, header = (request_id, kind, payload length)
+# request payload = [method name, [args]], response payload = result, or error message if kind is error
+# requests on a connection are executed in order, so a read sent after a write always sees the write,
+# and a client could send the next request without waiting for the response of previous one (pipelining)
+frame_header = struct.Struct('<IBI')
+REQUEST = 0
+RESPONSE = 1
+ERROR = 2
+
+# server methods callable from client
+SERVER_METHODS = {'read', 'write_bucket', 'read_path', 'write_path', 'read_paths', 'write_buckets', 'write_blocks',
+                  'read_metadata', 'write_metadata', 'read_blocks'}
+
+# compact binary encoding of arguments and results of server methods
+int_format = struct.Struct('<q')
+length_format = struct.Struct('<I')
+
+
+def encode(value, out):
+    if value is None:
+        out.append(b'N')
+    elif isinstance(value, bool):
+        out.append(b'T' if value else b'F')
+    elif isinstance(value, int):
+        out.append(b'I')
+        out.append(int_format.pack(value))
+    elif isinstance(value, str):
+        data = value.encode()
+        out.append(b'S')
+        out.append(length_format.pack(len(data)))
+        out.append(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out.append(b'B')
+        out.append(length_format.pack(len(value)))
+        out.append(value)
+    elif isinstance(value, BlockCipher):
+        out.append(b'C')
+        out.append(length_format.pack(len(value.nonce)))
+        out.append(value.nonce)
+        out.append(length_format.pack(len(value.cipher)))
+        out.append(value.cipher)
+    elif isinstance(value, (list, tuple, set)):
+        out.append(b'L')
+        out.append(length_format.pack(len(value)))
+        for item in value:
+            encode(item, out)
+    elif isinstance(value, dict):
+        out.append(b'D')
+        out.append(length_format.pack(len(value)))
+        for key in value:
+            encode(key, out)
+            encode(value[key], out)
+    else:
+        raise Exception("type can not be encoded", type(value))
+
+
+# decode value at offset of data (a memoryview), bytes and ciphers are views of data, or copies with copy
+# (a value kept after the frame, e.g. a cipher stored by server, would keep the whole frame alive as a view)
+# return (value, offset after value)
+def decode(data, offset=0, copy=False):
+    tag = data[offset]
+    offset += 1
+    if tag == ord('N'):
+        return None, offset
+    if tag == ord('T'):
+        return True, offset
+    if tag == ord('F'):
+        return False, offset
+    if tag == ord('I'):
+        return int_format.unpack_from(data, offset)[0], offset + int_format.size
+    length = length_format.unpack_from(data, offset)[0]
+    offset += length_format.size
+    if tag == ord('S'):
+        return bytes(data[offset:offset + length]).decode(), offset + length
+    if tag == ord('B'):
+        value = data[offset:offset + length]
+        return bytes(value) if copy else value, offset + length
+    if tag == ord('C'):
+        nonce = data[offset:offset + length]
+        offset += length
+        cipher_length = length_format.unpack_from(data, offset)[0]
+        offset += length_format.size
+        cipher = data[offset:offset + cipher_length]
+        if copy:
+            nonce, cipher = bytes(nonce), bytes(cipher)
+        return BlockCipher(cipher, nonce), offset + cipher_length
+    if tag == ord('L'):
+        items = []
+        for i in range(length):
+            item, offset = decode(data, offset, copy)
+            items.append(item)
+        return items, offset
+    if tag == ord('D'):
+        items = dict()
+        for i in range(length):
+            key, offset = decode(data, offset, copy)
+            items[key], offset = decode(data, offset, copy)
+        return items, offset
+    raise Exception("unknown tag", tag)
+
+
+def encode_frame(request_id, kind, value):
+    out = []
+    encode(value, out)
+    payload = b''.join(out)
+    return frame_header.pack(request_id, kind, len(payload)) + payload
+
+
+# copy: values copied out of the frame, for requests whose ciphers are stored by server
+async def read_frame(reader, copy=False):
+    request_id, kind, length = frame_header.unpack(await reader.readexactly(frame_header.size))
+    payload = memoryview(await reader.readexactly(length))
+    value, offset = decode(payload, copy=copy)
+    return request_id, kind, value
+
+
+class OramTransportServer:
+
+    # serve methods of oram_server (PathOramServer, RecursivePathOramServer, RingOramServer ...)
+    def __init__(self, oram_server, methods=SERVER_METHODS):
+        self.oram_server = oram_server
+        self.methods = methods
+        self.server = None
+        self.loop = None
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                # arguments of write methods are stored by server, responses read by client stay views
+                request_id, kind, (method, args) = await read_frame(reader, copy=True)
+                if method not in self.methods:
+                    writer.write(encode_frame(request_id, ERROR, "unknown method " + method))
+                    continue
+                try:
+                    result = getattr(self.oram_server, method)(*args)
+                    writer.write(encode_frame(request_id, RESPONSE, result))
+                except Exception as e:
+                    writer.write(encode_frame(request_id, ERROR, repr(e)))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    # listen on tcp (host, port), or unix socket if path is given, return address listened
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path=path)
+            return path
+        self.server = await asyncio.start_server(self.handle, host=host, port=port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    # run server in a thread with its own event loop, return address listened
+    def start_in_thread(self, host='127.0.0.1', port=0, path=None):
+        self.loop = asyncio.new_event_loop()
+        address = self.loop.run_until_complete(self.start(host, port, path))
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return address
+
+    def stop(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class AsyncOramServerProxy:
+
+    # async proxy of oram server, proxy.<method>(*args) is a coroutine returning result of server method
+    # send(method, *args) returns a future without waiting, several requests could be in flight at once
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.request_id = 0
+        self.pending = dict()  # {request_id: future}
+        self.receive_task = None
+
+    async def connect(self, host='127.0.0.1', port=None, path=None):
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.receive_task = asyncio.get_running_loop().create_task(self.receive())
+
+    async def receive(self):
+        try:
+            while True:
+                request_id, kind, value = await read_frame(self.reader)
+                future = self.pending.pop(request_id)
+                if kind == ERROR:
+                    future.set_exception(Exception("oram server error", value))
+                else:
+                    future.set_result(value)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            for future in self.pending.values():
+                future.set_exception(Exception("connection to oram server closed", repr(e)))
+            self.pending.clear()
+
+    def send(self, method, *args):
+        self.request_id = (self.request_id + 1) % pow(2, 32)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.request_id] = future
+        self.writer.write(encode_frame(self.request_id, REQUEST, [method, list(args)]))
+        return future
+
+    async def call(self, method, *args):
+        future = self.send(method, *args)
+        await self.writer.drain()
+        return await future
+
+    def __getattr__(self, method):
+        if method not in SERVER_METHODS:
+            raise AttributeError(method)
+
+        def call(*args):
+            return self.call(method, *args)
+
+        return call
+
+    async def close(self):
+        self.writer.close()
+        await self.receive_task
+
+
+class OramServerProxy:
+
+    # synchronous proxy of oram server, could be passed to clients in place of server object
+    # write methods are pipelined: they return at once and the next read is sent while writes are in flight,
+    # error of a write is raised by a later call or flush
+    def __init__(self, host='127.0.0.1', port=None, path=None):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.proxy = AsyncOramServerProxy()
+        self.run(self.proxy.connect(host, port, path))
+        self.in_flight = []  # futures of writes not confirmed yet
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def send(self, method, args):
+        return self.proxy.send(method, *args)
+
+    def call(self, method, *args):
+        future = self.run(self.send(method, args))
+        if method.startswith('write'):
+            self.in_flight.append(future)
+            self.check_in_flight()
+            return None
+        return self.run(self.wait(future))
+
+    async def wait(self, future):
+        await self.proxy.writer.drain()
+        return await future
+
+    # raise error of confirmed writes
+    def check_in_flight(self):
+        while self.in_flight and self.in_flight[0].done():
+            self.in_flight.pop(0).result()
+
+    def flush(self):
+        for future in self.in_flight:
+            self.run(self.wait(future))
+        self.in_flight = []
+
+    def __getattr__(self, method):
+        if method not in SERVER_METHODS:
+            raise AttributeError(method)
+
+        def call(*args):
+            return self.call(method, *args)
+
+        return call
+
+    def close(self):
+        self.flush()
+        self.run(self.proxy.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
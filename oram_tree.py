@@ -1,11 +1,22 @@
 # currently files are stored in memory of server
+from array import array
+from bisect import bisect_left, insort
+from random import randrange, shuffle
+import os
+import sys
+
+
 class BlockCipher:
+    __slots__ = ('cipher', 'nonce')
+
     def __init__(self, cipher, nonce):
         self.cipher = cipher
         self.nonce = nonce
 
 
 class BlockPlaintext:
+    __slots__ = ('block_id', 'data')
+
     def __init__(self, block_id, data):
         self.block_id = block_id
         self.data = data
@@ -15,6 +26,8 @@ class BlockPlaintext:
 
 
 class Bucket:
+    __slots__ = ('data',)
+
     def __init__(self, blocks):
         if blocks is None:
             self.data = []
@@ -36,54 +49,581 @@ class Bucket:
             raise Exception("wrong type of blocks passed to bucket")
 
 
+# a position is the integer label of a leaf, 0 <= position < 2^tree_level
+# the most significant bit is the first turn from the root (0 left, 1 right)
+#
+# index of the bucket at level on the path to position, buckets stored in an array as a heap
+def bucket_index(position, level, tree_level):
+    return ((position + (1 << tree_level)) >> (tree_level - level)) - 1
+
+
+# leaf of the count-th path in reverse lexicographic order of leaves (the tree_level low bits of count reversed),
+# consecutive counts go to distant leaves, which spreads evictions evenly over the tree
+def reverse_lex_position(count, tree_level):
+    position = 0
+    for i in range(tree_level):
+        position = (position << 1) | ((count >> i) & 1)
+    return position
+
+
+# deepest level shared by the paths of two positions
+def common_level(position_a, position_b, tree_level):
+    return tree_level - (position_a ^ position_b).bit_length()
+
+
 class OramTree:
     def __init__(self, buckets):  # store tree in an array
         self.buckets = buckets
         self.root = None if not buckets or len(buckets) == 0 else buckets[0]
+        self.bucket_number = len(buckets) if buckets else 0
+        self.level = (self.bucket_number + 1).bit_length() - 2
+
+    # blocks of bucket at index, storage backends override get_bucket and put_bucket
+    def get_bucket(self, index):
+        return self.buckets[index].get()
+
+    def put_bucket(self, index, blocks):
+        self.buckets[index].put(blocks)
 
-    # assume position is 0,1 string
     def read(self, position):
         blocks = []
-        if not self.root:
+        if not self.bucket_number:
             return blocks
 
-        blocks.extend(self.buckets[0].get())
-
-        target_index = 0
-        for i in range(len(position)):
-            if position[i] == '0':  # turn left
-                target_index = 2 * target_index + 1
-            elif position[i] == '1':  # turn right
-                target_index = 2 * target_index + 2
-            else:
-                raise Exception("position should only be 0,1 string")
-            target_bucket = self.buckets[target_index]
-            blocks.extend(target_bucket.get())
+        tree_level = self.level
+        node = position + (1 << tree_level)
+        for level in range(tree_level + 1):
+            blocks.extend(self.get_bucket((node >> (tree_level - level)) - 1))
         return blocks
 
     def write(self, position, blocks, level):
-        if self.root == None:
+        if not self.bucket_number:
+            raise Exception("write to empty oram tree")
+        if level < 0 or level > self.level:
+            raise Exception("level out of range of oram tree", "level:", level, "tree level:", self.level)
+
+        self.put_bucket(bucket_index(position, level, self.level), blocks)
+
+    # read buckets on path to position, return [blocks of bucket at each level], indexes computed once
+    # buckets of levels from start_level (levels above are cached by client) to leaf
+    def read_path(self, position, start_level=0):
+        if not self.bucket_number:
+            return []
+        tree_level = self.level
+        node = position + (1 << tree_level)
+        return [self.get_bucket((node >> (tree_level - level)) - 1) for level in range(start_level, tree_level + 1)]
+
+    # write [blocks of bucket at each level from start_level] to path to position
+    def write_path(self, position, buckets, start_level=0):
+        if not self.bucket_number:
+            raise Exception("write to empty oram tree")
+        if len(buckets) != self.level + 1 - start_level:
+            raise Exception("a bucket for each level should be written", "buckets:", len(buckets),
+                            "tree level:", self.level, "start level:", start_level)
+        tree_level = self.level
+        node = position + (1 << tree_level)
+        for level in range(start_level, tree_level + 1):
+            self.put_bucket((node >> (tree_level - level)) - 1, buckets[level - start_level])
+
+    # indexes of buckets in the union of paths to positions, of levels from start_level
+    def path_indexes(self, positions, start_level=0):
+        indexes = set()
+        first_node = 1 << start_level
+        for position in positions:
+            node = position + (1 << self.level)
+            while node >= first_node and node - 1 not in indexes:
+                indexes.add(node - 1)
+                node >>= 1
+        return indexes
+
+    # read buckets in the union of paths, return {bucket_index: blocks}
+    def read_paths(self, positions, start_level=0):
+        if not self.bucket_number:
+            return dict()
+        return {index: self.get_bucket(index) for index in self.path_indexes(positions, start_level)}
+
+    # write {bucket_index: blocks}
+    def write_buckets(self, buckets):
+        if not self.bucket_number:
+            raise Exception("write to empty oram tree")
+        for index in buckets:
+            self.check_index(index)
+            self.put_bucket(index, buckets[index])
+
+    # write [(bucket_index, offset, block)], other slots of the buckets unchanged
+    def write_blocks(self, blocks):
+        if not self.bucket_number:
             raise Exception("write to empty oram tree")
-            # check validity of level
-
-        target_index = 0
-        for i in range(level):
-            if position[i] == '0':  # turn left
-                target_index = 2 * target_index + 1
-            elif position[i] == '1':  # turn right
-                target_index = 2 * target_index + 2
+        for index, offset, block in blocks:
+            self.check_index(index)
+            self.put_block(index, offset, block)
+
+    def put_block(self, index, offset, block):
+        blocks = list(self.get_bucket(index))
+        blocks[offset] = block
+        self.put_bucket(index, blocks)
+
+    def check_index(self, index):
+        if index < 0 or index >= self.bucket_number:
+            raise Exception("bucket index out of range of oram tree", "index:", index)
+
+
+class ContiguousOramTree(OramTree):
+
+    # whole oram tree in one preallocated buffer
+    # a bucket is Z fixed size slots, slot = nonce + cipher, bucket at index starts at offset + index * Z * slot size
+    # blocks read are memoryviews of the buffer, blocks written are copied into their slots
+    #
+    # all blocks should have the same size of nonce and cipher
+
+    # create from buckets, or from (bucket_number, Z, cipher_size) with empty slots
+    def __init__(self, buckets=None, bucket_number=None, Z=None, cipher_size=None, nonce_size=16):
+        if buckets is not None:
+            first_block = buckets[0].get()[0]
+            bucket_number = len(buckets)
+            Z = len(buckets[0].get())
+            cipher_size = len(first_block.cipher)
+            nonce_size = len(first_block.nonce)
+        self.set_shape(bucket_number, Z, cipher_size, nonce_size)
+        self.offset = 0
+        self.buffer = bytearray(bucket_number * self.bucket_size)
+        self.view = memoryview(self.buffer)
+
+        if buckets is not None:
+            for index, bucket in enumerate(buckets):
+                self.put_bucket(index, bucket.get())
+
+    def set_shape(self, bucket_number, Z, cipher_size, nonce_size):
+        self.Z = Z
+        self.nonce_size = nonce_size
+        self.cipher_size = cipher_size
+        self.slot_size = nonce_size + cipher_size
+        self.bucket_size = Z * self.slot_size
+
+        self.buckets = None
+        self.root = None
+        self.bucket_number = bucket_number
+        self.level = (bucket_number + 1).bit_length() - 2
+
+    def get_bucket(self, index):
+        start = self.offset + index * self.bucket_size
+        return self.slice_bucket(self.view, start)
+
+    # blocks of bucket starting at start of data, as views of data
+    def slice_bucket(self, data, start):
+        nonce_size = self.nonce_size
+        slot_size = self.slot_size
+        return [BlockCipher(data[i + nonce_size:i + slot_size], data[i:i + nonce_size])
+                for i in range(start, start + self.bucket_size, slot_size)]
+
+    # buckets on path to position of levels from start_level, as one view of the buffer per bucket (Z slots of
+    # nonce + cipher, slot i at i * slot_size), no copy and no object per block
+    def read_path_buffers(self, position, start_level=0):
+        tree_level = self.level
+        node = position + (1 << tree_level)
+        view = self.view
+        bucket_size = self.bucket_size
+        starts = [self.offset + ((node >> (tree_level - level)) - 1) * bucket_size
+                  for level in range(start_level, tree_level + 1)]
+        return [view[start:start + bucket_size] for start in starts]
+
+    # write buckets (bytes of Z slots each) to path to position from start_level, one copy per bucket
+    def write_path_buffers(self, position, buffers, start_level=0):
+        if len(buffers) != self.level + 1 - start_level:
+            raise Exception("a bucket for each level should be written", "buckets:", len(buffers),
+                            "tree level:", self.level, "start level:", start_level)
+        tree_level = self.level
+        node = position + (1 << tree_level)
+        bucket_size = self.bucket_size
+        for level, data in zip(range(start_level, tree_level + 1), buffers):
+            if len(data) != bucket_size:
+                raise Exception("size of bucket should be fixed", "size:", len(data), "expected:", bucket_size)
+            start = self.offset + ((node >> (tree_level - level)) - 1) * bucket_size
+            self.buffer[start:start + bucket_size] = data
+
+    def put_bucket(self, index, blocks):
+        if len(blocks) != self.Z:
+            raise Exception("number of blocks in bucket should be Z", "number of blocks:", len(blocks), "Z:", self.Z)
+        for offset, block in enumerate(blocks):
+            self.put_block(index, offset, block)
+
+    def put_block(self, index, offset, block):
+        if offset < 0 or offset >= self.Z:
+            raise Exception("offset out of range of bucket", "offset:", offset, "Z:", self.Z)
+        if len(block.nonce) != self.nonce_size or len(block.cipher) != self.cipher_size:
+            raise Exception("size of block should be fixed", "nonce size:", len(block.nonce),
+                            "cipher size:", len(block.cipher), "expected:", self.nonce_size, self.cipher_size)
+        start = self.offset + index * self.bucket_size + offset * self.slot_size
+        self.buffer[start:start + self.nonce_size] = block.nonce
+        self.buffer[start + self.nonce_size:start + self.slot_size] = block.cipher
+
+
+# oram tree on storage, 'memory' (list of buckets), 'contiguous' (one buffer in memory)
+# or 'mmap' (a file at storage_path)
+def create_oram_tree(buckets, storage='memory', storage_path=None):
+    if storage == 'memory':
+        return OramTree(buckets)
+    if storage == 'contiguous':
+        return ContiguousOramTree(buckets)
+    if storage == 'mmap':
+        if storage_path is None:
+            raise Exception("storage_path is needed for mmap storage")
+        from mmap_oram_tree import MmapOramTree
+        return MmapOramTree(storage_path, buckets)
+    raise Exception("unknown storage", storage)
+
+
+# oram tree of bucket_number buckets with Z empty slots, to be filled by bulk load of client
+def create_empty_oram_tree(bucket_number, Z, cipher_size, nonce_size=16, storage='memory', storage_path=None):
+    if storage == 'memory':
+        return OramTree([Bucket([None] * Z) for i in range(bucket_number)])
+    if storage == 'contiguous':
+        return ContiguousOramTree(bucket_number=bucket_number, Z=Z, cipher_size=cipher_size, nonce_size=nonce_size)
+    if storage == 'mmap':
+        if storage_path is None:
+            raise Exception("storage_path is needed for mmap storage")
+        from mmap_oram_tree import MmapOramTree
+        return MmapOramTree(storage_path, bucket_number=bucket_number, Z=Z, cipher_size=cipher_size,
+                            nonce_size=nonce_size)
+    raise Exception("unknown storage", storage)
+
+
+# oram tree saved in the file format of MmapOramTree at storage_path (see save_oram_tree of mmap_oram_tree),
+# 'mmap' maps the file, 'memory' and 'contiguous' read it into memory
+def open_oram_tree(storage_path, storage='mmap'):
+    from mmap_oram_tree import MmapOramTree
+    oram_tree = MmapOramTree(storage_path)
+    if storage == 'mmap':
+        return oram_tree
+    if storage not in ('memory', 'contiguous'):
+        oram_tree.close()
+        raise Exception("unknown storage", storage)
+    contiguous_tree = ContiguousOramTree(bucket_number=oram_tree.bucket_number, Z=oram_tree.Z,
+                                         cipher_size=oram_tree.cipher_size, nonce_size=oram_tree.nonce_size)
+    contiguous_tree.buffer[:] = oram_tree.buffer[oram_tree.offset:]
+    oram_tree.close()
+    if storage == 'contiguous':
+        return contiguous_tree
+    return OramTree([Bucket([BlockCipher(bytes(block.cipher), bytes(block.nonce))
+                             for block in contiguous_tree.get_bucket(index)])
+                     for index in range(contiguous_tree.bucket_number)])
+
+
+# buckets filled by a bulk load, kept on client
+# a block is placed in the deepest bucket on its path with a free slot, the blocks are kept until every block is
+# placed, then each bucket is written whole, real blocks and dummies in shuffled slots, in order of bucket index,
+# so the writes seen by the server do not depend on where the blocks went
+class BucketFiller:
+    def __init__(self, tree_level, Z):
+        self.level = tree_level
+        self.Z = Z
+        self.counts = bytearray(pow(2, tree_level + 1) - 1)  # filled slots of each bucket
+        self.blocks = dict()  # {bucket_index: [block]} of blocks kept for buckets written to server
+
+    # return bucket_index of slot taken for a block at position, None if path is full
+    def place(self, position):
+        node = position + (1 << self.level)
+        while node:
+            index = node - 1
+            if self.counts[index] < self.Z:
+                self.counts[index] += 1
+                return index
+            node >>= 1
+        return None
+
+    def put(self, index, block):
+        self.blocks.setdefault(index, []).append(block)
+
+    # (bucket_index, Z blocks) of buckets from first_index in order of index, None is a dummy block,
+    # a bucket is taken out of the filler when yielded
+    def full_buckets(self, first_index=0):
+        for index in range(first_index, len(self.counts)):
+            blocks = self.blocks.pop(index, [])
+            blocks.extend([None] * (self.Z - len(blocks)))
+            shuffle(blocks)
+            yield index, blocks
+
+
+# stash of block plaintexts on client, each block kept with its position
+# blocks are indexed by position, kept sorted, so the blocks that may be placed in a bucket
+# (positions under the subtree of the bucket) are found by bisect instead of scanning the whole stash
+class Stash:
+    def __init__(self, tree_level):
+        self.level = tree_level
+        self.blocks = dict()  # {block_id: block plaintext}
+        self.positions = dict()  # {block_id: position}
+        self.position_blocks = dict()  # {position: {block_id: block plaintext}}
+        self.sorted_positions = []  # positions with blocks in stash, sorted
+        self.changed = None  # block ids put or removed, recorded only when it is a set (see oram_state)
+
+    def __contains__(self, block_id):
+        return block_id in self.blocks
+
+    def __getitem__(self, block_id):
+        return self.blocks[block_id]
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def get_position(self, block_id):
+        return self.positions[block_id]
+
+    # put or replace a block, position is the leaf the block is mapped to
+    def put(self, block, position):
+        block_id = block.block_id
+        if block_id in self.blocks:
+            self.remove(block_id)
+        self.blocks[block_id] = block
+        self.positions[block_id] = position
+        if position not in self.position_blocks:
+            self.position_blocks[position] = dict()
+            insort(self.sorted_positions, position)
+        self.position_blocks[position][block_id] = block
+        if self.changed is not None:
+            self.changed.add(block_id)
+
+    def remove(self, block_id):
+        block = self.blocks.pop(block_id)
+        if self.changed is not None:
+            self.changed.add(block_id)
+        position = self.positions.pop(block_id)
+        same_position_blocks = self.position_blocks[position]
+        del same_position_blocks[block_id]
+        if not same_position_blocks:
+            del self.position_blocks[position]
+            del self.sorted_positions[bisect_left(self.sorted_positions, position)]
+        return block
+
+    # remove and return at most Z (block, position) which could be placed in bucket at level on the path to position
+    def pop_bucket(self, position, level, Z):
+        shift = self.level - level
+        low = (position >> shift) << shift
+        high = low + (1 << shift)
+        sorted_positions = self.sorted_positions
+        i = bisect_left(sorted_positions, low)
+        select_blocks = []
+        while len(select_blocks) < Z and i < len(sorted_positions) and sorted_positions[i] < high:
+            block_position = sorted_positions[i]
+            same_position_blocks = self.position_blocks[block_position]
+            while same_position_blocks and len(select_blocks) < Z:
+                block_id, block = same_position_blocks.popitem()
+                del self.blocks[block_id]
+                del self.positions[block_id]
+                if self.changed is not None:
+                    self.changed.add(block_id)
+                select_blocks.append((block, block_position))
+            if same_position_blocks:
+                i += 1
             else:
-                raise Exception("position should only be 0,1 string")
-        target_bucket = self.buckets[target_index]
-        target_bucket.put(blocks)
+                del self.position_blocks[block_position]
+                del sorted_positions[i]
+        return select_blocks
 
+    # greedy eviction along the union of paths to positions, deeper buckets first
+    # return selected (block, position) of each bucket, {bucket_index: [(block, position)]}
+    def evict_paths(self, positions, Z):
+        buckets = dict()
+        for level in reversed(range(self.level + 1)):
+            for position in positions:
+                index = bucket_index(position, level, self.level)
+                if index not in buckets:
+                    buckets[index] = self.pop_bucket(position, level, Z)
+        return buckets
 
-class PositionMap:
+    # greedy eviction along the path to position, from leaf to root
+    # return selected (block, position) of each bucket, indexed by level
+    def evict(self, position, Z):
+        buckets = [None] * (self.level + 1)
+        for level in reversed(range(self.level + 1)):
+            buckets[level] = self.pop_bucket(position, level, Z)
+        return buckets
+
+
+# sizes of stash after accesses
+class StashStatistics:
     def __init__(self):
-        self.map = dict()
+        self.count = 0
+        self.size = 0  # stash size after last access
+        self.total_size = 0
+        self.max_size = 0  # high water mark
+        self.histogram = dict()  # {stash size: number of accesses}
+
+    def record(self, size):
+        self.count += 1
+        self.size = size
+        self.total_size += size
+        self.max_size = max(self.max_size, size)
+        self.histogram[size] = self.histogram.get(size, 0) + 1
+
+    def mean(self):
+        return self.total_size / self.count if self.count else 0
+
+    # fraction of accesses after which stash is larger than size
+    def exceed_probability(self, size):
+        if not self.count:
+            return 0
+        return sum(self.histogram[s] for s in self.histogram if s > size) / self.count
+
+    def report(self):
+        return {'accesses': self.count, 'size': self.size, 'mean': self.mean(), 'max_size': self.max_size,
+                'histogram': dict(sorted(self.histogram.items()))}
+
+
+# extra path accesses after an access that leaves more than limit blocks in stash
+# policy 'evict': read and write back paths in reverse lexicographic order of leaves, as background eviction
+# policy 'dummy': dummy accesses, read and write back random paths
+# at most max_rounds paths after an access, an access leaving stash still larger than limit is an overflow
+# the server sees the extra paths, so it learns when stash is larger than limit
+class StashOverflowPolicy:
+    def __init__(self, limit, policy='evict', max_rounds=4):
+        if policy not in ('evict', 'dummy'):
+            raise Exception("stash policy should be 'evict' or 'dummy'", policy)
+        self.limit = limit
+        self.policy = policy
+        self.max_rounds = max_rounds
+        self.eviction_count = 0  # number of evicted paths, decide next path to evict
+        self.extra_accesses = 0
+        self.overflows = 0
+
+    def exceeded(self, stash_size):
+        return stash_size > self.limit
+
+    # leaf of next extra path in a tree of tree_level
+    def next_position(self, tree_level):
+        self.extra_accesses += 1
+        if self.policy == 'dummy':
+            return randrange(pow(2, tree_level))
+        position = reverse_lex_position(self.eviction_count, tree_level)
+        self.eviction_count = (self.eviction_count + 1) % pow(2, tree_level)
+        return position
+
+
+# count random leaves of a tree of tree_level, as an array of 4 bytes integers
+# random bytes are masked to tree_level bits byte by byte with translate, no loop over leaves in python
+def random_positions(count, tree_level):
+    data = bytearray(os.urandom(4 * count))
+    mask = pow(2, tree_level) - 1
+    for k in range(4):
+        byte_mask = (mask >> (8 * k)) & 0xff
+        if byte_mask != 0xff:
+            data[k::4] = data[k::4].translate(bytes(i & byte_mask for i in range(256)))
+    positions = array('I')
+    positions.frombytes(data)
+    if sys.byteorder == 'big':
+        positions.byteswap()
+    return positions
+
+
+# position map {block_id: position} of block ids 0 .. size - 1, positions of leaves of a tree of tree_level kept in
+# an array of 4 bytes integers indexed by block id, 4 bytes a block instead of a dict entry and an int object
+# positions: initial positions, random leaves if None
+class PositionMap:
+    def __init__(self, size, tree_level, positions=None):
+        if tree_level > 32:
+            raise Exception("position map holds leaves of at most 32 bits", "tree level:", tree_level)
+        self.size = size
+        self.tree_level = tree_level
+        self.leaf_nodes = pow(2, tree_level)
+        self.changed = None  # block ids changed, recorded only when it is a set (see oram_state)
+        if positions is None:
+            self.positions = random_positions(size, tree_level)
+        else:
+            self.fill(positions)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, block_id):
+        if block_id < 0:
+            raise Exception("block id out of range of position map", "block id:", block_id, "size:", self.size)
+        return self.positions[block_id]
+
+    def __setitem__(self, block_id, position):
+        if block_id < 0:
+            raise Exception("block id out of range of position map", "block id:", block_id, "size:", self.size)
+        self.positions[block_id] = position
+        if self.changed is not None:
+            self.changed.add(block_id)
+
+    def get(self, block_id):
+        return self[block_id]
+
+    def put(self, block_id, position):
+        self[block_id] = position
+
+    # map block to a new random leaf, return (position, new position)
+    def remap(self, block_id):
+        position = self[block_id]
+        new_position = randrange(self.leaf_nodes)
+        self[block_id] = new_position
+        return position, new_position
+
+    # map distinct blocks to new random leaves drawn at once, return their positions before
+    def remap_many(self, block_ids):
+        positions = [self[block_id] for block_id in block_ids]
+        for block_id, new_position in zip(block_ids, random_positions(len(block_ids), self.tree_level)):
+            self[block_id] = new_position
+        return positions
+
+    # replace all positions, positions is an iterable of size leaves
+    def fill(self, positions):
+        positions = array('I', positions)
+        if len(positions) != self.size:
+            raise Exception("number of positions should equal to size of position map", "positions:",
+                            len(positions), "size:", self.size)
+        self.positions = positions
+
+    # memory of positions
+    def memory_bytes(self):
+        return self.positions.itemsize * len(self.positions)
+
+
+# top levels of oram tree kept decrypted on client, buckets of these levels are never read from or written to server
+# a cached bucket holds the (block, position) evicted to it, dummy slots are not kept
+class TreetopCache:
+    def __init__(self, levels, tree_level, Z):
+        self.levels = min(levels, tree_level + 1)  # levels cached, from root
+        self.tree_level = tree_level
+        self.Z = Z
+        self.bucket_number = pow(2, self.levels) - 1  # buckets at index < bucket_number are cached
+        self.buckets = dict()  # {bucket_index: [(block, position)]}
+        self.changed = set()  # indexes of buckets changed, cleared by client state log (see oram_state)
+
+    def caches(self, index):
+        return index < self.bucket_number
+
+    def put(self, index, blocks):
+        self.buckets[index] = blocks
+        self.changed.add(index)
+
+    def append(self, index, block, position):
+        self.buckets.setdefault(index, []).append((block, position))
+        self.changed.add(index)
+
+    # remove blocks of cached buckets on paths to positions, return [(block, position)]
+    def take_paths(self, positions):
+        blocks = []
+        for position in positions:
+            for level in range(self.levels):
+                index = bucket_index(position, level, self.tree_level)
+                blocks.extend(self.buckets.pop(index, []))
+                self.changed.add(index)
+        return blocks
 
-    def put(self, key, value):
-        self.map[key] = value
+    def block_number(self):
+        return sum(len(blocks) for blocks in self.buckets.values())
 
-    def get(self, key):
-        return self.map[key]
+    # memory of cached blocks against bytes not sent to server for each path accessed (read and write back)
+    # block_size is size of block plaintext, slot_size is size of nonce and cipher of a block on server
+    def report(self, block_size, slot_size):
+        return {
+            'levels': self.levels,
+            'buckets': self.bucket_number,
+            'blocks': self.block_number(),
+            'memory_bytes': self.block_number() * block_size,
+            'max_memory_bytes': self.bucket_number * self.Z * block_size,
+            'saved_bytes_per_path': 2 * self.levels * self.Z * slot_size,
+        }
@@ -0,0 +1,226 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from math import log
+from random import randrange, shuffle
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from oram_transport import OramTransportServer, OramServerProxy
+
+
+class PartitionOramClient:
+
+    # partition oram over partitions path orams (shards), each with its own PathOramClient and PathOramServer
+    #
+    # 2^level blocks are spread over partitions trees of level - log2(partitions) + 1, so a tree holds twice its
+    # share of blocks and an access only goes through a shallow tree. Shard map {block_id: (partition, local id)}
+    # is kept on client, local id is None for a block in the eviction cache of its partition.
+    # An access reads the block from its partition and frees its local id (its stale copy is overwritten when the
+    # local id is reused), a block in an eviction cache or never written is read from a cache or nowhere and a random
+    # local id of a random partition is read in its place. The block is then assigned a new random partition and
+    # kept in the eviction cache of that partition on client, it is not written to the partition at once.
+    # After the reads of a batch, every partition gets the same number of eviction accesses (evictions_per_batch):
+    # a write of a block of its cache under a free local id, or a read of a random local id when the cache is empty,
+    # which look the same to the server. So the server sees reads of partitions chosen at random by earlier accesses,
+    # then accesses to every partition that do not depend on the blocks accessed.
+    # eviction_rate: eviction accesses of each partition in a batch of n blocks, ceil(eviction_rate * n / partitions),
+    # at least 1, so caches are drained faster than they are filled
+    #
+    # oram_servers passed to accesses is the list of servers of partitions (PathOramServer or OramServerProxy,
+    # see create_servers and ShardProcesses), with workers the partitions of a batch are accessed by a pool of
+    # workers threads, so shards behind proxies serve them in parallel
+    # other keyword arguments are passed to PathOramClient of each partition
+    def __init__(self, level, partitions=4, workers=None, eviction_rate=2, **client_kwargs):
+        if partitions < 1 or log(partitions, 2) != int(log(partitions, 2)):
+            raise Exception("number of partitions should be a power of 2", partitions)
+        partition_bits = int(log(partitions, 2))
+        if partition_bits > level:
+            raise Exception("more partitions than blocks", "partitions:", partitions, "level:", level)
+        self.level = level
+        self.partitions = partitions
+        self.partition_level = level - partition_bits + 1
+        self.clients = [PathOramClient(self.partition_level, **client_kwargs) for i in range(partitions)]
+        self.shard_map = dict()  # {block_id: (partition, local id or None if in eviction cache)}
+        self.caches = [dict() for i in range(partitions)]  # eviction cache of each partition, {block_id: data}
+        self.eviction_rate = eviction_rate
+        self.free_ids = []  # free local ids of each partition, in random order
+        for i in range(partitions):
+            local_ids = list(range(pow(2, self.partition_level)))
+            shuffle(local_ids)
+            self.free_ids.append(local_ids)
+        self.executor = ThreadPoolExecutor(workers) if workers else None
+
+    # servers in this process with trees initialized with dummy blocks
+    def create_servers(self):
+        return [PathOramServer(client.generate_initialize_block(), self.partition_level) for client in self.clients]
+
+    # (level, shape) of tree of each partition, for servers with empty storage filled by bulk_load
+    def partition_shapes(self):
+        return [(self.partition_level, client.bucket_shape()) for client in self.clients]
+
+    def check_block_id(self, block_id):
+        if block_id < 0 or block_id >= pow(2, self.level):
+            raise Exception("block id out of range", "block id:", block_id, "blocks:", pow(2, self.level))
+
+    # eviction accesses of each partition after a batch of block_number blocks
+    def evictions_per_batch(self, block_number):
+        return max(1, -(-self.eviction_rate * block_number // self.partitions))
+
+    def cached_blocks(self):
+        return sum(len(cache) for cache in self.caches)
+
+    # take a free local id of a random partition, return (partition, local id), used by bulk load
+    def allocate(self):
+        partition = randrange(self.partitions)
+        if not self.free_ids[partition]:
+            partitions = [i for i in range(self.partitions) if self.free_ids[i]]
+            if not partitions:
+                raise Exception("no free block left in partitions")
+            partition = partitions[randrange(len(partitions))]
+        return partition, self.free_ids[partition].pop()
+
+    # call function(partition, ops) for ops of each partition in {partition: ops}, in parallel with workers
+    # return {partition: result}
+    def run_partitions(self, function, partition_ops):
+        if self.executor is None:
+            return {partition: function(partition, ops) for partition, ops in partition_ops.items()}
+        futures = {partition: self.executor.submit(function, partition, ops)
+                   for partition, ops in partition_ops.items()}
+        return {partition: future.result() for partition, future in futures.items()}
+
+    # ops is a list of (op, block_id, block_data), op is 'read' or 'write'
+    # blocks of a batch are read from their partitions, then go to eviction caches, evicted by the same number of
+    # accesses of every partition, with one access_batch per partition in each phase, return data read for each op
+    # (data before the write for a write)
+    def access_batch(self, ops, oram_servers):
+        for op, block_id, block_data in ops:
+            self.check_block_id(block_id)
+        block_ids = list(dict.fromkeys(block_id for op, block_id, block_data in ops))
+
+        # read phase
+        read_ops = dict()  # {partition: [(op, local id, None)]}
+        read_slots = []  # (partition, index in read_ops of partition) of each block
+        for block_id in block_ids:
+            partition, local_id = self.shard_map.get(block_id, (None, None))
+            if local_id is None:
+                partition, local_id = randrange(self.partitions), randrange(pow(2, self.partition_level))
+            partition_read_ops = read_ops.setdefault(partition, [])
+            read_slots.append((partition, len(partition_read_ops)))
+            partition_read_ops.append(('read', local_id, None))
+        read_data = self.run_partitions(
+            lambda partition, partition_ops: self.clients[partition].access_batch(partition_ops,
+                                                                                  oram_servers[partition]),
+            read_ops)
+
+        data = dict()  # {block_id: data of block}
+        for block_id, (partition, i) in zip(block_ids, read_slots):
+            data[block_id] = None
+            if block_id in self.shard_map:
+                partition, local_id = self.shard_map.pop(block_id)
+                if local_id is None:
+                    data[block_id] = self.caches[partition].pop(block_id)
+                else:
+                    data[block_id] = read_data[partition][i]
+                    self.free_ids[partition].append(local_id)
+        data_to_read = []
+        for op, block_id, block_data in ops:
+            data_to_read.append(data[block_id])
+            if op == 'write':
+                data[block_id] = block_data
+
+        # blocks go to the eviction cache of a new random partition
+        for block_id in block_ids:
+            if data[block_id] is not None:
+                partition = randrange(self.partitions)
+                self.caches[partition][block_id] = data[block_id]
+                self.shard_map[block_id] = (partition, None)
+
+        # eviction phase, the same number of accesses to every partition
+        evictions = self.evictions_per_batch(len(block_ids))
+        write_ops = dict()  # {partition: [(op, local id, data)]}
+        for partition in range(self.partitions):
+            cache = self.caches[partition]
+            free_ids = self.free_ids[partition]
+            partition_write_ops = write_ops[partition] = []
+            for i in range(evictions):
+                if cache and free_ids:
+                    block_id = next(iter(cache))
+                    local_id = free_ids.pop()
+                    partition_write_ops.append(('write', local_id, cache.pop(block_id)))
+                    self.shard_map[block_id] = (partition, local_id)
+                else:
+                    partition_write_ops.append(('read', randrange(pow(2, self.partition_level)), None))
+        self.run_partitions(
+            lambda partition, partition_ops: self.clients[partition].access_batch(partition_ops,
+                                                                                  oram_servers[partition]),
+            write_ops)
+        return data_to_read
+
+    def read(self, block_id, oram_servers):
+        return self.access_batch([('read', block_id, None)], oram_servers)[0]
+
+    def write(self, block_id, block_data, oram_servers):
+        return self.access_batch([('write', block_id, block_data)], oram_servers)[0]
+
+    def read_many(self, block_ids, oram_servers):
+        return self.access_batch([('read', block_id, None) for block_id in block_ids], oram_servers)
+
+    # items is a list of (block_id, block_data)
+    def write_many(self, items, oram_servers):
+        return self.access_batch([('write', block_id, block_data) for block_id, block_data in items], oram_servers)
+
+    # load blocks into servers created with empty storage (partition_shapes), see PathOramClient.bulk_load
+    # every partition is loaded, with no block it is filled with dummy blocks
+    def bulk_load(self, items, oram_servers, chunk_size=1024):
+        partition_items = [[] for i in range(self.partitions)]
+        for block_id, block_data in items:
+            self.check_block_id(block_id)
+            if block_id in self.shard_map:
+                raise Exception("block loaded twice", block_id)
+            partition, local_id = self.allocate()
+            self.shard_map[block_id] = (partition, local_id)
+            partition_items[partition].append((local_id, block_data))
+        self.run_partitions(lambda partition, items: self.clients[partition].bulk_load(
+            iter(items), oram_servers[partition], chunk_size), dict(enumerate(partition_items)))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        for client in self.clients:
+            client.close()
+
+
+# serve a PathOramServer with empty storage through transport, send address listened to connection
+def serve_shard(level, shape, storage, storage_path, connection):
+    transport_server = OramTransportServer(PathOramServer(None, level, storage, storage_path, shape))
+
+    async def serve():
+        connection.send(await transport_server.start())
+        await transport_server.serve_forever()
+
+    asyncio.run(serve())
+
+
+class ShardProcesses:
+
+    # run server of each partition in its own process, servers are OramServerProxy connected to them
+    # storage of partition i is storage_path.<i> for storage 'mmap'
+    # servers start with empty storage, fill them with bulk_load of client
+    def __init__(self, partition_shapes, storage='memory', storage_path=None):
+        self.processes = []
+        self.servers = []
+        for i, (level, shape) in enumerate(partition_shapes):
+            partition_storage_path = None if storage_path is None else storage_path + '.' + str(i)
+            parent_connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve_shard, daemon=True, args=(
+                level, shape, storage, partition_storage_path, child_connection))
+            process.start()
+            host, port = parent_connection.recv()
+            self.processes.append(process)
+            self.servers.append(OramServerProxy(host, port))
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+        for process in self.processes:
+            process.terminate()
+            process.join()
@@ -1,8 +1,13 @@
-from random import randint
-from Crypto.Cipher import AES
+from random import randrange
 from bisect import bisect_left
-from oram_tree import BlockCipher, BlockPlaintext, Bucket, OramTree
+from collections import OrderedDict
+from oram_tree import BlockPlaintext, Bucket, BucketFiller, PositionMap, Stash, StashOverflowPolicy, \
+    StashStatistics, TreetopCache, bucket_index, create_oram_tree, create_empty_oram_tree, open_oram_tree
+from oram_cipher import DummyPool, create_cipher
+from oram_metrics import blocks_bytes, null_metrics
+from mmap_oram_tree import save_oram_tree
 from math import log
+import os
 
 
 class RecursivePathOramServer:
@@ -19,12 +24,35 @@ class RecursivePathOramServer:
     # block dummy symbol used to pad a file to the maximum size which is (block_size - block_id_size)
     #
 
-    def __init__(self, oram_buckets):
+    # storage 'memory' keeps buckets in memory, 'mmap' stores oram of each recursive level
+    # in file storage_path.<recursive level> through mmap
+    # if oram_buckets is None, storage of each recursive level is created with empty slots of shape
+    # (level, Z, cipher_size, nonce_size) in shapes (client.bucket_shapes()) and filled by bulk_load of client
+    # if oram_buckets and shapes are None, trees saved at storage_path.<recursive level> (save, or the files of 'mmap'
+    # storage) are opened
+    # metrics: OramMetrics recording time of each call and blocks read and written (see oram_metrics)
+    def __init__(self, oram_buckets, storage='memory', storage_path=None, shapes=None, metrics=None):
+        self.metrics = null_metrics if metrics is None else metrics
         self.oram_tree = []
+        if oram_buckets is None and shapes is None and storage_path is not None:
+            while os.path.exists(storage_path + '.' + str(len(self.oram_tree))):
+                self.oram_tree.append(open_oram_tree(storage_path + '.' + str(len(self.oram_tree)), storage))
+            if not self.oram_tree:
+                raise Exception("no saved tree at storage path", storage_path)
+            return
+        if oram_buckets is None:
+            if shapes is None:
+                raise Exception("shapes of buckets are needed for empty storage")
+            for i, (level, Z, cipher_size, nonce_size) in enumerate(shapes):
+                level_storage_path = None if storage_path is None else storage_path + '.' + str(i)
+                self.oram_tree.append(create_empty_oram_tree(pow(2, level + 1) - 1, Z, cipher_size, nonce_size,
+                                                             storage, level_storage_path))
+            return
         # init with random blocks
         # check buckets number
-        for buckets in oram_buckets:
-            self.oram_tree.append(OramTree(buckets))
+        for i, buckets in enumerate(oram_buckets):
+            level_storage_path = None if storage_path is None else storage_path + '.' + str(i)
+            self.oram_tree.append(create_oram_tree(buckets, storage, level_storage_path))
 
     def read(self, position, recursive_level):
         return self.oram_tree[recursive_level].read(position)
@@ -32,9 +60,97 @@ class RecursivePathOramServer:
     def write_bucket(self, position, blocks, level, recursive_level):
         return self.oram_tree[recursive_level].write(position, blocks, level)
 
+    # read buckets on path to position, return [blocks of bucket at each level]
+    # buckets above start_level are cached by client and not read
+    def read_path(self, position, recursive_level, start_level=0):
+        with self.metrics.phase('read_path', recursive_level):
+            buckets = self.oram_tree[recursive_level].read_path(position, start_level)
+        if self.metrics.enabled:
+            self.metrics.count('server_blocks_read', sum(len(blocks) for blocks in buckets), recursive_level)
+        return buckets
+
+    # write [blocks of bucket at each level] to path to position in one call
+    def write_path(self, position, buckets, recursive_level, start_level=0):
+        if self.metrics.enabled:
+            self.metrics.count('server_blocks_written', sum(len(blocks) for blocks in buckets), recursive_level)
+        with self.metrics.phase('write_path', recursive_level):
+            return self.oram_tree[recursive_level].write_path(position, buckets, start_level)
+
+    # read union of paths to positions in one call, return {bucket_index: blocks}
+    def read_paths(self, positions, recursive_level, start_level=0):
+        with self.metrics.phase('read_paths', recursive_level):
+            buckets = self.oram_tree[recursive_level].read_paths(positions, start_level)
+        if self.metrics.enabled:
+            self.metrics.count('server_blocks_read', sum(len(blocks) for blocks in buckets.values()), recursive_level)
+        return buckets
+
+    # write {bucket_index: blocks} in one call
+    def write_buckets(self, buckets, recursive_level):
+        if self.metrics.enabled:
+            self.metrics.count('server_blocks_written', sum(len(blocks) for blocks in buckets.values()), recursive_level)
+        with self.metrics.phase('write_buckets', recursive_level):
+            return self.oram_tree[recursive_level].write_buckets(buckets)
+
+    # write [(bucket_index, offset, block)] in one call
+    def write_blocks(self, blocks, recursive_level):
+        return self.oram_tree[recursive_level].write_blocks(blocks)
+
+    # save tree of each recursive level to path.<recursive level> in the format of MmapOramTree,
+    # reopened by RecursivePathOramServer(None, storage, path)
+    def save(self, path):
+        for i, oram_tree in enumerate(self.oram_tree):
+            save_oram_tree(oram_tree, path + '.' + str(i))
+
+
+# least recently used position blocks of a recursive level, {block_id: data}
+# the cached copy is the only up to date one, the block in position oram is written back when it leaves the cache
+class PositionBlockCache:
+    def __init__(self, size):
+        self.size = size
+        self.blocks = OrderedDict()  # least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.changed = None  # block ids put, used or removed, recorded only when it is a set (see oram_state)
+
+    def get(self, block_id):
+        if block_id not in self.blocks:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.blocks.move_to_end(block_id)
+        if self.changed is not None:
+            self.changed.add(block_id)
+        return self.blocks[block_id]
+
+    # return [(block_id, data)] evicted to keep size, to be written back
+    def put(self, block_id, data):
+        self.blocks[block_id] = data
+        self.blocks.move_to_end(block_id)
+        evicted = []
+        while len(self.blocks) > self.size:
+            evicted.append(self.blocks.popitem(last=False))
+        if self.changed is not None:
+            self.changed.add(block_id)
+            self.changed.update(evicted_block_id for evicted_block_id, evicted_data in evicted)
+        return evicted
+
+    # remove all blocks, return [(block_id, data)]
+    def flush(self):
+        evicted = list(self.blocks.items())
+        self.blocks.clear()
+        if self.changed is not None:
+            self.changed.update(block_id for block_id, data in evicted)
+        return evicted
+
+    def hit_rate(self):
+        if self.hits + self.misses == 0:
+            return 0
+        return self.hits / (self.hits + self.misses)
+
 
 class RecursivePathOramClient:
     key_size = 256
+    position_size = 4  # position stored in position block as 4 bytes little endian integer
 
     # block_size default to 2048 bytes
     # block_id_size 32 bytes
@@ -46,11 +162,46 @@ class RecursivePathOramClient:
     # A file could be stored in multiple block,  a mapping between file and block_id could be stored in client
     #
     # block dummy symbol used to pad a file to the maximum size which is (block_size - block_id_size)
+    #
+    # unpad: remove padding from data of file blocks read, with False data read is the whole padded block
+    #
+    # position of a block is encrypted along with it, cipher = block_id + position + data
+    # so the client knows the position of every block in stash without looking up position oram
 
-    # Data of position block is (block_id+position)
+    # Data of position block is an array of position_compress positions (4 bytes little endian), no block id is
+    # stored, position of block_id is at offset (block_id % position_compress) * position_size
+    # of position block block_id // position_compress, so a block of block_size bytes holds
+    # block_size // position_size positions and a large position_compress gives few recursive levels
     # assume a position compress with 2^k for simplicity
     # we do not need to hide the size of position map block, the size could be calculated.
-    def __init__(self, first_level, Z=4, position_compress=8, block_size=8192, block_id_size=32):
+    #
+    # position_cache_size: keep up to position_cache_size recently used position blocks of each recursive level
+    # on client (PositionBlockCache), a hit does not access the position orams of this level and levels below.
+    # It leaks: the server sees how many position orams an access goes through, so it learns when block ids
+    # close to recently accessed ones (same position block) are accessed. 0 (default) keeps accesses oblivious.
+    #
+    # stash_statistics[i] records stash size of recursive level i after every access of the level
+    # stash_limit: after an access leaving more than stash_limit blocks in stash of its level, up to
+    # stash_policy_rounds extra paths of the level are read and written back, stash_policy 'evict' or 'dummy'
+    # (see StashOverflowPolicy), stash_policies[i] counts extra accesses and overflows
+    #
+    # metrics: OramMetrics recording time of each phase of an access, bytes and blocks moved and stash size of each
+    # recursive level, and recursion depth (deepest position oram accessed by the last access of a file block),
+    # see oram_metrics. position_lookup of level i includes the accesses of position orams below it
+    #
+    # cipher is 'eax', 'ctr', 'gcm' (see oram_cipher) or a cipher object
+    # crypto_workers: decrypt and encrypt blocks of a path by a pool of crypto_workers threads or processes
+    # (crypto_executor 'thread' or 'process'), nonces are still chosen by the client, close() (or a with block)
+    # shuts the pool down
+    # dummy_pool_size: dummy blocks written back are taken from a pool of dummy_pool_size fresh dummy ciphers
+    # for each recursive level, refilled by a thread if dummy_pool_background (threads stopped by close()),
+    # otherwise by refill() of dummy_pools[i] when client is idle
+    # treetop_levels: top levels of the tree of each recursive level kept decrypted on client (TreetopCache),
+    # only lower levels are read from and written to server, treetop_report() gives memory used against bytes saved
+    def __init__(self, first_level, Z=4, position_compress=8, block_size=8192, block_id_size=32, cipher='eax',
+                 crypto_workers=None, crypto_executor='thread', dummy_pool_size=0, dummy_pool_background=True,
+                 unpad=True, treetop_levels=0, position_cache_size=0, stash_limit=None, stash_policy='evict',
+                 stash_policy_rounds=4, metrics=None):
         # assume position_compress is the size of 2^k for simplicity
         if log(position_compress, 2) != int(log(position_compress, 2)):
             raise Exception("position block level should be the pow of 2")
@@ -67,123 +218,156 @@ class RecursivePathOramClient:
         previous_leaf_nodes = first_level_leaf_nodes
         for i in range(1, recursive_level + 1):
             leaf_nodes = previous_leaf_nodes / position_compress
-            position_block_size = block_id_size + self.levels[-1]
+            position_block_size = self.position_size  # size of a position entry
             level = int(log(leaf_nodes, 2))
             self.levels.append(level)
             self.blocks_size.append(position_block_size)
             previous_leaf_nodes = leaf_nodes
-        print("all levels:", self.levels)
         self.Z = Z
         self.block_id_size = block_id_size
 
         self.block_dummy_symbol = b'\xff'
+        self.unpad = unpad
         self.dummy_block_id = int.from_bytes(self.block_dummy_symbol * self.block_id_size, byteorder='little')
 
         self.position_compress = position_compress  # 24
 
-        self.stash = [dict() for i in range(recursive_level + 1)]  # {block_id: block plaintext)}
-
-        self.position_map = dict()  # {block_id:  position}
+        # dummy block of each level, same size as real block, cipher = block_id + position + data
+        self.dummy_blocks = [BlockPlaintext(self.dummy_block_id, self.block_dummy_symbol * self.blocks_size[0])]
+        for i in range(1, recursive_level + 1):
+            self.dummy_blocks.append(BlockPlaintext(
+                self.dummy_block_id, self.block_dummy_symbol * self.blocks_size[i] * self.position_compress))
+
+        # {block_id: block plaintext)} with position of each block
+        self.stash = [Stash(self.levels[i]) for i in range(recursive_level + 1)]
+        self.stash_statistics = [StashStatistics() for i in range(recursive_level + 1)]
+        self.metrics = null_metrics if metrics is None else metrics
+        self.deepest_level = 0  # deepest recursive level accessed since last access of a file block started
+        self.stash_policies = None
+        if stash_limit is not None:
+            self.stash_policies = [StashOverflowPolicy(stash_limit, stash_policy, stash_policy_rounds)
+                                   for i in range(recursive_level + 1)]
+        self.treetop = [TreetopCache(treetop_levels, self.levels[i], Z) for i in range(recursive_level + 1)]
+
+        # {block_id:  position} of position blocks of the last recursive level, set by initialization or bulk load
+        self.position_map = PositionMap(pow(2, self.levels[-1]), self.levels[-1])
+        # position_caches[i] caches position blocks of recursive level i (no cache for file blocks of level 0)
+        self.position_caches = [None] + [PositionBlockCache(position_cache_size) for i in range(recursive_level)]
 
         # use AES for encryption
         self.key = str.encode('1' * (self.key_size // 8))
+        self.cipher = create_cipher(cipher, self.key, crypto_workers, crypto_executor)
+        self.dummy_pools = None
+        if dummy_pool_size:
+            self.dummy_pools = [DummyPool(lambda count, i=i: self.encrypt_dummy_blocks(count, i), dummy_pool_size,
+                                          dummy_pool_background) for i in range(recursive_level + 1)]
 
-    def find_intersection_block(self, position, level, recursive_level, oram_server):
-        intersect_block = dict()
-        for block_id in self.stash[recursive_level]:
-            block_position = self.lookup_position_find_intersection(block_id, recursive_level + 1, oram_server)
-            if block_position[:level] == position[:level]:
-                intersect_block[block_id] = self.stash[recursive_level][block_id]
-        return intersect_block
-
-    def lookup_position_find_intersection(self, block_id, recursive_level, oram_server):
-        compressed_block_id = block_id // self.position_compress
-        if recursive_level == self.recursive_level + 1:  # last level
-            position = self.position_map[compressed_block_id]
-        else:  # read position from recursive oram
-            data = self.read_recursively(compressed_block_id, recursive_level, oram_server)
-
-            # get position of target block from packed data
-            block_size = self.blocks_size[recursive_level]
-            if len(data) % block_size != 0:
-                raise Exception("unexpected length of data read", "length of data", len(data), "block size", block_size)
-            found = False
-            position = ''
-            data_to_write = None
-            for i in range(0, len(data) // block_size):
-                block = data[i * block_size:(i + 1) * block_size]
-                read_block_id = int.from_bytes(block[:self.block_id_size], byteorder='little')
-                if read_block_id != block_id:
-                    continue
-                found = True
-                position = block[self.block_id_size:block_size].decode()
-                break
-            if not found:
-                raise Exception("position should be found")
-            # write new position
-        return position
-
+    # return current position of block and the new position it is mapped to
     def lookup_position(self, block_id, recursive_level, oram_server):
         compressed_block_id = block_id // self.position_compress
+        new_position = randrange(pow(2, self.levels[recursive_level - 1]))
+        if recursive_level == self.recursive_level + 1:  # last level
+            position = self.position_map[block_id]
+            self.position_map[block_id] = new_position
+        else:  # read position from cache or recursive oram
+            position_cache = self.position_caches[recursive_level]
+            data = position_cache.get(compressed_block_id)
+            if data is None:
+                data = self.read_recursively(compressed_block_id, recursive_level, oram_server)
+            position, data_to_write = self.update_position_in_block(data, block_id, new_position, recursive_level)
+            # new position stays in cache, write back blocks evicted from cache (the block itself without cache)
+            for evicted_block_id, evicted_data in position_cache.put(compressed_block_id, data_to_write):
+                self.write_recursively(evicted_block_id, evicted_data, recursive_level, oram_server)
+        return position, new_position
+
+    # positions of a batch of blocks, return {block_id: (position, new position)}
+    # batch_size position blocks are read and written, padded with accesses to random position blocks
+    def lookup_positions(self, block_ids, batch_size, recursive_level, oram_server):
+        new_positions = dict()
         leaf_nodes = pow(2, self.levels[recursive_level - 1])
-        new_position = self.integer_to_position(randint(0, leaf_nodes), recursive_level - 1)
+        for block_id in block_ids:
+            new_positions[block_id] = randrange(leaf_nodes)
+        positions = dict()
         if recursive_level == self.recursive_level + 1:  # last level
-            position = self.position_map[compressed_block_id]
-            self.position_map[compressed_block_id] = new_position
-        else:  # read position from recursive oram
-            data = self.read_recursively(compressed_block_id, recursive_level, oram_server)
-
-            # get position of target block from packed data
-            block_size = self.blocks_size[recursive_level]
-            if len(data) % block_size != 0:
-                raise Exception("unexpected length of data read", "length of data", len(data), "block size", block_size)
-            found = False
-            position = ''
-            data_to_write = None
-            for i in range(0, len(data) // block_size):
-                block = data[i * block_size:(i + 1) * block_size]
-                read_block_id = int.from_bytes(block[:self.block_id_size], byteorder='little')
-                if read_block_id != block_id:
-                    continue
-                found = True
-                position = block[self.block_id_size:block_size].decode()
-                new_position_data = block_id.to_bytes(self.block_id_size, byteorder='little') + new_position.encode()
-                data_to_write = data[:i * block_size] + new_position_data + data[(i + 1) * block_size:]
-                break
-            if not found:
-                raise Exception("position should be found")
-            self.write_recursively(compressed_block_id, data_to_write, recursive_level, oram_server)
-            # write new position
-        return position
+            for block_id in block_ids:
+                positions[block_id] = (self.position_map[block_id], new_positions[block_id])
+                self.position_map[block_id] = new_positions[block_id]
+            return positions
+
+        position_blocks_number = pow(2, self.levels[recursive_level])
+        position_cache = self.position_caches[recursive_level]
+        compressed_block_ids = [block_id // self.position_compress for block_id in block_ids]
+        packed_data = dict()  # {compressed_block_id: data}
+        for compressed_block_id in dict.fromkeys(compressed_block_ids):
+            data = position_cache.get(compressed_block_id)
+            if data is not None:
+                packed_data[compressed_block_id] = data
+        # blocks not in cache are read, padded for the rest of the batch but not for blocks found in cache
+        missed_block_ids = [compressed_block_id for compressed_block_id in compressed_block_ids
+                            if compressed_block_id not in packed_data]
+        read_ops = [('read', compressed_block_id, None) for compressed_block_id in missed_block_ids]
+        read_ops.extend(('read', randrange(position_blocks_number), None)
+                        for i in range(batch_size - len(compressed_block_ids) + len(missed_block_ids) - len(read_ops)))
+        if read_ops:
+            read_data = self.access_batch_recursively(read_ops, recursive_level, oram_server)
+            for compressed_block_id, data in zip(missed_block_ids, read_data):
+                if compressed_block_id not in packed_data:
+                    packed_data[compressed_block_id] = data
+        for block_id, compressed_block_id in zip(block_ids, compressed_block_ids):
+            position, packed_data[compressed_block_id] = self.update_position_in_block(
+                packed_data[compressed_block_id], block_id, new_positions[block_id], recursive_level)
+            positions[block_id] = (position, new_positions[block_id])
+
+        # new positions stay in cache, write back blocks evicted from cache (all blocks without cache)
+        write_ops = []
+        for compressed_block_id in packed_data:
+            for evicted_block_id, evicted_data in position_cache.put(compressed_block_id,
+                                                                      packed_data[compressed_block_id]):
+                write_ops.append(('write', evicted_block_id, evicted_data))
+        write_ops.extend(('read', randrange(position_blocks_number), None) for i in range(len(read_ops) - len(write_ops)))
+        if write_ops:
+            self.access_batch_recursively(write_ops, recursive_level, oram_server)
+        return positions
+
+    # write back position blocks in cache of every recursive level, position orams are up to date after it
+    def flush_position_caches(self, oram_server):
+        for recursive_level in range(1, self.recursive_level + 1):
+            for block_id, data in self.position_caches[recursive_level].flush():
+                self.write_recursively(block_id, data, recursive_level, oram_server)
+
+    # get position of target block from packed data, return the position and packed data with new position
+    def update_position_in_block(self, data, block_id, new_position, recursive_level):
+        entry_size = self.blocks_size[recursive_level]
+        if len(data) != entry_size * self.position_compress:
+            raise Exception("unexpected length of data read", "length of data", len(data), "position block size",
+                            entry_size * self.position_compress)
+        offset = block_id % self.position_compress * entry_size
+        position = int.from_bytes(data[offset:offset + entry_size], byteorder='little')
+        data_to_write = data[:offset] + new_position.to_bytes(entry_size, byteorder='little') + \
+                        data[offset + entry_size:]
+        return position, data_to_write
 
     def access(self, op, block_id, block_data, recursive_level, oram_server):
-        # print("recursive level",recursive_level)
-        block_position = self.lookup_position(block_id, recursive_level + 1, oram_server)
-        # read bucket along path block_position from server
-        blocks_cipher = oram_server.read(block_position, recursive_level)
-        to_append_stash = dict()
-        for block_cipher in blocks_cipher:
-            block_plaintext = self.decrypt_block(block_cipher)
-            # skip dummy block
-            if block_plaintext.block_id == self.dummy_block_id:
-                continue
-            to_append_stash[block_plaintext.block_id] = block_plaintext
-
-        # update stash
-        self.stash[recursive_level].update(to_append_stash)
+        self.start_access(recursive_level)
+        with self.metrics.phase('position_lookup', recursive_level):
+            block_position, new_block_position = self.lookup_position(block_id, recursive_level + 1, oram_server)
+        stash = self.stash[recursive_level]
+        self.read_path_to_stash(block_position, recursive_level, oram_server)
         # print("stash:",self.stash[recursive_level],"recusieve level",recursive_level)
-        if block_id not in self.stash[recursive_level]:
+        if block_id not in stash:
             if recursive_level != 0:
                 # not first level, must exists
                 raise Exception("position must exists in position oram")
             # not write before
             data_to_read = None
         else:
-            block_plaintext_to_read = self.stash[recursive_level][block_id]  # read from stash a
+            block_plaintext_to_read = stash[block_id]  # read from stash a
             if recursive_level == 0:  # only remove dummy for file blocks
                 data_to_read = self.remove_dummy_in_block(block_plaintext_to_read.data)
             else:
                 data_to_read = block_plaintext_to_read.data
+            # block may stay in stash from previous access, move it to new position
+            stash.put(block_plaintext_to_read, new_block_position)
         if op == 'write':
             if recursive_level == 0:  # only padding for file block
                 block_size = self.blocks_size[0]
@@ -193,42 +377,285 @@ class RecursivePathOramClient:
                                     len(block_data), "block size:", block_size)
                 block_data = block_data + (self.blocks_size[0] - len(block_data)) * self.block_dummy_symbol
 
-            self.stash[recursive_level][block_id] = BlockPlaintext(block_id, block_data)
-
-        for l in reversed(range(self.levels[recursive_level] + 1)):
-            intersect_block = self.find_intersection_block(block_position, l, recursive_level, oram_server)
-            # select S'= min(len(intersect_block),Z) blocks to write
-            select_block_num = min(len(intersect_block), self.Z)
-            count = 0
-            select_block_id = dict()
-            for k in intersect_block:
-                if count == select_block_num:
-                    break
-                select_block_id[k] = intersect_block[k]
-                count += 1
-
-            # remove select block from stash
-            for block_id in select_block_id:
-                del self.stash[recursive_level][block_id]
-
-            select_blocks = [select_block_id[k] for k in select_block_id]
-
-            select_blocks_cipher = []
-            for select_block in select_blocks:
-                block_cipher = self.encrypt_block(select_block)
-                select_blocks_cipher.append(block_cipher)
-
-            # padded S' with dummy blocks to size of Z, block id should be selected from stash
-            if len(select_blocks_cipher) < self.Z:
-                dummy_blocks_cipher = []
-                for i in range(0, self.Z - len(select_blocks_cipher)):
-                    dummy_block_cipher = self.generate_dummy_block_cipher(recursive_level)
-                    dummy_blocks_cipher.append(dummy_block_cipher)
-                select_blocks_cipher.extend(dummy_blocks_cipher)
-            oram_server.write_bucket(block_position, select_blocks_cipher, l, recursive_level)
+            stash.put(BlockPlaintext(block_id, block_data), new_block_position)
+
+        self.write_back_path(block_position, recursive_level, oram_server)
+        self.relieve_stash(recursive_level, oram_server)
+        self.finish_access(1, recursive_level)
+        return data_to_read
+
+    def start_access(self, recursive_level):
+        if recursive_level == 0:
+            self.deepest_level = 0
+        self.deepest_level = max(self.deepest_level, recursive_level)
+
+    # record stash size and accesses of recursive level after an access of count blocks
+    def finish_access(self, count, recursive_level):
+        stash_size = len(self.stash[recursive_level])
+        self.stash_statistics[recursive_level].record(stash_size)
+        self.metrics.count('accesses', count, recursive_level)
+        self.metrics.gauge('stash_size', stash_size, recursive_level)
+        if recursive_level == 0:
+            self.metrics.gauge('recursion_depth', self.deepest_level)
+
+    # read bucket along path position from server, put real blocks to stash
+    # buckets cached on client are not read
+    def read_path_to_stash(self, position, recursive_level, oram_server):
+        stash = self.stash[recursive_level]
+        treetop = self.treetop[recursive_level]
+        metrics = self.metrics
+        with metrics.phase('path_read', recursive_level):
+            buckets_cipher = oram_server.read_path(position, recursive_level, treetop.levels)
+        blocks_cipher = [block_cipher for blocks_cipher in buckets_cipher for block_cipher in blocks_cipher]
+        self.count_blocks('read', blocks_cipher, recursive_level)
+        with metrics.phase('decrypt', recursive_level):
+            blocks = self.decrypt_blocks(blocks_cipher)
+        with metrics.phase('stash_merge', recursive_level):
+            for block_plaintext, block_position in treetop.take_paths([position]) + blocks:
+                # skip dummy block
+                if block_plaintext.block_id == self.dummy_block_id:
+                    continue
+                # update stash
+                stash.put(block_plaintext, block_position)
+
+    # count bytes and blocks read or written (direction) if metrics are recorded
+    def count_blocks(self, direction, blocks_cipher, recursive_level):
+        if self.metrics.enabled:
+            self.metrics.count('bytes_' + direction, blocks_bytes(blocks_cipher), recursive_level)
+            self.metrics.count('blocks_' + direction, len(blocks_cipher), recursive_level)
+
+    def write_back_path(self, block_position, recursive_level, oram_server):
+        stash = self.stash[recursive_level]
+        treetop = self.treetop[recursive_level]
+        metrics = self.metrics
+        # select S'= min(blocks can be placed in bucket, Z) blocks to write for each level, removed from stash
+        # positions are kept in stash, no lookup in position oram is needed
+        with metrics.phase('eviction', recursive_level):
+            evict_blocks = stash.evict(block_position, self.Z)
+        for level in range(treetop.levels):
+            treetop.put(bucket_index(block_position, level, self.levels[recursive_level]), evict_blocks[level])
+        evict_blocks = evict_blocks[treetop.levels:]
+        blocks = []
+        for select_blocks in evict_blocks:
+            # padded S' with dummy blocks to size of Z
+            blocks.extend(select_blocks)
+            blocks.extend([None] * (self.Z - len(select_blocks)))
+        # encrypt whole path at once
+        with metrics.phase('encrypt', recursive_level):
+            blocks_cipher = self.encrypt_padded_blocks(blocks, recursive_level)
+        self.count_blocks('written', blocks_cipher, recursive_level)
+        buckets_cipher = [blocks_cipher[l * self.Z:(l + 1) * self.Z] for l in range(len(evict_blocks))]
+        # write back whole path in one call
+        with metrics.phase('write_back', recursive_level):
+            oram_server.write_path(block_position, buckets_cipher, recursive_level, treetop.levels)
+
+    # extra paths of stash policy of recursive level while its stash is larger than limit
+    def relieve_stash(self, recursive_level, oram_server):
+        if self.stash_policies is None:
+            return
+        policy = self.stash_policies[recursive_level]
+        stash = self.stash[recursive_level]
+        if not policy.exceeded(len(stash)):
+            return
+        for i in range(policy.max_rounds):
+            position = policy.next_position(self.levels[recursive_level])
+            self.read_path_to_stash(position, recursive_level, oram_server)
+            self.write_back_path(position, recursive_level, oram_server)
+            if not policy.exceeded(len(stash)):
+                return
+        policy.overflows += 1
+
+    # ops is a list of (op, block_id, block_data), op is 'read' or 'write'
+    # union of paths of all blocks is read in one call and written back in one call
+    # return data read for each op, a block accessed more than once is served from stash
+    def access_batch_recursively(self, ops, recursive_level, oram_server):
+        if recursive_level == 0:
+            for op, block_id, block_data in ops:
+                if op == 'write' and len(block_data) > self.blocks_size[0]:
+                    raise Exception("length of block data should be less than block size", "length of block data:",
+                                    len(block_data), "block size:", self.blocks_size[0])
+
+        self.start_access(recursive_level)
+        metrics = self.metrics
+        block_ids = list(dict.fromkeys(block_id for op, block_id, block_data in ops))
+        with metrics.phase('position_lookup', recursive_level):
+            block_positions = self.lookup_positions(block_ids, len(ops), recursive_level + 1, oram_server)
+        stash = self.stash[recursive_level]
+        # read a random path for each repeated block, so the server only sees the size of batch
+        leaf_nodes = pow(2, self.levels[recursive_level])
+        positions = [block_positions[block_id][0] for block_id in block_ids]
+        positions.extend(randrange(leaf_nodes) for i in range(len(ops) - len(block_ids)))
+
+        # read union of paths from server, buckets cached on client are not read
+        treetop = self.treetop[recursive_level]
+        with metrics.phase('path_read', recursive_level):
+            buckets_cipher = oram_server.read_paths(positions, recursive_level, treetop.levels)
+        blocks_cipher = [block_cipher for index in buckets_cipher for block_cipher in buckets_cipher[index]]
+        self.count_blocks('read', blocks_cipher, recursive_level)
+        with metrics.phase('decrypt', recursive_level):
+            blocks = self.decrypt_blocks(blocks_cipher)
+        with metrics.phase('stash_merge', recursive_level):
+            for block_plaintext, position in treetop.take_paths(positions) + blocks:
+                # skip dummy block
+                if block_plaintext.block_id == self.dummy_block_id:
+                    continue
+                stash.put(block_plaintext, position)
+        # move blocks to new position
+        for block_id in block_ids:
+            if block_id in stash:
+                stash.put(stash[block_id], block_positions[block_id][1])
+            elif recursive_level != 0:
+                # not first level, must exists
+                raise Exception("position must exists in position oram")
+
+        data_to_read = []
+        for op, block_id, block_data in ops:
+            if block_id not in stash:
+                data_to_read.append(None)
+            elif recursive_level == 0:  # only remove dummy for file blocks
+                data_to_read.append(self.remove_dummy_in_block(stash[block_id].data))
+            else:
+                data_to_read.append(stash[block_id].data)
+            if op == 'write':
+                if recursive_level == 0:  # only padding for file block
+                    block_data = block_data + (self.blocks_size[0] - len(block_data)) * self.block_dummy_symbol
+                stash.put(BlockPlaintext(block_id, block_data), block_positions[block_id][1])
+
+        with metrics.phase('eviction', recursive_level):
+            evict_buckets = stash.evict_paths(positions, self.Z)
+        indexes = []
+        for index in evict_buckets:
+            if treetop.caches(index):
+                treetop.put(index, evict_buckets[index])
+            else:
+                indexes.append(index)
+        blocks = []
+        for index in indexes:
+            # padded S' with dummy blocks to size of Z
+            blocks.extend(evict_buckets[index])
+            blocks.extend([None] * (self.Z - len(evict_buckets[index])))
+        # encrypt all buckets at once
+        with metrics.phase('encrypt', recursive_level):
+            blocks_cipher = self.encrypt_padded_blocks(blocks, recursive_level)
+        self.count_blocks('written', blocks_cipher, recursive_level)
+        buckets_cipher = dict()
+        for i, index in enumerate(indexes):
+            buckets_cipher[index] = blocks_cipher[i * self.Z:(i + 1) * self.Z]
+        with metrics.phase('write_back', recursive_level):
+            oram_server.write_buckets(buckets_cipher, recursive_level)
+        self.relieve_stash(recursive_level, oram_server)
+        self.finish_access(len(ops), recursive_level)
         return data_to_read
 
+    def access_batch(self, ops, oram_server):
+        return self.access_batch_recursively(ops, 0, oram_server)
+
+    def read_many(self, block_ids, oram_server):
+        return self.access_batch([('read', block_id, None) for block_id in block_ids], oram_server)
+
+    # items is a list of (block_id, block_data)
+    def write_many(self, items, oram_server):
+        return self.access_batch([('write', block_id, block_data) for block_id, block_data in items], oram_server)
+
+    # load blocks into a server created with empty storage,
+    # RecursivePathOramServer(None, shapes=client.bucket_shapes())
+    # items is an iterable of (block_id, block_data), read once, 0 <= block_id < 2^first_level
+    # blocks of each recursive level are placed in the deepest bucket with a free slot on the path to their position,
+    # then position blocks of next level are built from positions of this level, up to the position map on client
+    def bulk_load(self, items, oram_server, chunk_size=1024):
+        block_size = self.blocks_size[0]
+        leaf_nodes = pow(2, self.levels[0])
+        positions = [randrange(leaf_nodes) for block_id in range(leaf_nodes)]
+
+        def file_blocks():
+            for block_id, block_data in items:
+                if block_id < 0 or block_id >= leaf_nodes:
+                    raise Exception("block id out of range", "block id:", block_id, "blocks:", leaf_nodes)
+                if len(block_data) > block_size:
+                    raise Exception("length of block data should be less than block size", "length of block data:",
+                                    len(block_data), "block size:", block_size)
+                yield block_id, block_data + (block_size - len(block_data)) * self.block_dummy_symbol
+
+        self.bulk_load_level(file_blocks(), positions, 0, oram_server, chunk_size)
+        for i in range(1, self.recursive_level + 1):
+            previous_positions = positions
+            leaf_nodes = pow(2, self.levels[i])
+            positions = [randrange(leaf_nodes) for block_id in range(leaf_nodes)]
+            self.bulk_load_level(self.generate_position_blocks(previous_positions, leaf_nodes), positions, i,
+                                 oram_server, chunk_size)
+        self.position_map.fill(positions)
+
+    # position block j packs positions of blocks j * position_compress ... of previous level
+    def generate_position_blocks(self, previous_positions, leaf_nodes):
+        for j in range(leaf_nodes):
+            data = []
+            for block_id in range(j * self.position_compress, (j + 1) * self.position_compress):
+                data.append(previous_positions[block_id].to_bytes(self.position_size, byteorder='little'))
+            yield j, b''.join(data)
+
+    # items are (block_id, padded data), positions[block_id] is position of block
+    # buckets are written whole in order of index once every block of the level is placed (see BucketFiller)
+    def bulk_load_level(self, items, positions, recursive_level, oram_server, chunk_size):
+        filler = BucketFiller(self.levels[recursive_level], self.Z)
+        treetop = self.treetop[recursive_level]
+        for block_id, block_data in items:
+            block = (BlockPlaintext(block_id, block_data), positions[block_id])
+            index = filler.place(positions[block_id])
+            if index is None:
+                self.stash[recursive_level].put(*block)
+            elif treetop.caches(index):
+                treetop.append(index, *block)
+            else:
+                filler.put(index, block)
+
+        buckets = []
+        for bucket in filler.full_buckets(treetop.bucket_number):
+            buckets.append(bucket)
+            if len(buckets) * self.Z >= chunk_size:
+                self.write_loaded_buckets(buckets, recursive_level, oram_server)
+                buckets = []
+        self.write_loaded_buckets(buckets, recursive_level, oram_server)
+
+    # [(bucket_index, Z blocks)], None in blocks is a dummy block
+    def write_loaded_buckets(self, buckets, recursive_level, oram_server):
+        if not buckets:
+            return
+        blocks_cipher = self.encrypt_padded_blocks([block for index, blocks in buckets for block in blocks],
+                                                   recursive_level)
+        oram_server.write_buckets({index: blocks_cipher[i * self.Z:(i + 1) * self.Z]
+                                   for i, (index, blocks) in enumerate(buckets)}, recursive_level)
+
+    # (level, Z, cipher size, nonce size) of buckets of each recursive level on server
+    def bucket_shapes(self):
+        return [(self.levels[i], self.Z,
+                 self.block_id_size + self.position_size + len(self.dummy_blocks[i].data) + self.cipher.overhead,
+                 self.cipher.nonce_size) for i in range(self.recursive_level + 1)]
+
+    # stop refill threads of dummy pools and shut down workers of cipher
+    def close(self):
+        if self.dummy_pools is not None:
+            for dummy_pool in self.dummy_pools:
+                dummy_pool.close()
+        if hasattr(self.cipher, 'close'):
+            self.cipher.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # report of treetop cache of each recursive level, see TreetopCache.report
+    def treetop_report(self):
+        reports = []
+        for i, (level, Z, cipher_size, nonce_size) in enumerate(self.bucket_shapes()):
+            block_size = self.block_id_size + self.position_size + len(self.dummy_blocks[i].data)
+            reports.append(self.treetop[i].report(block_size, cipher_size + nonce_size))
+        return reports
+
     def remove_dummy_in_block(self, data):
+        if not self.unpad:
+            return data
         dummy_symbol = self.block_dummy_symbol
         dummy_symbol_value = dummy_symbol[0]
         first_dummy_index = bisect_left(data, dummy_symbol_value)
@@ -248,20 +675,44 @@ class RecursivePathOramClient:
         return self.access(op='write', block_id=block_id, block_data=block_data, recursive_level=recursive_level,
                            oram_server=oram_server)
 
-    def encrypt_block(self, block_plaintext):
-        cipher = AES.new(self.key, AES.MODE_EAX)
-        nonce = cipher.nonce
-        padded_block_id = block_plaintext.block_id.to_bytes(self.block_id_size, byteorder='little')
-        data = padded_block_id + block_plaintext.data
-        ciphertext = cipher.encrypt(data)
-        return BlockCipher(ciphertext, nonce)
+    def encrypt_block(self, block_plaintext, position):
+        return self.cipher.encrypt(self.pack_block(block_plaintext, position))
 
     def decrypt_block(self, block_cipher):
-        cipher = AES.new(self.key, AES.MODE_EAX, nonce=block_cipher.nonce)
-        plain_text = cipher.decrypt(block_cipher.cipher)
+        return self.unpack_block(self.cipher.decrypt(block_cipher))
+
+    # blocks is a list of (block plaintext, position)
+    def encrypt_blocks(self, blocks):
+        return self.cipher.encrypt_many([self.pack_block(block_plaintext, position)
+                                         for block_plaintext, position in blocks])
+
+    # return a list of (block plaintext, position)
+    def decrypt_blocks(self, blocks_cipher):
+        return [self.unpack_block(plain_text) for plain_text in self.cipher.decrypt_many(blocks_cipher)]
+
+    def encrypt_dummy_blocks(self, count, recursive_level):
+        return self.encrypt_blocks([(self.dummy_blocks[recursive_level], 0)] * count)
+
+    # None in blocks is a dummy block, taken from dummy pool of recursive level if there is one
+    def encrypt_padded_blocks(self, blocks, recursive_level):
+        if self.dummy_pools is None:
+            dummy = (self.dummy_blocks[recursive_level], 0)
+            return self.encrypt_blocks([dummy if block is None else block for block in blocks])
+        real_blocks_cipher = iter(self.encrypt_blocks([block for block in blocks if block is not None]))
+        dummy_blocks_cipher = iter(self.dummy_pools[recursive_level].take(sum(block is None for block in blocks)))
+        return [next(dummy_blocks_cipher) if block is None else next(real_blocks_cipher) for block in blocks]
+
+    def pack_block(self, block_plaintext, position):
+        padded_block_id = block_plaintext.block_id.to_bytes(self.block_id_size, byteorder='little')
+        padded_position = position.to_bytes(self.position_size, byteorder='little')
+        return padded_block_id + padded_position + block_plaintext.data
+
+    def unpack_block(self, plain_text):
         block_id = int.from_bytes(plain_text[:self.block_id_size], byteorder='little')
-        data = plain_text[self.block_id_size:]
-        return BlockPlaintext(block_id, data)
+        data_start = self.block_id_size + self.position_size
+        position = int.from_bytes(plain_text[self.block_id_size:data_start], byteorder='little')
+        data = plain_text[data_start:]
+        return BlockPlaintext(block_id, data), position
 
     def generate_initialize_block(self):
         oram_buckets = []
@@ -269,7 +720,9 @@ class RecursivePathOramClient:
         level = self.levels[0]
         block_size = self.blocks_size[0]
         total_bucket_number = pow(2, level + 1) - 1
-        blocks = [[self.generate_dummy_block_cipher(recursive_level=0)] * self.Z for i in range(total_bucket_number)]
+        # every slot is a distinct fresh dummy, so the server could not tell which slots are equal
+        blocks_cipher = self.encrypt_dummy_blocks(self.Z * total_bucket_number, 0)
+        blocks = [blocks_cipher[i * self.Z:(i + 1) * self.Z] for i in range(total_bucket_number)]
 
         buckets = []
         for i in range(len(blocks)):
@@ -286,24 +739,21 @@ class RecursivePathOramClient:
         level_buckets = []
         for i in range(1, self.recursive_level + 1):
             level = self.levels[i]
-            middle_buckets_blocks = [[self.generate_dummy_block_cipher(i)] * self.Z for k in
-                                     range(pow(2, level + 1) - 1)]
+            bucket_number = pow(2, level + 1) - 1
+            blocks_cipher = self.encrypt_dummy_blocks(self.Z * bucket_number, i)
+            middle_buckets_blocks = [blocks_cipher[k * self.Z:(k + 1) * self.Z] for k in range(bucket_number)]
             level = self.levels[i]
             leaf_nodes = pow(2, level)
             level_position_data = []
 
             previous_leaf_nodes = pow(2, self.levels[i - 1])
             for j in range(previous_leaf_nodes):
-                block_id = j.to_bytes(self.block_id_size, byteorder='little')
-                position = self.integer_to_position(j, i - 1).encode()
-                data = block_id + position
-                level_position_data.append(data)
+                level_position_data.append(j.to_bytes(self.position_size, byteorder='little'))
             level_position_blocks = []
             for j in range(0, leaf_nodes):
                 packed_data = b''.join(level_position_data[j * self.position_compress:(j + 1) * self.position_compress])
                 packed_block = BlockPlaintext(j, packed_data)
-                packed_block_cipher = self.encrypt_block(packed_block)
-                level_position_blocks.append(packed_block_cipher)
+                level_position_blocks.append(packed_block)
 
             leaf_nodes_index = range(leaf_nodes - 1, leaf_nodes * 2 - 1)
 
@@ -311,7 +761,11 @@ class RecursivePathOramClient:
                 raise Exception("unexpected wrong", len(leaf_nodes_index))
 
             for j, index in enumerate(leaf_nodes_index):
-                middle_buckets_blocks[index][0] = level_position_blocks[j]
+                # leaf bucket cached on client (tree of level not deeper than treetop), server keeps dummy
+                if self.treetop[i].caches(index):
+                    self.treetop[i].append(index, level_position_blocks[j], j)
+                else:
+                    middle_buckets_blocks[index][0] = self.encrypt_block(level_position_blocks[j], j)
 
             middle_buckets = []
             for j in range(pow(2, level + 1) - 1):
@@ -319,29 +773,10 @@ class RecursivePathOramClient:
             level_buckets.append(middle_buckets)
 
         # for last level
-        last_level = self.levels[-1]
-        last_level_leaf_nodes = pow(2, last_level)
-        for i in range(last_level_leaf_nodes):
-            self.position_map[i] = self.integer_to_position(i, self.recursive_level)
+        self.position_map.fill(range(pow(2, self.levels[-1])))
         return level_buckets
 
     def generate_dummy_block_cipher(self, recursive_level):
-        block_size = self.blocks_size[recursive_level]
-        dummy_block = self.block_dummy_symbol * block_size
-        dummy_block_id = int.from_bytes(dummy_block[:self.block_id_size], byteorder='little')
-        if recursive_level == 0:
-            dummy_data = dummy_block[self.block_id_size: block_size]
-            block_cipher = self.encrypt_block(
-                BlockPlaintext(dummy_block_id, dummy_data))
-        else:
-            block_cipher = self.encrypt_block(
-                BlockPlaintext(dummy_block_id, dummy_block * self.position_compress)
-            )
-        return block_cipher
-
-    # change loc from 0 - 2^ level - 1 to a binary position representation in a tree (e.g. '00101')
-    def integer_to_position(self, loc, recursive_level):
-        binary_loc = bin(loc)[2:]  # remove '0b' in binary
-        position_length = self.levels[recursive_level]
-        position = ('0' * position_length + binary_loc)[-position_length:]
-        return position
+        if self.dummy_pools is not None:
+            return self.dummy_pools[recursive_level].take(1)[0]
+        return self.encrypt_block(self.dummy_blocks[recursive_level], 0)
@@ -0,0 +1,303 @@
+from random import shuffle, choice
+from bisect import bisect_left
+from oram_tree import BlockPlaintext, Bucket, OramTree, PositionMap, Stash, bucket_index, reverse_lex_position
+from oram_cipher import DummyPool, create_cipher
+
+
+class RingOramServer:
+
+    # ring oram stores buckets in the same oram tree as path oram
+    # a bucket is (metadata, Z + S blocks), metadata is encrypted by client
+    # metadata records block_id, position and valid bit of every slot and access count of bucket
+    #
+    # server never sees metadata in plaintext, it reads metadata and blocks by (bucket_index, offset)
+    # chosen by client
+
+    def __init__(self, buckets, level):
+        self.level = level
+
+        total_bucket_number = pow(2, level + 1) - 1
+        if len(buckets) != total_bucket_number:
+            raise Exception("number of blocks should equal to total_bucket_number")
+        self.oram_tree = OramTree(buckets)
+
+    # return {bucket_index: metadata cipher}
+    def read_metadata(self, indexes):
+        self.check_indexes(indexes)
+        return {index: self.oram_tree.get_bucket(index)[0] for index in indexes}
+
+    # write {bucket_index: metadata cipher}, blocks of bucket unchanged
+    def write_metadata(self, metadata):
+        self.check_indexes(metadata)
+        for index in metadata:
+            self.oram_tree.put_bucket(index, [metadata[index]] + self.oram_tree.get_bucket(index)[1:])
+
+    # slots is a list of (bucket_index, offset), return block cipher of each slot
+    def read_blocks(self, slots):
+        self.check_indexes([index for index, offset in slots])
+        return [self.oram_tree.get_bucket(index)[offset + 1] for index, offset in slots]
+
+    # write {bucket_index: [metadata cipher] + blocks}
+    def write_buckets(self, buckets):
+        return self.oram_tree.write_buckets(buckets)
+
+    def check_indexes(self, indexes):
+        for index in indexes:
+            self.oram_tree.check_index(index)
+
+
+class BucketMetadata:
+    def __init__(self, count, block_ids, positions, valid):
+        self.count = count  # accesses to bucket since it was written
+        self.block_ids = block_ids  # block_id of each slot, dummy block id for dummy slot
+        self.positions = positions  # position of block in each slot
+        self.valid = valid  # whether block in slot has not been read yet
+
+    def find(self, block_id):
+        for offset, slot_block_id in enumerate(self.block_ids):
+            if slot_block_id == block_id and self.valid[offset]:
+                return offset
+        return None
+
+    def valid_slots(self, block_id):
+        return [offset for offset, slot_block_id in enumerate(self.block_ids)
+                if slot_block_id == block_id and self.valid[offset]]
+
+
+class RingOramClient:
+    key_size = 256
+    position_size = 4
+
+    # Z real blocks and S dummy blocks in a bucket
+    # an access reads metadata of the path and only one block from each bucket,
+    # a bucket is reshuffled after it is accessed S times
+    # every A accesses, a path is evicted in reverse lexicographic order
+    #
+    # cipher = block_id + data, as path oram
+    # cipher is 'eax', 'ctr', 'gcm' (see oram_cipher) or a cipher object, used for blocks and metadata
+    # dummy_pool_size: dummy blocks of reshuffled buckets are taken from a pool of fresh dummy ciphers,
+    # refilled by a thread if dummy_pool_background, stopped by close()
+    def __init__(self, level, Z=4, S=5, A=3, block_size=8192, block_id_size=32, cipher='eax', dummy_pool_size=0,
+                 dummy_pool_background=True):
+        self.Z = Z
+        self.S = S
+        self.A = A
+        self.level = level
+        self.block_size = block_size
+        self.block_id_size = block_id_size
+        self.total_bucket_number = pow(2, level + 1) - 1
+        self.block_dummy_symbol = b'\xff'
+        self.dummy_block_id = int.from_bytes(self.block_dummy_symbol * self.block_id_size, byteorder='little')
+        self.dummy_block = BlockPlaintext(self.dummy_block_id, self.block_dummy_symbol * self.block_size)
+
+        self.stash = Stash(level)  # {block_id: block plaintext)} indexed by position
+        self.position_map = PositionMap(pow(2, level), level)  # {block_id:  position}, random leaves
+
+        self.access_count = 0  # accesses since last eviction
+        self.eviction_count = 0  # number of evicted paths, decide next path to evict
+
+        # use AES for encryption
+        self.key = str.encode('1' * (self.key_size // 8))
+        self.cipher = create_cipher(cipher, self.key)
+        self.dummy_pool = None
+        if dummy_pool_size:
+            self.dummy_pool = DummyPool(self.encrypt_dummy_blocks, dummy_pool_size, dummy_pool_background)
+
+    def path_indexes(self, position):
+        return [bucket_index(position, level, self.level) for level in range(self.level + 1)]
+
+    def access(self, op, block_id, block_data, oram_server):
+        if op == 'write' and len(block_data) > self.block_size:
+            raise Exception("length of block data should be less than block size", "length of block data:",
+                            len(block_data), "block size:", self.block_size)
+
+        block_position, _ = self.position_map.remap(block_id)
+
+        # read one block from each bucket, the target block if it is in the bucket, otherwise a valid dummy
+        indexes = self.path_indexes(block_position)
+        metadata = self.read_metadata(indexes, oram_server)
+        slots = []
+        found_level = None
+        for level, index in enumerate(indexes):
+            bucket_metadata = metadata[index]
+            offset = bucket_metadata.find(block_id)
+            if offset is None:
+                offset = choice(bucket_metadata.valid_slots(self.dummy_block_id))
+            else:
+                found_level = level
+            bucket_metadata.valid[offset] = False
+            bucket_metadata.count += 1
+            slots.append((index, offset))
+        blocks_cipher = oram_server.read_blocks(slots)
+        oram_server.write_metadata({index: self.encrypt_metadata(metadata[index]) for index in indexes})
+
+        if found_level is not None:
+            self.stash.put(self.decrypt_block(blocks_cipher[found_level]), self.position_map[block_id])
+        elif block_id in self.stash:
+            # block may stay in stash from previous access, move it to new position
+            self.stash.put(self.stash[block_id], self.position_map[block_id])
+
+        if block_id not in self.stash:
+            # not write before
+            data_to_read = None
+        else:
+            data_to_read = self.remove_dummy_in_block(self.stash[block_id].data)
+        if op == 'write':
+            # pad block data to maximum block_size
+            block_data = block_data + (self.block_size - len(block_data)) * self.block_dummy_symbol
+            self.stash.put(BlockPlaintext(block_id, block_data), self.position_map[block_id])
+
+        self.access_count += 1
+        if self.access_count == self.A:
+            self.access_count = 0
+            self.evict_path(oram_server)
+
+        # reshuffle buckets accessed S times, so every bucket on path keeps a valid dummy for next access
+        metadata = self.read_metadata(indexes, oram_server)
+        reshuffle_levels = [level for level, index in enumerate(indexes) if metadata[index].count >= self.S]
+        if reshuffle_levels:
+            self.read_buckets_to_stash([indexes[level] for level in reshuffle_levels], metadata, oram_server)
+            self.write_buckets(block_position, reshuffle_levels, oram_server)
+
+        return data_to_read
+
+    # evict along paths in reverse lexicographic order of leaves
+    def evict_path(self, oram_server):
+        position = reverse_lex_position(self.eviction_count, self.level)
+        self.eviction_count = (self.eviction_count + 1) % pow(2, self.level)
+
+        indexes = self.path_indexes(position)
+        metadata = self.read_metadata(indexes, oram_server)
+        self.read_buckets_to_stash(indexes, metadata, oram_server)
+        self.write_buckets(position, range(self.level + 1), oram_server)
+
+    # read Z blocks from each bucket, all valid real blocks padded with valid dummies, put real blocks to stash
+    def read_buckets_to_stash(self, indexes, metadata, oram_server):
+        slots = []
+        real_slots = []
+        for index in indexes:
+            bucket_metadata = metadata[index]
+            dummy_offsets = bucket_metadata.valid_slots(self.dummy_block_id)
+            shuffle(dummy_offsets)
+            real_offsets = [offset for offset, block_id in enumerate(bucket_metadata.block_ids)
+                            if block_id != self.dummy_block_id and bucket_metadata.valid[offset]]
+            for offset in real_offsets:
+                real_slots.append(len(slots))
+                slots.append((index, offset))
+            for offset in dummy_offsets[:self.Z - len(real_offsets)]:
+                slots.append((index, offset))
+
+        blocks_cipher = oram_server.read_blocks(slots)
+        blocks_plaintext = self.decrypt_blocks([blocks_cipher[i] for i in real_slots])
+        for i, block_plaintext in zip(real_slots, blocks_plaintext):
+            index, offset = slots[i]
+            self.stash.put(block_plaintext, metadata[index].positions[offset])
+
+    # write buckets at levels on the path to position with blocks from stash
+    def write_buckets(self, position, levels, oram_server):
+        buckets_cipher = dict()
+        for level in sorted(levels, reverse=True):
+            select_blocks = self.stash.pop_bucket(position, level, self.Z)
+            buckets_cipher[bucket_index(position, level, self.level)] = self.generate_bucket_cipher(select_blocks)
+        oram_server.write_buckets(buckets_cipher)
+
+    # real blocks and fresh dummies in random slots, with fresh metadata
+    def generate_bucket_cipher(self, select_blocks):
+        blocks_cipher = self.encrypt_blocks([block for block, position in select_blocks])
+        slots = [(block_cipher, block.block_id, position)
+                 for block_cipher, (block, position) in zip(blocks_cipher, select_blocks)]
+        dummy_number = self.Z + self.S - len(slots)
+        if self.dummy_pool is None:
+            dummy_blocks_cipher = self.encrypt_dummy_blocks(dummy_number)
+        else:
+            dummy_blocks_cipher = self.dummy_pool.take(dummy_number)
+        slots.extend((block_cipher, self.dummy_block_id, 0) for block_cipher in dummy_blocks_cipher)
+        shuffle(slots)
+        bucket_metadata = BucketMetadata(0, [block_id for _, block_id, _ in slots],
+                                         [position for _, _, position in slots], [True] * len(slots))
+        return [self.encrypt_metadata(bucket_metadata)] + [block_cipher for block_cipher, _, _ in slots]
+
+    def read_metadata(self, indexes, oram_server):
+        metadata_cipher = oram_server.read_metadata(indexes)
+        return {index: self.decrypt_metadata(metadata_cipher[index]) for index in metadata_cipher}
+
+    # metadata = count + (block_id + position + valid) for every slot
+    def encrypt_metadata(self, bucket_metadata):
+        data = [bucket_metadata.count.to_bytes(4, byteorder='little')]
+        for i in range(len(bucket_metadata.block_ids)):
+            data.append(bucket_metadata.block_ids[i].to_bytes(self.block_id_size, byteorder='little'))
+            data.append(bucket_metadata.positions[i].to_bytes(self.position_size, byteorder='little'))
+            data.append(b'\x01' if bucket_metadata.valid[i] else b'\x00')
+        return self.cipher.encrypt(b''.join(data))
+
+    def decrypt_metadata(self, metadata_cipher):
+        data = self.cipher.decrypt(metadata_cipher)
+        count = int.from_bytes(data[:4], byteorder='little')
+        slot_size = self.block_id_size + self.position_size + 1
+        block_ids = []
+        positions = []
+        valid = []
+        for i in range(4, len(data), slot_size):
+            slot = data[i:i + slot_size]
+            block_ids.append(int.from_bytes(slot[:self.block_id_size], byteorder='little'))
+            positions.append(int.from_bytes(slot[self.block_id_size:slot_size - 1], byteorder='little'))
+            valid.append(slot[-1] == 1)
+        return BucketMetadata(count, block_ids, positions, valid)
+
+    def remove_dummy_in_block(self, data):
+        dummy_symbol = self.block_dummy_symbol
+        dummy_symbol_value = dummy_symbol[0]
+        first_dummy_index = bisect_left(data, dummy_symbol_value)
+        return data[:first_dummy_index]
+
+    # stop refill thread of dummy pool
+    def close(self):
+        if self.dummy_pool is not None:
+            self.dummy_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, block_id, oram_server):
+        return self.access(op='read', block_data=None, block_id=block_id, oram_server=oram_server)
+
+    def write(self, block_id, block_data, oram_server):
+        return self.access(op='write', block_id=block_id, block_data=block_data, oram_server=oram_server)
+
+    def encrypt_block(self, block_plaintext):
+        return self.cipher.encrypt(self.pack_block(block_plaintext))
+
+    def decrypt_block(self, block_cipher):
+        return self.unpack_block(self.cipher.decrypt(block_cipher))
+
+    def encrypt_blocks(self, blocks_plaintext):
+        return self.cipher.encrypt_many([self.pack_block(block_plaintext) for block_plaintext in blocks_plaintext])
+
+    def decrypt_blocks(self, blocks_cipher):
+        return [self.unpack_block(plain_text) for plain_text in self.cipher.decrypt_many(blocks_cipher)]
+
+    def encrypt_dummy_blocks(self, count):
+        return self.encrypt_blocks([self.dummy_block] * count)
+
+    def pack_block(self, block_plaintext):
+        padded_block_id = block_plaintext.block_id.to_bytes(self.block_id_size, byteorder='little')
+        return padded_block_id + block_plaintext.data
+
+    def unpack_block(self, plain_text):
+        block_id = int.from_bytes(plain_text[:self.block_id_size], byteorder='little')
+        data = plain_text[self.block_id_size:]
+        return BlockPlaintext(block_id, data)
+
+    def generate_initialize_block(self):
+        buckets = []
+        for i in range(self.total_bucket_number):
+            buckets.append(Bucket(self.generate_bucket_cipher([])))
+        return buckets
+
+    def generate_dummy_block_cipher(self):
+        if self.dummy_pool is not None:
+            return self.dummy_pool.take(1)[0]
+        return self.encrypt_block(self.dummy_block)
@@ -1,6 +1,8 @@
 from non_recursive_path_oram import PathOramClient, PathOramServer
 import os
 from math import log
+import tempfile
+import threading
 import time
 
 test_dataset = 'imdb/neg'
@@ -81,4 +83,109 @@ for content in contents:
         raise Exception("")
 end = time.time()
 print("second time of read all content", end-start, "s")
-print("second average time", (end-start)/len(contents), "s")
\ No newline at end of file
+print("second average time", (end-start)/len(contents), "s")
+
+# test bulk load into empty storage
+start = time.time()
+client = PathOramClient(level)
+server = PathOramServer(None, level, shape=client.bucket_shape())
+client.bulk_load(iter(contents), server)
+end = time.time()
+print("time of bulk load all content", end - start, "s")
+
+for content in contents:
+    block_id = content[0]
+    data = content[1]
+    read_data = client.read(block_id, server)
+    if data != read_data:
+        print("program error", "can not read bulk loaded data")
+        print("original data:\n", data)
+        print("data from oram:\n", read_data)
+        raise Exception("")
+print("read all bulk loaded content")
+
+
+# bulk load writes whole buckets in order of index, the same calls whatever blocks are loaded
+class RecordingServer:
+    def __init__(self, oram_server):
+        self.oram_server = oram_server
+        self.calls = []
+
+    def __getattr__(self, method):
+        def call(*args):
+            self.calls.append((method, list(args[0]) if method == 'write_buckets' else args))
+            return getattr(self.oram_server, method)(*args)
+
+        return call
+
+
+calls = []
+for items in (contents, contents[:3]):
+    client = PathOramClient(level, treetop_levels=2)
+    server = RecordingServer(PathOramServer(None, level, shape=client.bucket_shape()))
+    client.bulk_load(iter(items), server)
+    calls.append(server.calls)
+    if [index for method, indexes in server.calls for index in indexes] != list(range(3, pow(2, level + 1) - 1)):
+        raise Exception("bulk load does not write whole buckets in order of index", server.calls[:2])
+if calls[0] != calls[1]:
+    raise Exception("writes of bulk load depend on blocks loaded")
+try:
+    PathOramClient(level).bulk_load(iter([(pow(2, level), b'a')]), server)
+except Exception as e:
+    print("bulk load of block id out of range:", e.args[0])
+else:
+    raise Exception("block id out of range loaded")
+
+# blocks stored by a memory server are independent bytes, not views of the buffer of a batch encrypted at once
+client = PathOramClient(level, cipher='ctr')
+server = PathOramServer(client.generate_initialize_block(), level)
+client.write_many(contents[:64], server)
+for bucket in server.oram_tree.buckets:
+    for block in bucket.get():
+        if type(block.cipher) is not bytes:
+            raise Exception("stored block cipher is not bytes", type(block.cipher))
+print("stored blocks are independent bytes")
+
+# path read from a tree in a file as views of the mapped file, one view per bucket
+storage_path = os.path.join(tempfile.mkdtemp(), 'tree')
+client = PathOramClient(level, cipher='ctr')
+server = PathOramServer(None, level, 'mmap', storage_path, shape=client.bucket_shape())
+client.bulk_load(iter(contents), server)
+for position in range(0, pow(2, level), 7):
+    buffers = server.read_path_buffers(position)
+    blocks = server.read_path(position)
+    if [bytes(buffer) for buffer in buffers] != \
+            [b''.join(bytes(block.nonce) + bytes(block.cipher) for block in bucket) for bucket in blocks]:
+        raise Exception("path buffers differ from path blocks", position)
+try:
+    server.oram_tree.close()
+except Exception as e:
+    print("close with views held:", e.args[0])
+else:
+    raise Exception("file closed while views are held")
+del buffers
+server.oram_tree.close()
+print("read path buffers of mmap storage")
+
+# blocks of paths encrypted by a pool of worker processes, shut down when the client is closed
+with PathOramClient(level, cipher='ctr', crypto_workers=2, crypto_executor='process') as client:
+    server = PathOramServer(client.generate_initialize_block(), level)
+    client.write_many(contents[:64], server)
+    if client.read_many([block_id for block_id, data in contents[:64]], server) != \
+            [data for block_id, data in contents[:64]]:
+        raise Exception("can not read data written with worker processes")
+if client.cipher.pool is not None:
+    raise Exception("worker processes left after close")
+print("worker processes shut down")
+
+# pool created once when the client and the refill thread of a dummy pool ask for it at the same time
+client = PathOramClient(level, cipher='ctr', crypto_workers=2)
+pools = []
+threads = [threading.Thread(target=lambda: pools.append(client.cipher.get_pool())) for i in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+if len(set(map(id, pools))) != 1:
+    raise Exception("more than one pool of crypto workers created")
+client.close()
@@ -0,0 +1,58 @@
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from oram_file import OramFileStore
+import os
+import time
+
+test_dataset = 'imdb/neg'
+# files of any size are packed into blocks of block_size
+files_list = sorted(os.listdir(test_dataset))
+file_size = 500
+block_size = 4096
+level = 9
+
+contents = []
+for file_name in files_list[:file_size]:
+    f = open(os.path.join(test_dataset, file_name), 'rb')
+    contents.append((file_name, f.read()))
+    f.close()
+# binary data containing b'\xff' and a file larger than a block
+contents.append(('binary', bytes(range(256)) * 40))
+contents.append(('empty', b''))
+
+client = PathOramClient(level, block_size=block_size, unpad=False)
+server = PathOramServer(client.generate_initialize_block(), level)
+file_store = OramFileStore(client, server, block_size, pow(2, level))
+
+start = time.time()
+for file_name, data in contents:
+    file_store.put_file(file_name, data)
+end = time.time()
+print("files", len(contents), "blocks used", file_store.used_blocks())
+print("time of put all files", end - start, "s")
+
+
+def check_files(contents):
+    for file_name, data in contents:
+        read_data = file_store.get_file(file_name)
+        if data != read_data:
+            print("program error", "can not read file", file_name)
+            print("original data:\n", data)
+            print("data from oram:\n", read_data)
+            raise Exception("")
+
+
+start = time.time()
+check_files(contents)
+end = time.time()
+print("time of get all files", end - start, "s")
+
+# delete half of files and put them again with new content
+for file_name, data in contents[::2]:
+    file_store.delete_file(file_name)
+    if file_name in file_store:
+        raise Exception("file should be deleted", file_name)
+contents = contents[1::2] + [(file_name, data[::-1]) for file_name, data in contents[::2]]
+for file_name, data in contents[len(contents) // 2:]:
+    file_store.put_file(file_name, data)
+check_files(contents)
+print("blocks used after delete and put", file_store.used_blocks())
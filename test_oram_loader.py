@@ -0,0 +1,60 @@
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from oram_loader import StreamingLoader, iter_directory
+from itertools import islice
+import os
+import time
+
+test_dataset = 'imdb/neg'
+# files are read from directory while they are written, a file is split into blocks of block_size
+file_size = 500
+block_size = 1024
+level = 11
+
+client = PathOramClient(level, block_size=block_size, unpad=False)
+server = PathOramServer(client.generate_initialize_block(), level)
+loader = StreamingLoader(client, server, block_size, pow(2, level), batch_size=32)
+
+start = time.time()
+loader.load(islice(iter_directory(test_dataset), file_size))
+end = time.time()
+print("files", len(loader.manifest), "blocks", loader.next_block_id)
+print("time of load files", end - start, "s")
+
+
+def check_files(loader):
+    for file_name in loader.manifest:
+        f = open(os.path.join(test_dataset, file_name), 'rb')
+        data = f.read()
+        f.close()
+        read_data = loader.read_file(file_name)
+        if data != read_data:
+            print("program error", "can not read loaded file", file_name)
+            print("original data:\n", data)
+            print("data from oram:\n", read_data)
+            raise Exception("")
+
+
+start = time.time()
+check_files(loader)
+end = time.time()
+print("time of read all files", end - start, "s")
+
+# load the same files into empty storage with bulk load
+client = PathOramClient(level, block_size=block_size, unpad=False)
+server = PathOramServer(None, level, shape=client.bucket_shape())
+loader = StreamingLoader(client, server, block_size, pow(2, level))
+start = time.time()
+loader.bulk_load(islice(iter_directory(test_dataset), file_size))
+end = time.time()
+print("time of bulk load files", end - start, "s")
+check_files(loader)
+print("read all bulk loaded files")
+
+# binary files, b'\xff' inside and at the end of blocks, read back as they are
+binary_files = [('bin', bytes(range(256))), ('ff', b'\xff' * (block_size + 3)), ('empty', b''),
+                ('random', os.urandom(3 * block_size - 1))]
+loader.load(binary_files)
+for file_name, data in binary_files:
+    if loader.read_file(file_name) != data:
+        raise Exception("can not read binary file", file_name)
+print("read binary files")
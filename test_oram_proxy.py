@@ -0,0 +1,164 @@
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from recursive_path_oram import RecursivePathOramClient, RecursivePathOramServer
+from oram_proxy import OramProxy
+from random import randrange
+import asyncio
+import os
+import threading
+import time
+
+# test many threads sharing one oram client through oram proxy
+level = 7
+block_size = 1024
+thread_number = 8
+contents = [(i, os.urandom(randrange(1, block_size // 2)).replace(b'\xff', b'')) for i in range(pow(2, level))]
+
+
+def worker(proxy, items, errors):
+    for block_id, data in items:
+        proxy.write(block_id, data)
+    for block_id, data in items:
+        if proxy.read(block_id) != data:
+            errors.append(block_id)
+
+
+def run_threads(proxy):
+    errors = []
+    threads = [threading.Thread(target=worker, args=(proxy, contents[i::thread_number], errors))
+               for i in range(thread_number)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    end = time.time()
+    if errors:
+        print("program error", "can not read write data of blocks", errors)
+        raise Exception("")
+    print("throughput with", thread_number, "threads", 2 * len(contents) / (end - start), "accesses/s",
+          "batches", proxy.batches, "requests", proxy.request_count)
+
+
+# non recursive path oram
+client = PathOramClient(level, block_size=block_size)
+proxy = OramProxy(client, PathOramServer(client.generate_initialize_block(), level))
+run_threads(proxy)
+
+# requests for the same block in a batch are merged, each request sees the data at its place
+futures = [proxy.submit('write', 0, b'a'), proxy.submit('read', 0), proxy.submit('write', 0, b'b'),
+           proxy.submit('read', 0)]
+if [future.result() for future in futures][1:] != [b'a', b'a', b'b']:
+    raise Exception("merged requests error")
+print("merged requests", proxy.merged)
+
+
+async def read_all(proxy):
+    return await asyncio.gather(*[proxy.read_async(block_id) for block_id, data in contents[1:]])
+
+if asyncio.run(read_all(proxy)) != [data for block_id, data in contents[1:]]:
+    raise Exception("async read error")
+proxy.close()
+
+# single thread with a global lock, one access per request
+client = PathOramClient(level, block_size=block_size)
+server = PathOramServer(client.generate_initialize_block(), level)
+start = time.time()
+for block_id, data in contents:
+    client.write(block_id, data, server)
+for block_id, data in contents:
+    client.read(block_id, server)
+end = time.time()
+print("throughput of one access per request", 2 * len(contents) / (end - start), "accesses/s")
+
+# recursive path oram, batches padded to max_batch
+client = RecursivePathOramClient(level, block_size=block_size)
+proxy = OramProxy(client, RecursivePathOramServer(client.generate_initialize_block()), max_batch=16,
+                  pad_batches=True, block_number=pow(2, level))
+run_threads(proxy)
+proxy.close()
+
+# a failed write back fails the batch which queued it, later writes are dropped and every later call refused
+class FailingServer:
+    def __init__(self, oram_server):
+        self.oram_server = oram_server
+        self.fail = False
+        self.writes = 0
+
+    def __getattr__(self, method):
+        def call(*args):
+            if method.startswith('write'):
+                if self.fail:
+                    self.fail = False
+                    raise Exception("write back lost")
+                self.writes += 1
+            return getattr(self.oram_server, method)(*args)
+
+        return call
+
+
+client = PathOramClient(level, block_size=block_size)
+server = FailingServer(PathOramServer(client.generate_initialize_block(), level))
+proxy = OramProxy(client, server)
+proxy.write(1, b'a')
+server.fail = True
+writes = server.writes
+failed = proxy.submit('write', 2, b'b')
+try:
+    failed.result()
+except Exception as e:
+    print("batch of failed write back", e.args[0])
+else:
+    raise Exception("batch of a failed write back answered")
+for i in range(2):
+    try:
+        proxy.read(1)
+    except Exception as e:
+        print("next batch refused", e.args[0])
+    else:
+        raise Exception("batch after a failed write back not refused")
+if server.writes != writes:
+    raise Exception("writes applied after a failed write back")
+try:
+    proxy.close()
+except Exception as e:
+    print("close of failed proxy", e.args[0])
+
+
+# paths of a batch are read while the write back of the previous batch is in flight, buckets still queued are
+# taken from the queue
+class SlowWriteServer:
+    def __init__(self, oram_server):
+        self.oram_server = oram_server
+        self.writing = 0
+        self.overlapped_reads = 0
+
+    def __getattr__(self, method):
+        def call(*args):
+            if method.startswith('write'):
+                self.writing += 1
+                time.sleep(0.01)
+                result = getattr(self.oram_server, method)(*args)
+                self.writing -= 1
+                return result
+            if self.writing:
+                self.overlapped_reads += 1
+            return getattr(self.oram_server, method)(*args)
+
+        return call
+
+
+for create_client, create_server in ((lambda: PathOramClient(level, block_size=block_size),
+                                      lambda client: PathOramServer(client.generate_initialize_block(), level)),
+                                     (lambda: RecursivePathOramClient(level, block_size=block_size),
+                                      lambda client: RecursivePathOramServer(client.generate_initialize_block()))):
+    client = create_client()
+    server = SlowWriteServer(create_server(client))
+    proxy = OramProxy(client, server, max_batch=8)
+    futures = [proxy.submit('write', block_id, data) for block_id, data in contents]
+    futures.extend(proxy.submit('read', block_id) for block_id, data in contents)
+    if [future.result() for future in futures[len(contents):]] != [data for block_id, data in contents]:
+        raise Exception("read error with reads overlapped with write backs")
+    proxy.close()
+    print("reads overlapped with write backs", server.overlapped_reads)
+    if not server.overlapped_reads:
+        raise Exception("no read overlapped with a write back")
@@ -0,0 +1,97 @@
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from recursive_path_oram import RecursivePathOramClient, RecursivePathOramServer
+from oram_state import ClientStateLog, client_levels, load_client_state, pack_state, save_client_state
+from random import randrange
+import os
+import tempfile
+import time
+
+# test client state saved and restored with the server tree, by snapshot and by snapshot + log
+level = 8
+block_size = 512
+key = os.urandom(32)
+directory = tempfile.mkdtemp()
+state_path = os.path.join(directory, 'client_state')
+tree_path = os.path.join(directory, 'tree')
+
+
+def random_data():
+    return os.urandom(randrange(1, block_size // 2)).replace(b'\xff', b'')
+
+
+def check(client, oram_server, contents):
+    for block_id in range(pow(2, level)):
+        if client.read(block_id, oram_server) != contents.get(block_id):
+            print("program error", "can not read data of block", block_id, "after restore")
+            raise Exception("")
+
+
+def run(create_client, create_server, open_server):
+    contents = dict()
+    client = create_client()
+    oram_server = create_server(client)
+    for i in range(64):
+        block_id = randrange(pow(2, level))
+        contents[block_id] = random_data()
+        client.write(block_id, contents[block_id], oram_server)
+
+    # snapshot
+    start = time.time()
+    save_client_state(client, state_path, key)
+    oram_server.save(tree_path)
+    print("save state", time.time() - start, "s", os.path.getsize(state_path), "bytes")
+    restored_client = create_client()
+    start = time.time()
+    load_client_state(restored_client, state_path, key)
+    restored_server = open_server()
+    print("restore state", time.time() - start, "s")
+    check(restored_client, restored_server, contents)
+
+    # snapshot + log, last record cut by a crash
+    log = ClientStateLog(restored_client, state_path, key, compact_size=64 * 1024)
+    log.snapshot()
+    for i in range(256):
+        block_id = randrange(pow(2, level))
+        if randrange(2):
+            contents[block_id] = random_data()
+            restored_client.write(block_id, contents[block_id], restored_server)
+        elif restored_client.read(block_id, restored_server) != contents.get(block_id):
+            raise Exception("read error before restore")
+        log.append()
+    restored_server.save(tree_path)
+    # a record holds only changes, with nothing changed no stash or position cache block is written
+    stash_bytes = sum(len(stash[block_id].data) for stash, treetop, position_cache, stash_policy in client_levels(restored_client)
+                      for block_id in stash)
+    cache_bytes = sum(len(data) for stash, treetop, position_cache, stash_policy in client_levels(restored_client)
+                      if position_cache is not None for data in position_cache.blocks.values())
+    record_size = len(pack_state(restored_client, 0, False))
+    print("record without changes", record_size, "bytes, stash", stash_bytes, "bytes, position caches", cache_bytes,
+          "bytes")
+    if record_size > 256 + 4 * len(getattr(restored_client, 'drained_buckets', ())):
+        raise Exception("record holds blocks not changed")
+    log.log_file.write(b'\xff\x00\x00\x00cut')
+    log.close()
+    restored_client = create_client()
+    replayed = ClientStateLog(restored_client, state_path, key).restore()
+    print("log records replayed", replayed)
+    check(restored_client, open_server(), contents)
+
+
+run(lambda: PathOramClient(level, block_size=block_size, cipher='ctr', treetop_levels=2),
+    lambda client: PathOramServer(client.generate_initialize_block(), level),
+    lambda: PathOramServer(None, level, storage_path=tree_path))
+run(lambda: PathOramClient(level, block_size=block_size, eviction='background', eviction_period=2, cipher='gcm'),
+    lambda client: PathOramServer(client.generate_initialize_block(), level, 'mmap', tree_path + '.mmap'),
+    lambda: PathOramServer(None, level, 'mmap', tree_path))
+run(lambda: RecursivePathOramClient(level, position_compress=4, block_size=block_size, cipher='ctr',
+                                    position_cache_size=4, treetop_levels=1),
+    lambda client: RecursivePathOramServer(client.generate_initialize_block()),
+    lambda: RecursivePathOramServer(None, storage='contiguous', storage_path=tree_path))
+
+# a state encrypted under another key is refused
+try:
+    load_client_state(PathOramClient(level, block_size=block_size, cipher='ctr'), state_path, os.urandom(32))
+except Exception as e:
+    print("wrong key", e.args[0])
+else:
+    raise Exception("state loaded with a wrong key")
@@ -0,0 +1,71 @@
+from non_recursive_path_oram import PathOramClient, PathOramServer
+from recursive_path_oram import RecursivePathOramClient, RecursivePathOramServer
+from oram_transport import OramTransportServer, OramServerProxy
+from random import randrange
+import os
+import time
+
+# test oram client against oram server on localhost through asyncio transport
+level = 7
+block_size = 1024
+contents = [(i, os.urandom(randrange(1, block_size // 2)).replace(b'\xff', b'')) for i in range(pow(2, level))]
+
+# non recursive path oram
+client = PathOramClient(level, block_size=block_size)
+transport_server = OramTransportServer(PathOramServer(client.generate_initialize_block(), level))
+host, port = transport_server.start_in_thread()
+server = OramServerProxy(host, port)
+print("path oram server listen on", host, port)
+
+start = time.time()
+for block_id, data in contents:
+    client.write(block_id, data, server)
+end = time.time()
+print("average of write time", (end - start) / len(contents), "s")
+
+start = time.time()
+for block_id, data in contents:
+    read_data = client.read(block_id, server)
+    if data != read_data:
+        print("program error", "can not read write data")
+        raise Exception("")
+end = time.time()
+print("average of read time", (end - start) / len(contents), "s")
+print("throughput", len(contents) / (end - start), "accesses/s")
+
+start = time.time()
+read_data = client.read_many([block_id for block_id, data in contents], server)
+if read_data != [data for block_id, data in contents]:
+    raise Exception("batch read error")
+print("batch read time", time.time() - start, "s")
+
+# ciphers stored by server are copied out of request frames, not views keeping whole frames alive
+stored = [block_cipher for index in range(transport_server.oram_server.oram_tree.bucket_number)
+          for block_cipher in transport_server.oram_server.oram_tree.get_bucket(index)]
+if any(not isinstance(block_cipher.cipher, bytes) or not isinstance(block_cipher.nonce, bytes)
+       for block_cipher in stored):
+    raise Exception("stored cipher is a view of a request frame")
+
+server.close()
+transport_server.stop()
+
+# recursive path oram
+client = RecursivePathOramClient(level, block_size=block_size)
+transport_server = OramTransportServer(RecursivePathOramServer(client.generate_initialize_block()))
+host, port = transport_server.start_in_thread()
+server = OramServerProxy(host, port)
+print("recursive path oram server listen on", host, port)
+
+start = time.time()
+for block_id, data in contents[:20]:
+    client.write(block_id, data, server)
+for block_id, data in contents[:20]:
+    read_data = client.read(block_id, server)
+    if data != read_data:
+        print("program error", "can not read write data")
+        raise Exception("")
+end = time.time()
+print("average of access time", (end - start) / 40, "s")
+
+server.close()
+transport_server.stop()
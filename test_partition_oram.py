@@ -0,0 +1,81 @@
+from partition_oram import PartitionOramClient, ShardProcesses
+from random import randrange
+import os
+import time
+
+# test partition oram over shards in this process and in separate processes
+level = 8
+partitions = 4
+block_size = 1024
+contents = [(i, os.urandom(randrange(1, block_size // 2)).replace(b'\xff', b'')) for i in range(pow(2, level))]
+
+
+def check(client, servers):
+    start = time.time()
+    for block_id, data in contents[:64]:
+        client.write(block_id, data, servers)
+    end = time.time()
+    print("average of write time", (end - start) / 64, "s")
+
+    start = time.time()
+    for block_id, data in contents[:64]:
+        read_data = client.read(block_id, servers)
+        if data != read_data:
+            print("program error", "can not read write data")
+            raise Exception("")
+    end = time.time()
+    print("average of read time", (end - start) / 64, "s")
+
+    start = time.time()
+    client.write_many(contents, servers)
+    if client.read_many([block_id for block_id, data in contents], servers) != [data for block_id, data in contents]:
+        raise Exception("batch read error")
+    print("batch write and read time", time.time() - start, "s")
+    print("blocks in partitions", [len(client.free_ids[i]) for i in range(partitions)], "free local ids")
+
+
+# shards in this process
+client = PartitionOramClient(level, partitions, block_size=block_size)
+print("level of partitions", client.partition_level)
+check(client, client.create_servers())
+client.close()
+
+
+
+# after the read of an access every partition is accessed once, whatever block is accessed, blocks wait in eviction
+# caches on client instead of being written to a partition the server could link to their next read
+class CountingServer:
+    def __init__(self, oram_server):
+        self.oram_server = oram_server
+        self.reads = 0
+
+    def __getattr__(self, method):
+        if method.startswith('read'):
+            self.reads += 1
+        return getattr(self.oram_server, method)
+
+
+client = PartitionOramClient(level, partitions, block_size=block_size)
+servers = [CountingServer(server) for server in client.create_servers()]
+for block_id, data in contents[:64]:
+    reads = [server.reads for server in servers]
+    client.write(block_id, data, servers)
+    accessed = [server.reads - count for server, count in zip(servers, reads)]
+    if sorted(accessed) != [1] * (partitions - 1) + [2]:
+        raise Exception("partitions accessed depend on the block", accessed)
+for block_id, data in contents[:64]:
+    if client.read(block_id, servers) != data:
+        raise Exception("can not read block from eviction cache or partition")
+print("blocks in eviction caches", client.cached_blocks())
+client.close()
+
+# shards in separate processes, accessed in parallel
+client = PartitionOramClient(level, partitions, workers=partitions, block_size=block_size)
+shards = ShardProcesses(client.partition_shapes())
+client.bulk_load(iter(contents[64:]), shards.servers)
+for block_id, data in contents[64:96]:
+    if client.read(block_id, shards.servers) != data:
+        raise Exception("bulk load error")
+check(client, shards.servers)
+shards.close()
+client.close()
@@ -83,4 +83,35 @@ print("average time", (end-start)/test_num, "s")
 #         raise Exception("")
 # end = time.time()
 # print("second time of read all content", end-start, "s")
-# print("second average time", (end-start)/len(contents), "s")
\ No newline at end of file
+# print("second average time", (end-start)/len(contents), "s")
+
+# test bulk load into empty storage
+start = time.time()
+client = RecursivePathOramClient(level)
+server = RecursivePathOramServer(None, shapes=client.bucket_shapes())
+client.bulk_load(iter(contents), server)
+end = time.time()
+print("time of bulk load all content", end - start, "s")
+
+for i, content in enumerate(contents[:test_num]):
+    block_id = content[0]
+    data = content[1]
+    read_data = client.read(block_id, server)
+    if data != read_data:
+        print("fail at", i, "th", "read of bulk loaded content")
+        print("original data:\n", data)
+        print("data from oram:\n", read_data)
+        raise Exception("")
+print("read bulk loaded content")
+
+# dummy pools of every recursive level refilled by threads, stopped when the client is closed
+with RecursivePathOramClient(level, cipher='ctr', dummy_pool_size=16) as client:
+    server = RecursivePathOramServer(client.generate_initialize_block())
+    for block_id, data in contents[:test_num]:
+        client.write(block_id, data, server)
+    for block_id, data in contents[:test_num]:
+        if client.read(block_id, server) != data:
+            raise Exception("can not read data written with dummy pools")
+if any(dummy_pool.thread.is_alive() for dummy_pool in client.dummy_pools):
+    raise Exception("refill threads left after close")
+print("refill threads of", len(client.dummy_pools), "dummy pools stopped")